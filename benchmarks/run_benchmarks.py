@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite, on synthetic MARS day files (see synthetic_tree.py) and with
+a stub model (see stub_model.py), so it runs anywhere, with no TensorFlow.
+
+For each benchmark, reports the seconds of audio processed per wall second
+and the peak RSS (each benchmark runs in its own process), and compares them
+with the stored baseline, exiting with status 1 if any of them regressed by
+more than the tolerance.
+
+Example:
+  uv run benchmarks/run_benchmarks.py
+  uv run benchmarks/run_benchmarks.py chunked_inference end_to_end
+  uv run benchmarks/run_benchmarks.py --update-baseline
+
+Note that the baseline is machine dependent; update it (on the machine where
+the benchmarks are run) when a change in the numbers is expected.
+"""
+
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, RawTextHelpFormatter
+from collections.abc import Callable
+from contextlib import redirect_stdout
+
+import numpy as np
+from stub_model import StubModelHelper
+from synthetic_tree import make_day_tree
+
+from hwsd.file_helper import DAY_SECONDS, FileHelper
+
+BASELINE_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Days in the synthetic trees; the end-to-end benchmark scores the middle one.
+DAYS = [(2016, 11, 1), (2016, 11, 2), (2016, 11, 3)]
+
+
+def bench_load_segment_10khz(work_dir: str, hours: int) -> float:
+    file_helper = FileHelper(f"{work_dir}/decimated_10kHz", f"{work_dir}/Scores")
+    file_helper.select_day(*DAYS[1])
+    _, seconds = file_helper.load_audio_segment(hours=hours)
+    return seconds
+
+
+def bench_load_segment_16khz(work_dir: str, hours: int) -> float:
+    file_helper = FileHelper(f"{work_dir}/decimated_16kHz", f"{work_dir}/Scores")
+    file_helper.select_day(*DAYS[1])
+    _, seconds = file_helper.load_audio_segment(hours=hours)
+    return seconds
+
+
+def bench_score_io(work_dir: str, hours: int) -> float:
+    """Loads and saves complete day score files, and updates them in place per 10-min chunk."""
+    file_helper = FileHelper(f"{work_dir}/decimated_10kHz", f"{work_dir}/Scores-io")
+    repeats = 10
+    for _ in range(repeats):
+        file_helper.select_day(*DAYS[1])
+        file_helper.save_day_scores(file_helper.load_day_scores())
+        day_scores = file_helper.open_day_scores()
+        for start in range(0, DAY_SECONDS, 600):
+            day_scores[start : start + 600] = 0.5
+            day_scores.flush()
+        del day_scores
+    return repeats * 2 * DAY_SECONDS
+
+
+def bench_chunked_inference(work_dir: str, hours: int) -> float:
+    from hwsd.apply_model_day import apply_model_day
+
+    apply_model_day(
+        FileHelper(f"{work_dir}/decimated_10kHz", f"{work_dir}/Scores-chunked"),
+        StubModelHelper(),
+        *DAYS[1],
+        hours=hours,
+        model_minutes=10,
+        pipelined=True,
+        overlap=True,
+        checkpoint=True,
+    )
+    return hours * 3600
+
+
+def bench_plotting(work_dir: str, hours: int) -> float:
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from hwsd.plot_scores_day import plot_segment
+
+    file_helper = FileHelper(f"{work_dir}/decimated_10kHz", f"{work_dir}/Scores-plot")
+    file_helper.select_day(*DAYS[1])
+    day_scores = np.linspace(0, 1, DAY_SECONDS)
+    file_helper.save_day_scores(day_scores)
+    plot_segment(file_helper, *DAYS[1], hours=hours)
+    return hours * 3600
+
+
+def bench_end_to_end(work_dir: str, hours: int) -> float:
+    """As the daily job: apply_model.py on a 16 kHz day, with its settings."""
+    from hwsd import apply_model
+
+    result = apply_model.process_day(
+        StubModelHelper(),
+        *DAYS[1],
+        audio_base_dir=f"{work_dir}/decimated_16kHz",
+        force=True,
+        score_base_dir=f"{work_dir}/Scores-e2e",
+    )
+    assert result.status == "ok", result
+    return hours * 3600
+
+
+BENCHMARKS: dict[str, Callable[[str, int], float]] = {
+    "load_segment_10kHz": bench_load_segment_10khz,
+    "load_segment_16kHz": bench_load_segment_16khz,
+    "score_io": bench_score_io,
+    "chunked_inference": bench_chunked_inference,
+    "plotting": bench_plotting,
+    "end_to_end": bench_end_to_end,
+}
+
+
+def _run_in_child(name: str, work_dir: str, hours: int, results: multiprocessing.Queue) -> None:
+    # Only the summary goes to stdout:
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        started = time.time()
+        audio_seconds = BENCHMARKS[name](work_dir, hours)
+        wall_seconds = time.time() - started
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    results.put(
+        {
+            "audio_seconds": audio_seconds,
+            "wall_seconds": round(wall_seconds, 3),
+            "audio_seconds_per_second": round(audio_seconds / wall_seconds, 1),
+            "peak_rss_mb": round(peak_rss_mb, 1),
+        }
+    )
+
+
+def _run_in_fresh_process(target: Callable, *args) -> None:
+    # Note that the peak RSS is inherited by spawned processes, so anything
+    # memory intensive is also done in a separate process.
+    process = multiprocessing.get_context("spawn").Process(target=target, args=args)
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"{target.__name__}{args[:1]} failed with exit code {process.exitcode}")
+
+
+def run_benchmark(name: str, work_dir: str, hours: int) -> dict:
+    """Runs the given benchmark in a fresh process, so its peak RSS is its own."""
+    results = multiprocessing.get_context("spawn").Queue()
+    _run_in_fresh_process(_run_in_child, name, work_dir, hours, results)
+    return results.get()
+
+
+def find_regressions(results: dict[str, dict], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    """Descriptions of the results worse than the baseline by more than the tolerance."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]
+        throughput_limit = expected["audio_seconds_per_second"] * (1 - tolerance)
+        if result["audio_seconds_per_second"] < throughput_limit:
+            regressions.append(
+                f"{name}: {result['audio_seconds_per_second']:,.1f} audio-s/s"
+                f" < {throughput_limit:,.1f} (baseline {expected['audio_seconds_per_second']:,.1f})"
+            )
+        rss_limit = expected["peak_rss_mb"] * (1 + tolerance)
+        if result["peak_rss_mb"] > rss_limit:
+            regressions.append(
+                f"{name}: peak RSS {result['peak_rss_mb']:,.1f} MB"
+                f" > {rss_limit:,.1f} (baseline {expected['peak_rss_mb']:,.1f})"
+            )
+    return regressions
+
+
+def run_benchmarks(
+    names: list[str],
+    work_dir: str,
+    hours: int,
+    tolerance: float,
+    update_baseline: bool,
+) -> bool:
+    """
+    :return:  True only if there are no regressions.
+    """
+    print(f"==> Synthetic day files ({hours} hours each) under {work_dir}")
+    for rate_tag in ("10kHz", "16kHz"):
+        _run_in_fresh_process(make_day_tree, f"{work_dir}/decimated_{rate_tag}", DAYS, hours * 3600)
+
+    baseline: dict[str, dict] = {}
+    if os.path.isfile(BASELINE_FILENAME):
+        with open(BASELINE_FILENAME) as f:
+            baseline = json.load(f)
+
+    print(f"\n==> Running {len(names)} benchmarks")
+    print(f"    {'benchmark':<20} {'audio-s':>10} {'wall-s':>8} {'audio-s/s':>12} {'peak RSS':>10}  vs baseline")
+    results: dict[str, dict] = {}
+    for name in names:
+        result = results[name] = run_benchmark(name, work_dir, hours)
+        line = f"    {name:<20} {result['audio_seconds']:10,.0f} {result['wall_seconds']:8.2f}"
+        line += f" {result['audio_seconds_per_second']:12,.0f} {result['peak_rss_mb']:7,.1f} MB"
+        if name in baseline:
+            line += f"  x{result['audio_seconds_per_second'] / baseline[name]['audio_seconds_per_second']:.2f}"
+        print(line)
+
+    if update_baseline:
+        baseline.update(results)
+        with open(BASELINE_FILENAME, "w") as f:
+            json.dump(baseline, f, indent=2)
+            f.write("\n")
+        print(f"\n==> Baseline updated: {BASELINE_FILENAME}")
+        return True
+
+    regressions = find_regressions(results, baseline, tolerance)
+    if regressions:
+        print(f"\n==> {len(regressions)} regressions (tolerance {tolerance:.0%}):")
+        for regression in regressions:
+            print(f"    {regression}")
+        return False
+    print(f"\n==> No regressions (tolerance {tolerance:.0%})")
+    return True
+
+
+def parse_arguments():
+    description = "Runs the benchmarks, comparing with the stored baseline."
+    parser = ArgumentParser(description=description, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "names",
+        nargs="*",
+        metavar="benchmark",
+        default=list(BENCHMARKS),
+        help=f"Benchmarks to run. Default: all, that is, {' '.join(BENCHMARKS)}.",
+    )
+    parser.add_argument(
+        "--work-dir",
+        type=str,
+        default=None,
+        metavar="dir",
+        help="Directory for the synthetic audio and score files, reused if already there.\n"
+        "Default: a temporary directory.",
+    )
+    parser.add_argument(
+        "--hours",
+        type=int,
+        default=2,
+        metavar="h",
+        help="Duration of the synthetic day files in hours. Default: 2.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        metavar="f",
+        help="Relative throughput decrease or peak RSS increase considered a regression. Default: 0.25.",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        default=False,
+        help="Store the results as the new baseline, instead of comparing with it.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opts = parse_arguments()
+    unknown = [name for name in opts.names if name not in BENCHMARKS]
+    if unknown:
+        sys.exit(f"Unknown benchmarks: {unknown}")
+    if opts.work_dir is not None:
+        ok = run_benchmarks(opts.names, opts.work_dir, opts.hours, opts.tolerance, opts.update_baseline)
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            ok = run_benchmarks(opts.names, tmp_dir, opts.hours, opts.tolerance, opts.update_baseline)
+    sys.exit(0 if ok else 1)
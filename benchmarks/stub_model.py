@@ -0,0 +1,50 @@
+"""
+TF-free stand-in for the model, for benchmarking the rest of the pipeline.
+"""
+
+import time
+
+import numpy as np
+
+from hwsd.model_helper import SAMPLE_RATE, ModelHelper
+
+# Wall time per second of scored audio, roughly that of the actual model on CPU.
+DEFAULT_COST_PER_SECOND = 0.002
+
+
+class StubModelHelper(ModelHelper):
+    """
+    Deterministic scores (the mean energy over the model's context around
+    each second, squashed to [0, 1]), taking `cost_per_second` of wall time per
+    second of audio. The cost is spent sleeping, so, as with the actual model,
+    the GIL is released meanwhile.
+    """
+
+    def __init__(self, cost_per_second: float = DEFAULT_COST_PER_SECOND):
+        super().__init__()
+        self.cost_per_second: float = cost_per_second
+
+    def load_model(
+        self,
+        intra_op_threads: int | None = None,
+        inter_op_threads: int | None = None,
+        xla: bool = False,
+        onednn: bool | None = None,
+    ) -> None:
+        pass
+
+    def fingerprint(self) -> str | None:
+        return "stub"
+
+    def apply_model(self, psound: np.ndarray) -> np.ndarray:
+        seconds = -(-len(psound) // SAMPLE_RATE)
+        padded = np.zeros(seconds * SAMPLE_RATE, dtype=np.float32)
+        padded[: len(psound)] = psound
+        energy = np.square(padded).reshape(seconds, SAMPLE_RATE).sum(axis=1)
+        window = np.ones(2 * self.context_seconds - 1)
+        context_energy = np.convolve(energy, window, mode="same") / len(window)
+        time.sleep(self.cost_per_second * seconds)
+        return np.tanh(context_energy / 1_000).astype(np.float32)
+
+    def apply_model_batch(self, psounds: list[np.ndarray]) -> list[np.ndarray]:
+        return [self.apply_model(psound) for psound in psounds]
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Generates synthetic MARS day files, for benchmarking without access to the
+actual audio archive.
+
+The files follow the layout expected by FileHelper,
+`{audio_base_dir}/YYYY/MM/MARS-YYYYMMDDT000000Z-{10kHz|16kHz}.wav`,
+with deterministic content: background noise plus periodic tonal sweeps
+in the humpback song band.
+
+Example:
+  uv run benchmarks/synthetic_tree.py /tmp/bench/decimated_16kHz 2016/11/1-3 --hours 2
+"""
+
+import os
+from argparse import ArgumentParser, RawTextHelpFormatter
+
+import numpy as np
+import soundfile as sf
+
+from hwsd.file_helper import AUDIO_RATES, DAY_SECONDS
+from hwsd.misc import parse_days
+
+# Seconds of audio generated and written at a time.
+BLOCK_SECONDS = 600
+
+
+def get_day_filename(audio_base_dir: str, year: int, month: int, day: int) -> str:
+    rate_tag = os.path.basename(audio_base_dir.rstrip("/"))[-5:]
+    assert rate_tag in AUDIO_RATES, f"audio_base_dir expected to end with one of {list(AUDIO_RATES)}"
+    return f"{audio_base_dir}/{year:04}/{month:02}/MARS-{year:04}{month:02}{day:02}T000000Z-{rate_tag}.wav"
+
+
+def write_day_file(filename: str, sample_rate: int, seconds: int, seed: int = 0) -> None:
+    """
+    Writes a synthetic audio file of the given duration, one block at a time.
+    The content only depends on `seed`, and on the position in the file.
+    """
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    rng = np.random.default_rng(seed)
+    with sf.SoundFile(filename, "w", samplerate=sample_rate, channels=1, subtype="PCM_24") as sound_file:
+        for block_start in range(0, seconds, BLOCK_SECONDS):
+            block_seconds = min(BLOCK_SECONDS, seconds - block_start)
+            t = block_start + np.arange(block_seconds * sample_rate) / sample_rate
+            noise = 0.01 * rng.standard_normal(len(t))
+            # 2-s sweeps from 300 to 600 Hz every 10 s, louder every other minute:
+            phase_in_unit = t % 10
+            sweep = np.sin(2 * np.pi * (300 + 75 * phase_in_unit) * phase_in_unit) * (phase_in_unit < 2)
+            loudness = np.where((t // 60) % 2 == 0, 0.05, 0.005)
+            sound_file.write((noise + loudness * sweep).astype(np.float32))
+
+
+def make_day_tree(
+    audio_base_dir: str,
+    years_months_days: list[tuple[int, int, int]],
+    seconds: int = DAY_SECONDS,
+) -> list[str]:
+    """
+    Generates the day files for the given days (at the rate indicated by
+    the audio base directory), unless already there.
+
+    :return:  The day filenames.
+    """
+    sample_rate = AUDIO_RATES[os.path.basename(audio_base_dir.rstrip("/"))[-5:]]
+    filenames = []
+    for i, (year, month, day) in enumerate(years_months_days):
+        filename = get_day_filename(audio_base_dir, year, month, day)
+        if not os.path.isfile(filename) or sf.info(filename).frames != seconds * sample_rate:
+            print(f"    generating {filename} ({seconds:,}s)")
+            write_day_file(filename, sample_rate, seconds, seed=i)
+        filenames.append(filename)
+    return filenames
+
+
+def parse_arguments():
+    description = "Generates synthetic MARS day files."
+    parser = ArgumentParser(description=description, formatter_class=RawTextHelpFormatter)
+    parser.add_argument("audio_base_dir", type=str, help="Audio base directory, ending with 10kHz or 16kHz.")
+    parser.add_argument(
+        "intervals",
+        nargs="+",
+        metavar="time-interval",
+        help="Days to generate, as in hwsd/apply_model.py.",
+    )
+    parser.add_argument(
+        "--hours",
+        type=float,
+        default=24,
+        metavar="h",
+        help="Duration of each file in hours. Default: 24.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opts = parse_arguments()
+    make_day_tree(opts.audio_base_dir, parse_days(*opts.intervals), int(opts.hours * 3600))
@@ -3,7 +3,13 @@
 # Script intended to be run on `gizo` via crontab:
 #  0 3 * * * /opt/humpback/humpback-whale-song-detection/daily_cronjob.sh
 
-# This script is used to:
+# This script is used to apply the Google/NOAA humpback whale song detection model
+# on the previous day's 16kHz audio file, which is resampled to 10kHz in-process.
+# Set HWSD_RESAMPLE_CACHE (and HWSD_RESAMPLE_CACHE_GB) to also keep the resampled day
+# in a size-bounded cache (see hwsd/resample_cache.py), so re-scoring or re-plotting
+# a recent day doesn't resample it again.
+#
+# Set USE_SOX_INTERMEDIATE=1 to instead use the previous procedure:
 # - Resample previous day's 16kHz audio file to 10kHz
 # - Apply Google/NOAA humpback whale song detection model
 # - Clean up the resampled 10kHz file
@@ -16,9 +22,13 @@ cd -P -- "$(dirname -- "${BASH_SOURCE[0]}")"
 # Capture start time
 start_time=$SECONDS
 
+AUDIO_BASE_DIR_16kHz="/mnt/PAM_Analysis/decimated_16kHz"
 AUDIO_BASE_DIR_10kHz="/mnt/PAM_Analysis/GoogleHumpbackModel/decimated_10kHz"
+USE_SOX_INTERMEDIATE=${USE_SOX_INTERMEDIATE:-0}
 
 LOG_FILE="/mnt/PAM_Analysis/GoogleHumpbackModel/daily_cronjob.log"
+# JSON lines metrics and Prometheus textfile (hwsd.prom), see hwsd/metrics.py:
+METRICS_DIR="/mnt/PAM_Analysis/GoogleHumpbackModel/metrics"
 
 # Get $year $month $day from previous day's date
 prev_date=$(date -d 'yesterday' '+%Y %m %d')
@@ -37,23 +47,32 @@ printf "=== [%s]: Processing: %04d-%02d-%02d\n" \
        "$(date '+%Y-%m-%d %H:%M:%S')" \
        "$year" "$month" "$day"
 
-# Resample the 16kHz audio file to 10kHz
-echo "Resampling audio file..."
-./resample_sox.sh "$year" "$month" "$day" 2> >(grep -v '^sox WARN' >&2)
-
-# Apply the humpback whale song detection model
-echo -e "\nApplying humpback whale song detection model..."
-uv run python3 -u hwsd/apply_model.py "$year/$month/$day" > "logs/nohup-$year-$month-$day.out" 2>&1
-
-# Remove the resampled 10kHz file
-echo "Cleaning up resampled file..."
-decimated_file=$(printf "%s/%04d/%02d/MARS-%04d%02d%02dT000000Z-10kHz.wav" \
-     "$AUDIO_BASE_DIR_10kHz" "$year" "$month" "$year" "$month" "$day")
-if [[ -f "$decimated_file" ]]; then
-  rm "$decimated_file"
-  echo "Removed: $decimated_file"
+if [[ "$USE_SOX_INTERMEDIATE" != "1" ]]; then
+  # Apply the humpback whale song detection model directly on the 16kHz audio file
+  echo -e "\nApplying humpback whale song detection model..."
+  uv run python3 -u hwsd/apply_model.py --audio-base-dir "$AUDIO_BASE_DIR_16kHz" --metrics-dir "$METRICS_DIR" \
+      "$year/$month/$day" \
+      > "logs/nohup-$year-$month-$day.out" 2>&1
 else
-  echo "Warning: File not found for removal: $decimated_file" >&2
+  # Resample the 16kHz audio file to 10kHz
+  echo "Resampling audio file..."
+  ./resample_sox.sh "$year" "$month" "$day" 2> >(grep -v '^sox WARN' >&2)
+
+  # Apply the humpback whale song detection model
+  echo -e "\nApplying humpback whale song detection model..."
+  uv run python3 -u hwsd/apply_model.py --metrics-dir "$METRICS_DIR" "$year/$month/$day" \
+      > "logs/nohup-$year-$month-$day.out" 2>&1
+
+  # Remove the resampled 10kHz file
+  echo "Cleaning up resampled file..."
+  decimated_file=$(printf "%s/%04d/%02d/MARS-%04d%02d%02dT000000Z-10kHz.wav" \
+       "$AUDIO_BASE_DIR_10kHz" "$year" "$month" "$year" "$month" "$day")
+  if [[ -f "$decimated_file" ]]; then
+    rm "$decimated_file"
+    echo "Removed: $decimated_file"
+  else
+    echo "Warning: File not found for removal: $decimated_file" >&2
+  fi
 fi
 
 # Calculate and display elapsed time
@@ -4,64 +4,446 @@ A main script to run apply_model_day on given time intervals.
 See USAGE.
 """
 
+import multiprocessing
+import os
 import sys
 import time
+import traceback
+from argparse import ArgumentParser, RawTextHelpFormatter
+from typing import NamedTuple
 
-from hwsd.apply_model_day import apply_model_day
-from hwsd.file_helper import DEFAULT_SCORE_BASE_DIR, FileHelper
+from hwsd.apply_model_day import apply_model_day, backfill_ltsa
+from hwsd.autotune import TrialSettings, load_profile
+from hwsd.file_helper import DAY_SECONDS, DEFAULT_SCORE_BASE_DIR, FileHelper
+from hwsd.metrics import (
+    PROMETHEUS_NAME,
+    Heartbeat,
+    add_totals,
+    configure,
+    get_recorder,
+    summarize_day,
+    write_prometheus,
+)
 from hwsd.misc import elapsed_end, parse_days
 from hwsd.model_helper import ModelHelper
+from hwsd.model_server import get_model_helper
+from hwsd.prescreen import prescreen_params
+from hwsd.provenance import manifest_status, write_manifest
 
-# Adjust the following depending on cpu/ram resources available to apply the model:
-HOURS_PER_CALL = 3  # how many hours of audio to keep in memory
+# Adjust the following depending on cpu/ram resources available to apply the model,
+# or run hwsd/autotune.py to find the best ones on this machine (see load_settings):
+HOURS_PER_CALL = 3  # hours of audio per apply_model_day call (read chunk by chunk)
 MODEL_MINUTES = 60  # Size of audio to pass to the model.
 # The longer this is the more resources used by the model.
+PIPELINED = True  # read the next chunk while the model is applied on the current one
+OVERLAP = True  # give the model its context around each chunk, so MODEL_MINUTES doesn't affect the scores
+CROSS_MIDNIGHT = True  # with OVERLAP, take that context from the adjacent days' files at midnight
+CHECKPOINT = True  # update the score files in place, flushing each chunk's scores as soon as computed
+USE_ARCHIVE = False  # store the scores in the per-year score archive instead of in per-day files
+LTSA = True  # also compute each day's LTSA from the scored audio, for plots with no audio reads
+PRESCREEN = False  # leave clearly empty seconds (dropouts, quiet) unscored, see hwsd/prescreen.py
+XLA = False  # compile the model with XLA (once per input shape, see hwsd/model_helper.py)
+ONEDNN = None  # True/False to enable/disable TensorFlow's oneDNN optimizations on CPU; None for its default
+# Note that, with --workers, each worker process keeps its own audio and model in memory.
+
+# With 10kHz already pre-generated (otherwise, use --audio-base-dir to indicate the 16kHz
+# base directory, in which case the audio is resampled in-process):
+AUDIO_BASE_DIR = "/mnt/PAM_Analysis/GoogleHumpbackModel/decimated_10kHz"
 
 
 USAGE = """
 hwsd/apply_model.py: A main script to apply the model on given time intervals.
 Usage:
-    $ hwsd/apply_model.py time-interval ...
+    $ hwsd/apply_model.py [--workers N] [--resume | --incremental] [--force] time-interval ...
 See README.md for more details.
 """
 
 
-def main(intervals: list[str]) -> None:
+class DayResult(NamedTuple):
+    """Outcome of processing a day."""
+
+    year: int
+    month: int
+    day: int
+    status: str  # "ok", "current" (already scored, see hwsd/provenance.py), "missing" (no audio file), or "failed"
+    seconds: float
+    error: str | None = None
+    stages: dict | None = None  # per-stage metric totals (see hwsd/metrics.py)
+
+    @property
+    def date_tag(self) -> str:
+        return f"{self.year:04}-{self.month:02}-{self.day:02}"
+
+    @property
+    def audio_seconds(self) -> float:
+        """Seconds of audio scored."""
+        return (self.stages or {}).get("inference", {}).get("audio_seconds", 0)
+
+
+def load_settings() -> TrialSettings:
+    """
+    The scoring settings: those in the tuning profile, if any (see hwsd/autotune.py),
+    otherwise HOURS_PER_CALL and MODEL_MINUTES, with batch size 1 and TensorFlow's default threads.
+    Without OVERLAP, MODEL_MINUTES is always used, as the chunk minutes would affect the scores.
+    """
+    settings = load_profile()
+    if settings is None:
+        return TrialSettings(HOURS_PER_CALL, MODEL_MINUTES, 1)
+    if not OVERLAP:
+        settings = settings._replace(model_minutes=MODEL_MINUTES)
+    return settings
+
+
+def process_day(
+    model_helper: ModelHelper,
+    year: int,
+    month: int,
+    day: int,
+    resume: bool = False,
+    audio_base_dir: str = AUDIO_BASE_DIR,
+    incremental: bool = False,
+    force: bool = False,
+    score_base_dir: str = DEFAULT_SCORE_BASE_DIR,
+    hours_per_call: int = HOURS_PER_CALL,
+    model_minutes: int = MODEL_MINUTES,
+    batch_size: int = 1,
+) -> DayResult:
+    """
+    Applies the model on a complete day, `hours_per_call` hours at a time.
+    With `resume`, chunks already completely scored are skipped.
+    With `incremental`, only the runs of missing scores are scored.
+
+    The day is skipped if its score manifest indicates the scores were already
+    computed from the same audio, model, and settings, unless `force` is given
+    (with LTSA, only computing the LTSA of any scored seconds still missing it).
+    If they were computed under a different manifest key, the day is rescored
+    completely (ignoring `resume` and `incremental`).
+
+    Any error is captured in the returned result.
+    """
+    print(f"\n*** DAY {year:04}-{month:02}-{day:02} ***")
+    started = time.time()
+    get_recorder().context = {"day": f"{year:04}-{month:02}-{day:02}"}
+    status, error = "failed", None
+    try:
+        status = _score_day(
+            model_helper,
+            year,
+            month,
+            day,
+            resume,
+            audio_base_dir,
+            incremental,
+            force,
+            score_base_dir,
+            hours_per_call,
+            model_minutes,
+            batch_size,
+        )
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        # on every path, so the day's metrics are neither lost nor counted under the next day:
+        result = _finish_day(DayResult(year, month, day, status, time.time() - started, error))
+    return result
+
+
+def _score_day(
+    model_helper: ModelHelper,
+    year: int,
+    month: int,
+    day: int,
+    resume: bool,
+    audio_base_dir: str,
+    incremental: bool,
+    force: bool,
+    score_base_dir: str,
+    hours_per_call: int,
+    model_minutes: int,
+    batch_size: int,
+) -> str:
+    """The body of process_day, returning the day's status."""
+    file_helper = FileHelper(audio_base_dir, score_base_dir, USE_ARCHIVE)
+    if not file_helper.select_day(year, month, day):
+        return "missing"
+    assert file_helper.manifest_filename and file_helper.score_filename
+    # With OVERLAP, the scores don't depend on the (possibly tuned) chunk minutes,
+    # so the key keeps MODEL_MINUTES, as in the manifests already written:
+    key_minutes = MODEL_MINUTES if OVERLAP else model_minutes
+    params = {"model_minutes": key_minutes, "overlap": OVERLAP, "cross_midnight": CROSS_MIDNIGHT}
+    if PRESCREEN:  # (only then, so the existing manifests remain current)
+        params["prescreen"] = prescreen_params()
+    key = file_helper.get_provenance_key(model_helper.fingerprint(), params, CROSS_MIDNIGHT)
+    status = manifest_status(file_helper.manifest_filename, key, file_helper.score_filename)
+    print(f"    manifest status: {status}")
+    if status == "current" and not force:
+        if LTSA:
+            _backfill_day_ltsa(file_helper, model_minutes * 60)
+        return "current"
+    if status == "stale":
+        resume = incremental = False
+    write_manifest(file_helper.manifest_filename, key, complete=False)
+
+    for at_hour in range(0, 24, hours_per_call):
+        applied = apply_model_day(
+            FileHelper(audio_base_dir, score_base_dir, USE_ARCHIVE),
+            model_helper,
+            year,
+            month,
+            day,
+            at_hour=at_hour,
+            hours=hours_per_call,
+            model_minutes=model_minutes,
+            pipelined=PIPELINED,
+            batch_size=batch_size,
+            overlap=OVERLAP,
+            cross_midnight=CROSS_MIDNIGHT,
+            checkpoint=CHECKPOINT,
+            resume=resume,
+            incremental=incremental,
+            ltsa=LTSA,
+            prescreen=PRESCREEN,
+        )
+        if not applied:
+            return "missing"
+    write_manifest(file_helper.manifest_filename, key)
+    return "ok"
+
+
+def _backfill_day_ltsa(file_helper: FileHelper, chunk_seconds: int) -> None:
+    """Computes the LTSA of the selected (already scored) day's seconds still missing it."""
+    day_ltsa = file_helper.open_day_ltsa(writable=True)
+    assert day_ltsa is not None
+    ltsa_seconds = backfill_ltsa(
+        file_helper,
+        file_helper.load_day_scores(),
+        day_ltsa,
+        0,
+        DAY_SECONDS,
+        chunk_seconds,
+        file_helper.open_day_skipped(),
+    )
+    if ltsa_seconds:
+        print(f"    LTSA computed for {ltsa_seconds:,}s of already scored audio")
+
+
+def _finish_day(result: DayResult) -> DayResult:
+    """Adds the day's metric totals to the result, and reports them."""
+    result = result._replace(stages=get_recorder().take_totals())
+    summarize_day(result.date_tag, result.audio_seconds, result.seconds, result.stages or {})
+    get_recorder().context = {}
+    return result
+
+
+# The model loaded by each worker process (see _init_worker).
+_worker_model_helper: ModelHelper | None = None
+_worker_day_options: dict = {}
+# Traceback of the worker's model loading, if it failed.
+_worker_init_error: str | None = None
+
+
+def _init_worker(intra_op_threads: int, inter_op_threads: int, day_options: dict, metrics_dir: str | None) -> None:
+    global _worker_model_helper, _worker_day_options, _worker_init_error
+    _worker_day_options = day_options
+    configure(metrics_dir)
+    # An exception here would make the pool respawn the worker forever, so it's
+    # kept, and reported as the failure of each day given to the worker:
+    try:
+        model_helper = get_model_helper()
+        model_helper.load_model(intra_op_threads, inter_op_threads, XLA, ONEDNN)
+        _worker_model_helper = model_helper
+    except Exception:
+        _worker_init_error = traceback.format_exc()
+
+
+def _process_day_in_worker(year_month_day: tuple[int, int, int]) -> DayResult:
+    if _worker_init_error is not None:
+        error = f"Worker failed to load the model:\n{_worker_init_error}"
+        return DayResult(*year_month_day, "failed", 0.0, error)
+    assert _worker_model_helper is not None
+    return process_day(_worker_model_helper, *year_month_day, **_worker_day_options)
+
+
+def report_results(results: list[DayResult]) -> None:
+    """Prints a per-day summary of the run."""
+    print("==> Per-day results:")
+    for result in sorted(results):
+        print(f"    {result.date_tag}  {result.status:<7}  {result.seconds:9.1f}s")
+    for result in results:
+        if result.error is not None:
+            print(f"\n--- {result.date_tag} failed:\n{result.error}")
+    statuses = ("ok", "current", "missing", "failed")
+    counts = {status: sum(1 for r in results if r.status == status) for status in statuses}
+    print("    " + ", ".join(f"{status}: {count}" for status, count in counts.items()))
+
+
+def report_progress(results: list[DayResult], heartbeat: Heartbeat, metrics_dir: str | None) -> None:
+    """
+    Reports the progress after each processed day, also updating
+    the Prometheus textfile in `metrics_dir`, if given.
+    """
+    heartbeat.update(len(results))
+    if metrics_dir is None:
+        return
+
+    totals: dict = {}
+    for result in results:
+        add_totals(totals, result.stages or {})
+    gauges = {
+        "days_total": heartbeat.total,
+        "days_done": len(results),
+        **{f"days_{status}": sum(1 for r in results if r.status == status) for status in ("ok", "current", "failed")},
+        "eta_seconds": round(heartbeat.eta_seconds or 0, 1),
+        "last_update_timestamp_seconds": round(time.time(), 3),
+    }
+    last = results[-1]
+    if last.audio_seconds > 0:
+        gauges["last_day_audio_seconds_per_second"] = round(last.audio_seconds / last.seconds, 3)
+    write_prometheus(os.path.join(metrics_dir, PROMETHEUS_NAME), totals, gauges)
+
+
+def main(
+    intervals: list[str],
+    workers: int = 1,
+    resume: bool = False,
+    audio_base_dir: str = AUDIO_BASE_DIR,
+    incremental: bool = False,
+    force: bool = False,
+    metrics_dir: str | None = None,
+) -> list[DayResult]:
     """
     Applies the model on the given intervals.
+    With `resume`, chunks already completely scored are skipped, so
+    an interrupted run can be restarted without losing completed work.
+    With `incremental`, only the runs of missing scores are scored.
+    Days already scored from the same audio, model, and settings are skipped
+    (see hwsd/provenance.py), unless `force` is given.
+
+    With `workers` > 1, the days are processed by a pool of that many processes,
+    each loading the model once and then taking days from a shared queue.
+    The TensorFlow intra-op threads are split among the workers.
+
+    The segment hours, chunk minutes, batch size and (without workers) thread
+    counts are those of the tuning profile, if any (see load_settings).
+
+    With `metrics_dir`, the per-stage spans, per-day summaries and progress
+    heartbeats are appended as JSON lines there, along with a Prometheus
+    textfile with the totals (see hwsd/metrics.py).
     """
 
     years_months_days = parse_days(*intervals)
 
-    print(f"\nSTARTING apply_model with intervals={intervals}")
+    print(f"\nSTARTING apply_model with intervals={intervals} workers={workers}")
+    print(f"    resume={resume} incremental={incremental} force={force}")
+    print(f"    audio_base_dir={audio_base_dir}")
     program_started = time.time()
+    settings = load_settings()
+    print(f"    settings: {settings}")
+    day_options = {
+        "resume": resume,
+        "audio_base_dir": audio_base_dir,
+        "incremental": incremental,
+        "force": force,
+        "hours_per_call": settings.hours_per_call,
+        "model_minutes": settings.model_minutes,
+        "batch_size": settings.batch_size,
+    }
+    configure(metrics_dir)
+    heartbeat = Heartbeat("days", len(years_months_days), interval=0)
+
+    results: list[DayResult] = []
+    if workers <= 1:
+        model_helper = get_model_helper()
+        model_helper.load_model(settings.intra_op_threads, settings.inter_op_threads, XLA, ONEDNN)
 
-    # With 10kHz already pre-generated:
-    audio_base_dir = "/mnt/PAM_Analysis/GoogleHumpbackModel/decimated_10kHz"
-    # (The default in file_helper is to read from the 16kHz data.)
-
-    model_helper = ModelHelper()
-    model_helper.load_model()
-
-    for year, month, day in years_months_days:
-        print(f"\n*** DAY {year:04}-{month:02}-{day:02} ***")
-        for at_hour in range(0, 24, HOURS_PER_CALL):
-            apply_model_day(
-                FileHelper(audio_base_dir, DEFAULT_SCORE_BASE_DIR),
-                model_helper,
-                year,
-                month,
-                day,
-                at_hour=at_hour,
-                hours=HOURS_PER_CALL,
-                model_minutes=MODEL_MINUTES,
-            )
+        for year, month, day in years_months_days:
+            results.append(process_day(model_helper, year, month, day, **day_options))
+            report_progress(results, heartbeat, metrics_dir)
+    else:
+        intra_op_threads = max(1, (os.cpu_count() or 1) // workers)
+        print(f"    {workers} workers, each with intra_op_threads={intra_op_threads}")
+        # "spawn" so no TensorFlow state is inherited by the workers.
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(intra_op_threads, settings.inter_op_threads or 2, day_options, metrics_dir),
+        ) as pool:
+            # chunksize=1: each idle worker takes the next pending day.
+            for result in pool.imap_unordered(_process_day_in_worker, years_months_days, chunksize=1):
+                print(f"\n*** DAY {result.date_tag}: {result.status} in {result.seconds:.1f}s ***")
+                results.append(result)
+                report_progress(results, heartbeat, metrics_dir)
 
+    report_results(results)
     print(f"\n>> complete apply_model in {elapsed_end(program_started)}\n")
+    return results
+
+
+def parse_arguments():
+    """CLI definition."""
+    parser = ArgumentParser(description=USAGE, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "intervals",
+        nargs="+",
+        metavar="time-interval",
+        help="Of the form yearRange/monthRange/dayRange or yearRange/monthRange.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        default=1,
+        help="Number of worker processes, each processing a day at a time. By default, 1.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="Skip chunks already completely scored, e.g., to restart an interrupted run.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        default=False,
+        help="Only score the runs of missing scores, e.g., to fill gaps after partial failures.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        default=False,
+        help="Rescore days even if their score manifest indicates they are up to date.",
+    )
+    parser.add_argument(
+        "--metrics-dir",
+        type=str,
+        metavar="dir",
+        default=None,
+        help="Directory for the metrics output (JSON lines and Prometheus textfile). By default, none.",
+    )
+    parser.add_argument(
+        "--audio-base-dir",
+        type=str,
+        metavar="dir",
+        default=AUDIO_BASE_DIR,
+        help=f"Audio base directory, ending with 10kHz or 16kHz. By default, {AUDIO_BASE_DIR}.",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
-        main(sys.argv[1:])
+        opts = parse_arguments()
+        day_results = main(
+            opts.intervals,
+            opts.workers,
+            opts.resume,
+            opts.audio_base_dir,
+            opts.incremental,
+            opts.force,
+            opts.metrics_dir,
+        )
+        if any(r.status == "failed" for r in day_results):
+            sys.exit(1)
     else:
         print(USAGE)
@@ -5,12 +5,19 @@ Core module for applying the model.
 
 import time
 from argparse import ArgumentParser, RawTextHelpFormatter
+from collections.abc import Iterable, Iterator
+from math import ceil
 
 import numpy as np
 
 from hwsd.file_helper import DEFAULT_AUDIO_BASE_DIR, DEFAULT_SCORE_BASE_DIR, FileHelper
-from hwsd.misc import elapsed_end
-from hwsd.model_helper import ModelHelper
+from hwsd.metrics import Heartbeat, configure, span
+from hwsd.misc import batched, elapsed_end
+from hwsd.model_helper import ModelChunk, ModelHelper
+from hwsd.model_server import get_model_helper
+from hwsd.prefetch import Prefetcher
+from hwsd.prescreen import apply_model_gated
+from hwsd.spectra import compute_ltsa
 
 
 def get_chunk_label(tot_minutes: int) -> str:
@@ -19,6 +26,151 @@ def get_chunk_label(tot_minutes: int) -> str:
     return f"{hours:02}h:{minutes:02}m"
 
 
+def _load_chunks(
+    file_helper: FileHelper,
+    chunk_ranges: list[tuple[int, int]],
+    context_seconds: int,
+    cross_midnight: bool,
+    timings: dict[str, float],
+) -> Iterator[ModelChunk]:
+    """
+    Loads the given (start_second, seconds) chunks one at a time, each one
+    with up to `context_seconds` of the adjacent audio on each side.
+    """
+    for start_second, seconds in chunk_ranges:
+        read_started = time.time()
+        psound, left_seconds = file_helper.load_audio_with_context(
+            start_second,
+            seconds,
+            context_seconds,
+            cross_midnight,
+        )
+        timings["read"] += time.time() - read_started
+        available_seconds = ceil(len(psound) / file_helper.sample_rate) - left_seconds
+        if available_seconds <= 0:
+            break  # end of audio file
+        yield ModelChunk(start_second, min(seconds, available_seconds), psound, left_seconds)
+
+
+def _update_ltsa(day_ltsa: np.memmap, model_chunk: ModelChunk, sample_rate: int) -> None:
+    """Computes the LTSA of the chunk's seconds of interest, and flushes it to the day's LTSA file."""
+    with span("ltsa") as fields:
+        first_sample = model_chunk.context_seconds * sample_rate
+        psound = model_chunk.psound[first_sample : first_sample + model_chunk.seconds * sample_rate]
+        levels = compute_ltsa(psound, sample_rate)
+        day_ltsa[model_chunk.start_second : model_chunk.start_second + len(levels)] = levels
+        day_ltsa.flush()
+        fields["samples"] = len(psound)
+
+
+def unscored_seconds(day_scores: np.ndarray, day_skipped: np.ndarray | None = None) -> np.ndarray:
+    """
+    The seconds of the day pending to be scored: those with missing (NaN) scores,
+    other than those skipped by the pre-screen, if `day_skipped` is given.
+    """
+    unscored = np.isnan(day_scores)
+    if day_skipped is not None:
+        unscored &= ~day_skipped
+    return unscored
+
+
+def plan_gap_chunks(
+    day_scores: np.ndarray,
+    start_second: int,
+    seconds: int,
+    chunk_seconds: int,
+    merge_seconds: int = 0,
+    day_skipped: np.ndarray | None = None,
+) -> list[tuple[int, int]]:
+    """
+    Determines the (start_second, seconds) chunks covering the runs of missing
+    (NaN) scores within the given segment of the day, other than the seconds
+    skipped by the pre-screen, if `day_skipped` is given.
+    Runs separated by no more than `merge_seconds` are merged (as scoring the
+    few seconds in between costs less than the context needed on each side).
+    Chunks are split at the regular `chunk_seconds` grid from `start_second`.
+    """
+    segment = slice(start_second, start_second + seconds)
+    missing = unscored_seconds(day_scores[segment], None if day_skipped is None else day_skipped[segment])
+    return plan_run_chunks(missing, start_second, chunk_seconds, merge_seconds)
+
+
+def plan_run_chunks(
+    missing: np.ndarray,
+    start_second: int,
+    chunk_seconds: int,
+    merge_seconds: int = 0,
+) -> list[tuple[int, int]]:
+    """
+    Determines the (start_second, seconds) chunks covering the runs of True in the
+    given mask of a segment starting at `start_second`, as in plan_gap_chunks.
+    """
+    edges = np.diff(missing.astype(np.int8), prepend=0, append=0)
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+    if len(run_starts) > 1 and merge_seconds > 0:
+        separate = run_starts[1:] - run_ends[:-1] > merge_seconds
+        run_starts = np.concatenate((run_starts[:1], run_starts[1:][separate]))
+        run_ends = np.concatenate((run_ends[:-1][separate], run_ends[-1:]))
+
+    chunk_ranges: list[tuple[int, int]] = []
+    for run_start, run_end in zip(run_starts.tolist(), run_ends.tolist(), strict=True):
+        while run_start < run_end:
+            end = min(run_end, (run_start // chunk_seconds + 1) * chunk_seconds)
+            chunk_ranges.append((start_second + run_start, end - run_start))
+            run_start = end
+    return chunk_ranges
+
+
+def backfill_ltsa(
+    file_helper: FileHelper,
+    day_scores: np.ndarray,
+    day_ltsa: np.memmap,
+    start_second: int,
+    seconds: int,
+    chunk_seconds: int,
+    day_skipped: np.ndarray | None = None,
+) -> int:
+    """
+    Computes the LTSA of the seconds within the given segment of the selected day
+    that are already scored (or skipped by the pre-screen, per `day_skipped`) but
+    have no LTSA, e.g., those of chunks skipped with `resume` or `incremental`, or
+    of days scored without `ltsa`, reading their audio `chunk_seconds` at a time.
+
+    :return:  seconds of LTSA computed
+    """
+    segment = slice(start_second, start_second + seconds)
+    done = ~np.isnan(day_scores[segment])
+    if day_skipped is not None:
+        done |= day_skipped[segment]
+    pending = done & np.isnan(day_ltsa[segment, 0])
+    # (the LTSA is only of whole seconds, so not for a trailing partial second of audio:)
+    pending[max(0, file_helper.audio_whole_seconds() - start_second) :] = False
+
+    computed_seconds = 0
+    for chunk_start, chunk_len in plan_run_chunks(pending, start_second, chunk_seconds):
+        psound, _ = file_helper.load_audio_with_context(chunk_start, chunk_len, 0)
+        _update_ltsa(day_ltsa, ModelChunk(chunk_start, chunk_len, psound), file_helper.sample_rate)
+        computed_seconds += len(psound) // file_helper.sample_rate
+    return computed_seconds
+
+
+def print_stage_timings(timings: dict[str, float], wall_seconds: float) -> None:
+    """
+    Reports the time spent in each stage along with the overall wall time.
+    With a pipelined run, the difference between the sum of the stages
+    and the wall time is what the overlap saved.
+    """
+    print("==> Stage timings:")
+    for stage, seconds in timings.items():
+        print(f"    {stage:<6} {seconds:9.1f}s")
+    print(f"    {'wall':<6} {wall_seconds:9.1f}s")
+    serial_seconds = timings["read"] + timings["model"]
+    saved_seconds = serial_seconds - wall_seconds
+    if saved_seconds > 0 and serial_seconds > 0:
+        print(f"    overlap saved {saved_seconds:.1f}s ({100 * saved_seconds / serial_seconds:.0f}% of read + model)")
+
+
 def apply_model_day(
     file_helper: FileHelper,
     model_helper: ModelHelper,
@@ -28,84 +180,214 @@ def apply_model_day(
     at_hour: int = 0,
     hours: int = 24,
     model_minutes: int = 10,
-) -> None:
+    pipelined: bool = False,
+    prefetch_chunks: int = 1,
+    batch_size: int = 1,
+    overlap: bool = False,
+    cross_midnight: bool = False,
+    checkpoint: bool = False,
+    resume: bool = False,
+    incremental: bool = False,
+    ltsa: bool = False,
+    prescreen: bool = False,
+) -> bool:
     """
     Applies the model on a specified audio segment.
     Updates the score file corresponding to the complete year-month-day,
     of course while retaining any already stored scores outside the segment.
+
+    With `pipelined`, the segment is not loaded upfront; instead, a background
+    thread reads the `model_minutes` chunks, keeping up to `prefetch_chunks`
+    of them ready while the model is applied on the current one.
+
+    With `batch_size` > 1, that many chunks are scored together in a single
+    model call (see ModelHelper.apply_model_batch); note that this also
+    multiplies the memory used by the model.
+
+    With `overlap`, each chunk is given to the model along with the model's
+    context on each side (overlap-save), so the scores do not depend on
+    `model_minutes` and are as with a single pass on the whole day.
+    With `cross_midnight`, that context extends into the previous/next day's file.
+
+    With `checkpoint`, the score file is updated in place (memory-mapped),
+    with each chunk's scores flushed to disk as soon as computed.
+    With `resume` (which implies `checkpoint`), chunks already completely
+    scored in the file are skipped, so an interrupted run can be restarted.
+
+    With `incremental`, only the runs of missing scores within the segment
+    are scored (each one with the model's context on each side), so the
+    scores already in the file are retained.
+
+    With `ltsa`, the day's long-term spectral average (see hwsd/spectra.py) is
+    also computed from each chunk's audio as it's scored, and updated in place
+    in the LTSA file next to the score file, so plots don't need the audio.
+    Any already scored seconds in the segment with no LTSA (e.g., in chunks
+    skipped with `resume`) then also get it (see backfill_ltsa).
+
+    With `prescreen`, the seconds that are clearly empty (dropouts, or quiet
+    in the song band, see hwsd/prescreen.py) are left as missing scores,
+    without model inference, and the fraction skipped is reported. These
+    seconds are recorded in the day's skip mask (see FileHelper.open_day_skipped),
+    so `resume` and `incremental` take them as done, not as pending.
+
+    The audio is read chunk by chunk through the day's audio stream (see
+    FileHelper.open_audio_stream), so memory is bounded by the chunk size
+    (and the number of chunks held at once), not by `hours`.
+
+    :return:  True only if the model was applied, that is, the
+              corresponding audio file exists.
     """
     if file_helper.sample_rate != 10_000:
         # A previous version handled this case by doing the resampling (using librosa).
         # but later on we opted to generate the 10kHz files beforehand (using sox).
         print("ERROR: Input signal expected at 10kHz")
-        return
+        return False
 
     program_started = time.time()
     date_tag = f"{year:04}-{month:02}-{day:02}"
     line = f"{date_tag} @ {at_hour:02}h dur={hours:02}h model_minutes={model_minutes}"
+    line += f" pipelined={pipelined} batch_size={batch_size} overlap={overlap}"
+    checkpoint = checkpoint or resume
+    line += f" checkpoint={checkpoint} resume={resume} incremental={incremental} ltsa={ltsa} prescreen={prescreen}"
     print(f"### starting apply_model_day: {line}")
 
     print("\n==> Selecting day")
     if not file_helper.select_day(year, month, day):
-        return
+        return False
 
     hours = min(hours, 24 - at_hour)
-    print(f"\n==> Loading segment (hours={hours})")
-    segment_load_started = time.time()
-    psound_segment, psound_segment_seconds = file_helper.load_audio_segment(
-        at_hour=at_hour,
-        hours=hours,
-    )
-    print(f"    >> {hours}-hour segment loaded in {elapsed_end(segment_load_started)}")
-
-    # At 10 kHz, this is the nominal size in samples of our desired
-    # segment when resampled:
-    psound_segment_samples_at_10k = 10_000 * psound_segment_seconds
-    print(f"    psound_segment_samples_at_10k = {psound_segment_samples_at_10k:,}")
+    segment_start_second = at_hour * 60 * 60
+    segment_seconds = hours * 60 * 60
+    to_model_in_seconds = 60 * model_minutes
+    context_seconds = model_helper.context_seconds if overlap or incremental else 0
+    timings = {"read": 0.0, "model": 0.0, "wait": 0.0}
 
     # Get score array for the whole day:
-    day_scores = file_helper.load_day_scores()
-
-    # initial offset to update day_scores below:
-    day_scores_offset_seconds = at_hour * 60 * 60
-
-    print("\n==> Starting model application ...")
-    model_application_started = time.time()
-    to_model_in_seconds = 60 * model_minutes
-    to_model_in_samples = 10_000 * to_model_in_seconds
-    chunk_minutes = 60 * at_hour
-    for start in range(0, len(psound_segment), to_model_in_samples):
-        chunk_label = get_chunk_label(chunk_minutes)
-        print(f"\n==> Applying model on {model_minutes}-min chunk starting @ {chunk_label}  ({date_tag})")
-        model_chunk_started = time.time()
-        psound_chunk = psound_segment[start : start + to_model_in_samples]
-        chunk_score_values = model_helper.apply_model(psound_chunk)
-        print(f"    >> model applied on chunk in {elapsed_end(model_chunk_started)}")
-        print(f"     chunk_score_values: {len(chunk_score_values):,}")
-        if len(chunk_score_values) > to_model_in_seconds:
-            chunk_score_values = chunk_score_values[:to_model_in_seconds]
-
-        # update day_scores with to_model_in_seconds values:
-        np.put(
+    day_scores = file_helper.open_day_scores() if checkpoint else file_helper.load_day_scores()
+    day_ltsa = file_helper.open_day_ltsa(writable=True) if ltsa else None
+    day_skipped = file_helper.open_day_skipped(writable=True) if prescreen else None
+
+    chunk_ranges = [
+        (segment_start_second + offset, min(to_model_in_seconds, segment_seconds - offset))
+        for offset in range(0, segment_seconds, to_model_in_seconds)
+    ]
+    if resume:
+        unscored = unscored_seconds(day_scores, day_skipped)
+        pending = [(start, seconds) for start, seconds in chunk_ranges if unscored[start : start + seconds].any()]
+        skipped_seconds = sum(seconds for _, seconds in chunk_ranges) - sum(seconds for _, seconds in pending)
+        print(f"\n==> Resuming: {len(chunk_ranges) - len(pending)} chunks ({skipped_seconds:,}s) already scored")
+        chunk_ranges = pending
+
+    if incremental:
+        chunk_ranges = plan_gap_chunks(
             day_scores,
-            range(
-                day_scores_offset_seconds,
-                day_scores_offset_seconds + to_model_in_seconds,
-            ),
-            chunk_score_values,
+            segment_start_second,
+            segment_seconds,
+            to_model_in_seconds,
+            merge_seconds=2 * context_seconds,
+            day_skipped=day_skipped,
         )
-
-        # advance scores offset for next cycle:
-        day_scores_offset_seconds += model_minutes * 60
-
-        # advance chunk_minutes for next cycle:
-        chunk_minutes += model_minutes
+        pending_seconds = sum(seconds for _, seconds in chunk_ranges)
+        skipped_seconds = segment_seconds - pending_seconds
+        print(f"\n==> Incremental: {pending_seconds:,}s to score in {len(chunk_ranges)} chunks")
+        print(f"    {skipped_seconds:,}s ({100 * skipped_seconds / segment_seconds:.1f}%) skipped, already scored")
+
+    # so the first/last chunks of the day (with context on one side only) share the shape of the others:
+    model_helper.add_bucket(min(to_model_in_seconds, segment_seconds) + 2 * context_seconds)
+
+    prefetcher: Prefetcher | None = None
+    # (the audio stream and prefetcher are released on failure too, as the worker pool moves on to the next day:)
+    try:
+        # each chunk's audio is read into one of a ring of reusable buffers, enough for those held at once:
+        held_chunks = batch_size + (prefetch_chunks + 1 if pipelined else 0)
+        file_helper.open_audio_stream(min(to_model_in_seconds, segment_seconds) + 2 * context_seconds, held_chunks)
+
+        print(f"\n==> Chunked loading of segment (hours={hours}, context_seconds={context_seconds})")
+        chunks: Iterable[ModelChunk] = _load_chunks(file_helper, chunk_ranges, context_seconds, cross_midnight, timings)
+        if pipelined:
+            print(f"    pipelined, prefetch_chunks={prefetch_chunks}")
+            chunks = prefetcher = Prefetcher(chunks, depth=prefetch_chunks)
+
+        print("\n==> Starting model application ...")
+        model_application_started = time.time()
+        heartbeat = Heartbeat(f"{date_tag} @ {at_hour:02}h", sum(seconds for _, seconds in chunk_ranges))
+        done_seconds = 0
+        skipped_seconds = 0
+        for model_chunks in batched(chunks, batch_size):
+            chunk_label = get_chunk_label(model_chunks[0].start_second // 60)
+            if batch_size == 1:
+                print(f"\n==> Applying model on {model_minutes}-min chunk starting @ {chunk_label}  ({date_tag})")
+            else:
+                print(
+                    f"\n==> Applying model on batch of {len(model_chunks)} {model_minutes}-min chunks"
+                    f" starting @ {chunk_label}  ({date_tag})"
+                )
+            model_chunk_started = time.time()
+            if prescreen:
+                batch_score_values, batch_skipped_seconds = apply_model_gated(
+                    model_helper, model_chunks, file_helper.sample_rate
+                )
+                skipped_seconds += batch_skipped_seconds
+                print(f"    prescreen: {batch_skipped_seconds:,}s skipped")
+            else:
+                batch_score_values = model_helper.apply_model_chunks(model_chunks)
+            timings["model"] += time.time() - model_chunk_started
+            print(f"    >> model applied on chunk in {elapsed_end(model_chunk_started)}")
+
+            for model_chunk, chunk_score_values in zip(model_chunks, batch_score_values, strict=True):
+                print(f"     chunk_score_values: {len(chunk_score_values):,}")
+
+                # update day_scores with the chunk's values:
+                start = model_chunk.start_second
+                day_scores[start : start + len(chunk_score_values)] = chunk_score_values
+                if isinstance(day_scores, np.memmap):
+                    with span("score_save", bytes=len(chunk_score_values) * day_scores.itemsize):
+                        day_scores.flush()
+                if day_skipped is not None:
+                    day_skipped[start : start + len(chunk_score_values)] = np.isnan(chunk_score_values)
+                    day_skipped.flush()
+                file_helper.update_presence(day_scores, start, len(chunk_score_values))
+                if day_ltsa is not None:
+                    _update_ltsa(day_ltsa, model_chunk, file_helper.sample_rate)
+                done_seconds += model_chunk.seconds
+            heartbeat.update(done_seconds)
+
+        if day_ltsa is not None:
+            ltsa_seconds = backfill_ltsa(
+                file_helper,
+                day_scores,
+                day_ltsa,
+                segment_start_second,
+                segment_seconds,
+                to_model_in_seconds,
+                day_skipped,
+            )
+            if ltsa_seconds:
+                print(f"\n==> LTSA computed for {ltsa_seconds:,}s of already scored audio")
+    finally:
+        if prefetcher is not None:
+            prefetcher.close()
+        file_helper.close_audio_stream()
 
     print(f"\n>> model applied on complete {hours}-hour segment in {elapsed_end(model_application_started)}\n")
-
-    file_helper.save_day_scores(day_scores)
+    if prescreen:
+        fraction = skipped_seconds / done_seconds if done_seconds else 0.0
+        print(f"    prescreen: inference skipped on {skipped_seconds:,}s of {done_seconds:,}s ({fraction:.1%})")
+
+    if prefetcher is not None:
+        timings["wait"] = prefetcher.wait_seconds
+    print_stage_timings(timings, time.time() - program_started)
+
+    if checkpoint:
+        print(f"Scores updated in place in {file_helper.score_filename}")
+        file_helper.update_score_pyramid(day_scores)
+        del day_scores  # closes the memory map
+    else:
+        # (the presence rows already updated per chunk)
+        file_helper.save_day_scores(day_scores, presence=False)
 
     print(f"\n>> complete apply_model_day: {line} in {elapsed_end(program_started)}\n")
+    return True
 
 
 def parse_arguments():
@@ -138,6 +420,13 @@ Examples:
         help=f"Score base directory. By default, {DEFAULT_SCORE_BASE_DIR}.",
     )
 
+    parser.add_argument(
+        "--use-archive",
+        action="store_true",
+        default=False,
+        help="Store the scores in the per-year score archive instead of in per-day files.",
+    )
+
     parser.add_argument("--year", type=int, metavar="YYYY", required=True, help="Year")
     parser.add_argument("--month", type=int, metavar="M", required=True, help="Month")
     parser.add_argument("--day", type=int, metavar="D", required=True, help="Day")
@@ -162,6 +451,82 @@ Examples:
         default=10,
         help="Length in minutes of signal to give the model at a time. By default, 10.",
     )
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        default=False,
+        help="Read the next chunks in a background thread while the model is applied on the current one.",
+    )
+    parser.add_argument(
+        "--prefetch-chunks",
+        type=int,
+        metavar="n",
+        default=1,
+        help="With --pipelined, maximum number of chunks to keep ready. By default, 1.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        metavar="n",
+        default=1,
+        help="Number of chunks to score together in a single model call. By default, 1.",
+    )
+    parser.add_argument(
+        "--overlap",
+        action="store_true",
+        default=False,
+        help="Give each chunk to the model along with the model's context on each side (overlap-save),\n"
+        "so the scores do not depend on --model-minutes.",
+    )
+    parser.add_argument(
+        "--cross-midnight",
+        action="store_true",
+        default=False,
+        help="With --overlap, take the context beyond midnight from the previous/next day's file.",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="store_true",
+        default=False,
+        help="Update the score file in place, flushing each chunk's scores as soon as computed.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="Like --checkpoint, but skipping chunks already completely scored in the score file.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        default=False,
+        help="Only score the runs of missing scores in the score file (with the model's context around them).",
+    )
+    parser.add_argument(
+        "--ltsa",
+        action="store_true",
+        default=False,
+        help="Also compute the day's LTSA (long-term spectral average) from the scored audio.",
+    )
+    parser.add_argument(
+        "--prescreen",
+        action="store_true",
+        default=False,
+        help="Skip the model on clearly empty seconds (dropouts, quiet), leaving them as missing scores.",
+    )
+    parser.add_argument(
+        "--xla",
+        action="store_true",
+        default=False,
+        help="Compile the model with XLA (once per input shape, see hwsd/model_helper.py).",
+    )
+    parser.add_argument(
+        "--metrics-dir",
+        type=str,
+        metavar="dir",
+        default=None,
+        help="Directory for the metrics output (JSON lines, see hwsd/metrics.py). By default, none.",
+    )
 
     return parser.parse_args()
 
@@ -169,13 +534,14 @@ Examples:
 def main(opts) -> None:
     "Main program."
 
-    model_helper = ModelHelper()
+    configure(opts.metrics_dir)
+    model_helper = get_model_helper()
     model_load_started = time.time()
-    model_helper.load_model()
+    model_helper.load_model(xla=opts.xla)
     print(f"    >> model loaded in {elapsed_end(model_load_started)}")
 
     apply_model_day(
-        FileHelper(opts.audio_base_dir, opts.score_base_dir),
+        FileHelper(opts.audio_base_dir, opts.score_base_dir, opts.use_archive),
         model_helper,
         opts.year,
         opts.month,
@@ -183,6 +549,16 @@ def main(opts) -> None:
         opts.at_hour,
         opts.hours,
         opts.model_minutes,
+        opts.pipelined,
+        opts.prefetch_chunks,
+        opts.batch_size,
+        opts.overlap,
+        opts.cross_midnight,
+        opts.checkpoint,
+        opts.resume,
+        opts.incremental,
+        opts.ltsa,
+        opts.prescreen,
     )
 
 
@@ -0,0 +1,111 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+import soundfile as sf
+
+from hwsd.apply_model_day import apply_model_day, plan_gap_chunks
+from hwsd.file_helper import VOLTS_SCALE, FileHelper
+from hwsd.model_helper import SAMPLE_RATE
+from hwsd.model_helper_test import WindowedEnergyModel
+
+
+class Test(unittest.TestCase):
+    def test_plan_gap_chunks(self):
+        day_scores = np.zeros(3600)
+        self.assertEqual(plan_gap_chunks(day_scores, 0, 3600, 600), [])
+
+        day_scores[100:130] = np.nan
+        day_scores[140:150] = np.nan
+        day_scores[1000:2000] = np.nan
+        day_scores[3590:] = np.nan
+        self.assertEqual(
+            plan_gap_chunks(day_scores, 0, 3600, 600),
+            [(100, 30), (140, 10), (1000, 200), (1200, 600), (1800, 200), (3590, 10)],
+        )
+        # close runs merged:
+        self.assertEqual(
+            plan_gap_chunks(day_scores, 0, 3600, 600, merge_seconds=10),
+            [(100, 50), (1000, 200), (1200, 600), (1800, 200), (3590, 10)],
+        )
+        # only within the segment, with the chunk grid from the segment start:
+        self.assertEqual(plan_gap_chunks(day_scores, 1500, 1000, 600), [(1500, 500)])
+        self.assertEqual(plan_gap_chunks(day_scores, 1500, 2100, 1000), [(1500, 500), (3590, 10)])
+        # seconds skipped by the pre-screen are not pending:
+        day_skipped = np.zeros(3600, dtype=bool)
+        day_skipped[1000:1900] = True
+        self.assertEqual(
+            plan_gap_chunks(day_scores, 0, 3600, 600, day_skipped=day_skipped),
+            [(100, 30), (140, 10), (1900, 100), (3590, 10)],
+        )
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.audio_base_dir = f"{self.tmp_dir.name}/audio_10kHz"
+        self.score_base_dir = f"{self.tmp_dir.name}/scores"
+        os.makedirs(f"{self.audio_base_dir}/2020/01")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_day(self, psound: np.ndarray) -> None:
+        filename = f"{self.audio_base_dir}/2020/01/MARS-20200101T000000Z-10kHz.wav"
+        sf.write(filename, psound / VOLTS_SCALE, SAMPLE_RATE, subtype="FLOAT")
+
+    def score_day(self, model: WindowedEnergyModel, **options) -> FileHelper:
+        file_helper = FileHelper(self.audio_base_dir, self.score_base_dir)
+        apply_model_day(file_helper, model, 2020, 1, 1, hours=1, model_minutes=1, overlap=True, **options)
+        return file_helper
+
+    def test_resume_prescreened(self):
+        psound = np.random.default_rng(0).normal(scale=0.3, size=600 * SAMPLE_RATE).astype(np.float32)
+        psound[100 * SAMPLE_RATE : 400 * SAMPLE_RATE] = 0  # a dropout
+        self.write_day(psound)
+        model = WindowedEnergyModel()
+
+        file_helper = self.score_day(model, prescreen=True)
+        scores = np.load(file_helper.score_filename)
+        skipped = np.isnan(scores[:600])
+        self.assertTrue(skipped[120:380].all())
+        self.assertFalse(skipped[:90].any())
+
+        # a resumed run doesn't score any of the skipped seconds again:
+        with mock.patch.object(model, "apply_model_chunks", wraps=model.apply_model_chunks) as apply_model_chunks:
+            self.score_day(model, prescreen=True, resume=True)
+        apply_model_chunks.assert_not_called()
+        np.testing.assert_array_equal(np.load(file_helper.score_filename), scores)
+
+    def test_ltsa_backfill(self):
+        self.write_day(np.random.default_rng(0).normal(scale=0.3, size=300 * SAMPLE_RATE).astype(np.float32))
+        model = WindowedEnergyModel()
+        self.score_day(model)
+
+        # resumed with LTSA, all chunks are skipped, but still get their LTSA:
+        with mock.patch.object(model, "apply_model_chunks", wraps=model.apply_model_chunks) as apply_model_chunks:
+            file_helper = self.score_day(model, resume=True, ltsa=True)
+        apply_model_chunks.assert_not_called()
+        day_ltsa = file_helper.open_day_ltsa()
+        self.assertFalse(np.isnan(day_ltsa[:300]).any())
+        self.assertTrue(np.isnan(day_ltsa[300:]).all())
+
+    def test_failure_releases_stream_and_prefetcher(self):
+        self.write_day(np.random.default_rng(0).normal(scale=0.3, size=600 * SAMPLE_RATE).astype(np.float32))
+        model = WindowedEnergyModel()
+        file_helper = FileHelper(self.audio_base_dir, self.score_base_dir)
+        apply_model_chunks = model.apply_model_chunks
+
+        def fail_after_first_chunk(model_chunks):
+            if model_chunks[0].start_second > 0:
+                raise RuntimeError("model failure")
+            return apply_model_chunks(model_chunks)
+
+        with (
+            mock.patch.object(model, "apply_model_chunks", side_effect=fail_after_first_chunk),
+            self.assertRaisesRegex(RuntimeError, "model failure"),
+        ):
+            apply_model_day(file_helper, model, 2020, 1, 1, hours=1, model_minutes=1, pipelined=True, prefetch_chunks=2)
+        self.assertNotIn("prefetcher", [thread.name for thread in threading.enumerate()])
+        self.assertIsNone(file_helper._audio_stream)
@@ -0,0 +1,39 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import soundfile as sf
+
+from hwsd import apply_model
+from hwsd.metrics import get_recorder
+from hwsd.model_helper_test import WindowedEnergyModel
+
+
+class Test(unittest.TestCase):
+    def test_day_finished_on_every_path(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            audio_base_dir = f"{tmp_dir}/audio_10kHz"
+            os.makedirs(f"{audio_base_dir}/2020/01")
+            psound = np.random.default_rng(0).normal(scale=0.1, size=120 * 10_000).astype(np.float32)
+            sf.write(f"{audio_base_dir}/2020/01/MARS-20200101T000000Z-10kHz.wav", psound, 10_000, subtype="FLOAT")
+            model = WindowedEnergyModel()
+            options = {"audio_base_dir": audio_base_dir, "score_base_dir": f"{tmp_dir}/scores", "hours_per_call": 24}
+
+            with mock.patch.object(model, "fingerprint", return_value="stub"):
+                for day, status in ((1, "ok"), (1, "current"), (2, "missing")):
+                    result = apply_model.process_day(model, 2020, 1, day, **options)
+                    self.assertEqual(result.status, status)
+                    self.assertIsNotNone(result.stages)
+                    self.assertEqual(get_recorder().context, {})
+
+    def test_worker_model_load_failure(self):
+        with mock.patch.object(apply_model, "get_model_helper", side_effect=RuntimeError("no model")):
+            apply_model._init_worker(1, 1, {}, None)
+        try:
+            result = apply_model._process_day_in_worker((2020, 1, 1))
+            self.assertEqual(result.status, "failed")
+            self.assertIn("RuntimeError: no model", result.error)
+        finally:
+            apply_model._worker_init_error = None
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Throughput tuning of the scoring settings on the current machine.
+
+Runs short trial passes of apply_model_day on a sample day over a grid of
+segment hours (HOURS_PER_CALL), chunk minutes (MODEL_MINUTES), batch sizes,
+and TensorFlow intra-/inter-op thread counts, each trial in a fresh process
+(so it has its own peak RSS and thread pools), measuring the seconds of
+audio scored per wall second. The fastest settings (within `--max-rss-mb`,
+if given) are written as a JSON profile, along with all the trial results.
+
+`hwsd/apply_model.py` and `scripts/score_file.py` load the profile
+automatically, from $HWSD_TUNING_PROFILE, or DEFAULT_PROFILE_FILENAME if not
+set; set HWSD_TUNING_PROFILE=none to ignore any profile. The profile never
+changes the scores: its chunk minutes are only used with overlap-save
+processing, with which the scores don't depend on them.
+
+See USAGE.
+"""
+
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, RawTextHelpFormatter
+from contextlib import redirect_stdout
+from typing import NamedTuple
+
+from hwsd.misc import elapsed_end, parse_days
+
+# In the current directory, as the local model (see hwsd/model_helper.py).
+DEFAULT_PROFILE_FILENAME = "hwsd-tuning.json"
+
+# Default grid, with None for TensorFlow's default thread pool size.
+DEFAULT_HOURS_PER_CALL = [1, 3]
+DEFAULT_MODEL_MINUTES = [10, 30, 60]
+DEFAULT_BATCH_SIZES = [1, 2]
+DEFAULT_THREADS = [None]
+
+USAGE = """
+hwsd/autotune.py: Finds the fastest scoring settings on this machine.
+Usage:
+    $ hwsd/autotune.py [options] YYYY/MM/DD
+with the sample day to score in the trials. See --help for the options.
+"""
+
+
+class TrialSettings(NamedTuple):
+    """Settings of a trial, as stored in the profile."""
+
+    hours_per_call: int
+    model_minutes: int
+    batch_size: int
+    intra_op_threads: int | None = None
+    inter_op_threads: int | None = None
+
+    def __str__(self) -> str:
+        def threads(n: int | None) -> str:
+            return "default" if n is None else str(n)
+
+        return (
+            f"hours={self.hours_per_call} minutes={self.model_minutes} batch={self.batch_size}"
+            f" intra={threads(self.intra_op_threads)} inter={threads(self.inter_op_threads)}"
+        )
+
+
+def get_profile_filename() -> str | None:
+    """The profile filename, or None if disabled (HWSD_TUNING_PROFILE=none)."""
+    filename = os.environ.get("HWSD_TUNING_PROFILE", DEFAULT_PROFILE_FILENAME)
+    return None if filename == "none" else filename
+
+
+def load_profile(filename: str | None = None) -> TrialSettings | None:
+    """
+    The tuned settings in the given profile (by default, per get_profile_filename),
+    or None if there is no profile (or it's invalid).
+    """
+    filename = filename or get_profile_filename()
+    if filename is None or not os.path.isfile(filename):
+        return None
+    try:
+        with open(filename) as f:
+            profile = json.load(f)
+        settings = TrialSettings(**profile["settings"])
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"WARNING: ignoring invalid tuning profile {filename}: {e}")
+        return None
+    print(f"\n==> Using tuning profile {filename}: {settings}")
+    if profile.get("cpu_count") != os.cpu_count():
+        print(f"    (tuned with {profile.get('cpu_count')} CPUs, but {os.cpu_count()} here; consider re-tuning)")
+    return settings
+
+
+def save_profile(filename: str, best: dict, trials: list[dict], sample: dict) -> None:
+    """Writes the profile (atomically)."""
+    profile = {
+        "settings": best["settings"],
+        "audio_seconds_per_second": best["audio_seconds_per_second"],
+        "peak_rss_mb": best["peak_rss_mb"],
+        "cpu_count": os.cpu_count(),
+        "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "sample": sample,
+        "trials": trials,
+    }
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, "w") as f:
+        json.dump(profile, f, indent=2)
+        f.write("\n")
+    os.replace(tmp_filename, filename)
+
+
+def make_grid(
+    hours_per_call: list[int],
+    model_minutes: list[int],
+    batch_sizes: list[int],
+    intra_op_threads: list[int | None],
+    inter_op_threads: list[int | None],
+) -> list[TrialSettings]:
+    """
+    All the combinations of the given values, except those in which a segment
+    doesn't fill a single batch of chunks (which would just repeat another trial).
+    """
+    return [
+        TrialSettings(*values)
+        for values in itertools.product(hours_per_call, model_minutes, batch_sizes, intra_op_threads, inter_op_threads)
+        if values[1] * values[2] <= 60 * values[0]
+    ]
+
+
+def choose_best(trials: list[dict], max_rss_mb: float | None = None) -> dict | None:
+    """The fastest successful trial within the given peak RSS, if any."""
+    candidates = [
+        trial
+        for trial in trials
+        if trial.get("error") is None and (max_rss_mb is None or trial["peak_rss_mb"] <= max_rss_mb)
+    ]
+    return max(candidates, key=lambda trial: trial["audio_seconds_per_second"], default=None)
+
+
+def _run_trial_in_child(
+    settings: TrialSettings,
+    year_month_day: tuple[int, int, int],
+    at_hour: int,
+    audio_base_dir: str,
+    model_helper_class: type,
+    results: multiprocessing.Queue,
+) -> None:
+    from hwsd import apply_model
+    from hwsd.apply_model_day import apply_model_day
+    from hwsd.file_helper import FileHelper
+
+    with tempfile.TemporaryDirectory() as score_base_dir, open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        model_helper = model_helper_class()
+        model_load_started = time.time()
+        model_helper.load_model(
+            settings.intra_op_threads, settings.inter_op_threads, apply_model.XLA, apply_model.ONEDNN
+        )
+        model_load_seconds = time.time() - model_load_started
+
+        # As in a long run, the first-call overhead is not part of the throughput:
+        warm_up_started = time.time()
+        context_seconds = model_helper.context_seconds if apply_model.OVERLAP else 0
+        model_helper.warm_up(60 * settings.model_minutes + 2 * context_seconds, settings.batch_size)
+        warm_up_seconds = time.time() - warm_up_started
+
+        # A single call, as each of those in apply_model.process_day:
+        started = time.time()
+        applied = apply_model_day(
+            FileHelper(audio_base_dir, score_base_dir),
+            model_helper,
+            *year_month_day,
+            at_hour=at_hour,
+            hours=settings.hours_per_call,
+            model_minutes=settings.model_minutes,
+            pipelined=apply_model.PIPELINED,
+            batch_size=settings.batch_size,
+            overlap=apply_model.OVERLAP,
+            cross_midnight=apply_model.CROSS_MIDNIGHT,
+            checkpoint=apply_model.CHECKPOINT,
+            ltsa=apply_model.LTSA,
+        )
+        wall_seconds = time.time() - started
+    if not applied:
+        raise RuntimeError(f"No audio file for {year_month_day} under {audio_base_dir}")
+
+    audio_seconds = 3600 * min(settings.hours_per_call, 24 - at_hour)
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    results.put(
+        {
+            "audio_seconds": audio_seconds,
+            "wall_seconds": round(wall_seconds, 3),
+            "audio_seconds_per_second": round(audio_seconds / wall_seconds, 1),
+            "peak_rss_mb": round(peak_rss_mb, 1),
+            "model_load_seconds": round(model_load_seconds, 3),
+            "warm_up_seconds": round(warm_up_seconds, 3),
+        }
+    )
+
+
+def run_trial(
+    settings: TrialSettings,
+    year_month_day: tuple[int, int, int],
+    at_hour: int,
+    audio_base_dir: str,
+    model_helper_class: type | None = None,
+) -> dict:
+    """
+    Runs a trial in a fresh process, with the model always loaded in that
+    process (not from the model server), as the thread settings are per process.
+    `model_helper_class` (by default, ModelHelper) must be importable by that process.
+    A failed trial (e.g., killed when running out of memory) is reported as such.
+    """
+    if model_helper_class is None:
+        from hwsd.model_helper import ModelHelper
+
+        model_helper_class = ModelHelper
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(
+        target=_run_trial_in_child,
+        args=(settings, year_month_day, at_hour, audio_base_dir, model_helper_class, results),
+    )
+    process.start()
+    # The result is taken before joining, as a child process doesn't exit
+    # until what it put in the queue is consumed:
+    trial = None
+    while trial is None:
+        try:
+            trial = results.get(timeout=1)
+        except queue.Empty:
+            if process.exitcode is not None:
+                break  # exited with no result (e.g., killed)
+    process.join()
+    result = {"settings": settings._asdict()}
+    if process.exitcode != 0 or trial is None:
+        return {**result, "error": f"exit code {process.exitcode}"}
+    return {**result, **trial}
+
+
+def tune(
+    year_month_day: tuple[int, int, int],
+    grid: list[TrialSettings],
+    audio_base_dir: str,
+    at_hour: int = 0,
+    max_rss_mb: float | None = None,
+    profile_filename: str = DEFAULT_PROFILE_FILENAME,
+    model_helper_class: type | None = None,
+) -> dict | None:
+    """
+    Runs the trials on the given sample day, starting at `at_hour`,
+    and saves the profile with the best one.
+
+    :return:  The best trial, or None if none succeeded within `max_rss_mb`.
+    """
+    date_tag = "{:04}-{:02}-{:02}".format(*year_month_day)
+    print(f"\nSTARTING autotune on {date_tag} @ {at_hour:02}h with {len(grid)} trials")
+    print(f"    audio_base_dir={audio_base_dir}")
+    program_started = time.time()
+
+    trials: list[dict] = []
+    for i, settings in enumerate(grid):
+        print(f"\n==> Trial {i + 1}/{len(grid)}: {settings}")
+        trial = run_trial(settings, year_month_day, at_hour, audio_base_dir, model_helper_class)
+        if trial.get("error") is not None:
+            print(f"    >> FAILED: {trial['error']}")
+        else:
+            print(
+                f"    >> {trial['audio_seconds_per_second']:,.1f} audio-s/s"
+                f"  peak RSS {trial['peak_rss_mb']:,.1f} MB  ({trial['wall_seconds']:.1f}s)"
+            )
+        trials.append(trial)
+
+    best = choose_best(trials, max_rss_mb)
+    print(f"\n>> complete autotune in {elapsed_end(program_started)}\n")
+    if best is None:
+        print(f"==> No successful trial{f' within {max_rss_mb:,.0f} MB' if max_rss_mb else ''}; no profile written")
+        return None
+
+    sample = {"day": date_tag, "at_hour": at_hour, "audio_base_dir": audio_base_dir}
+    save_profile(profile_filename, best, trials, sample)
+    print(f"==> Best: {TrialSettings(**best['settings'])}")
+    print(f"    {best['audio_seconds_per_second']:,.1f} audio-s/s, peak RSS {best['peak_rss_mb']:,.1f} MB")
+    print(f"    saved to {profile_filename}")
+    return best
+
+
+def parse_threads(value: str) -> int | None:
+    """A thread count, with 0 for TensorFlow's default."""
+    return int(value) or None
+
+
+def parse_arguments():
+    """CLI definition."""
+    from hwsd.apply_model import AUDIO_BASE_DIR
+
+    parser = ArgumentParser(description=USAGE, formatter_class=RawTextHelpFormatter)
+    parser.add_argument("day", metavar="YYYY/MM/DD", help="Sample day to score in the trials.")
+    parser.add_argument(
+        "--at-hour",
+        type=int,
+        metavar="H",
+        default=0,
+        help="Hour of the sample day at which each trial starts. By default, 0.",
+    )
+    parser.add_argument(
+        "--hours-per-call",
+        type=int,
+        nargs="+",
+        metavar="h",
+        default=DEFAULT_HOURS_PER_CALL,
+        help=f"Segment hours (HOURS_PER_CALL) to try. By default, {DEFAULT_HOURS_PER_CALL}.",
+    )
+    parser.add_argument(
+        "--model-minutes",
+        type=int,
+        nargs="+",
+        metavar="m",
+        default=DEFAULT_MODEL_MINUTES,
+        help=f"Chunk minutes (MODEL_MINUTES) to try. By default, {DEFAULT_MODEL_MINUTES}.",
+    )
+    parser.add_argument(
+        "--batch-sizes",
+        type=int,
+        nargs="+",
+        metavar="n",
+        default=DEFAULT_BATCH_SIZES,
+        help=f"Batch sizes to try. By default, {DEFAULT_BATCH_SIZES}.",
+    )
+    parser.add_argument(
+        "--intra-op-threads",
+        type=parse_threads,
+        nargs="+",
+        metavar="n",
+        default=DEFAULT_THREADS,
+        help="TensorFlow intra-op thread counts to try, 0 for TensorFlow's default. By default, 0.",
+    )
+    parser.add_argument(
+        "--inter-op-threads",
+        type=parse_threads,
+        nargs="+",
+        metavar="n",
+        default=DEFAULT_THREADS,
+        help="TensorFlow inter-op thread counts to try, 0 for TensorFlow's default. By default, 0.",
+    )
+    parser.add_argument(
+        "--max-rss-mb",
+        type=float,
+        metavar="MB",
+        default=None,
+        help="Only consider the trials with at most this peak RSS. By default, no limit.",
+    )
+    parser.add_argument(
+        "--audio-base-dir",
+        type=str,
+        metavar="dir",
+        default=AUDIO_BASE_DIR,
+        help=f"Audio base directory. By default, {AUDIO_BASE_DIR}.",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        metavar="file",
+        default=get_profile_filename() or DEFAULT_PROFILE_FILENAME,
+        help=f"Profile to write. By default, $HWSD_TUNING_PROFILE or {DEFAULT_PROFILE_FILENAME}.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        opts = parse_arguments()
+        days = parse_days(opts.day)
+        if len(days) != 1:
+            print(f"ERROR: expecting a single day, got `{opts.day}`")
+            sys.exit(1)
+        best_trial = tune(
+            days[0],
+            make_grid(
+                opts.hours_per_call,
+                opts.model_minutes,
+                opts.batch_sizes,
+                opts.intra_op_threads,
+                opts.inter_op_threads,
+            ),
+            opts.audio_base_dir,
+            opts.at_hour,
+            opts.max_rss_mb,
+            opts.profile,
+        )
+        if best_trial is None:
+            sys.exit(1)
+    else:
+        print(USAGE)
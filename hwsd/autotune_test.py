@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from hwsd.autotune import TrialSettings, choose_best, load_profile, make_grid, save_profile
+
+
+class Test(unittest.TestCase):
+    def test_make_grid(self):
+        grid = make_grid([1, 3], [30, 60], [1, 4], [None], [1, 2])
+        # a batch of 4 chunks of 30 minutes doesn't fit in 1 hour, nor of 60 minutes in 1 or 3 hours:
+        self.assertEqual(len(grid), 10)
+        self.assertNotIn(TrialSettings(1, 30, 4, None, 1), grid)
+        self.assertIn(TrialSettings(3, 30, 4, None, 2), grid)
+
+    def test_choose_best(self):
+        trials = [
+            {"settings": {}, "audio_seconds_per_second": 100.0, "peak_rss_mb": 900.0},
+            {"settings": {}, "audio_seconds_per_second": 80.0, "peak_rss_mb": 500.0},
+            {"settings": {}, "error": "exit code -9"},
+        ]
+        self.assertIs(choose_best(trials), trials[0])
+        self.assertIs(choose_best(trials, max_rss_mb=600), trials[1])
+        self.assertIsNone(choose_best(trials, max_rss_mb=100))
+
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = f"{tmp_dir}/hwsd-tuning.json"
+            settings = TrialSettings(3, 30, 2, 8, None)
+            best = {"settings": settings._asdict(), "audio_seconds_per_second": 50.0, "peak_rss_mb": 700.0}
+            save_profile(filename, best, [best], {"day": "2016-11-01"})
+
+            with mock.patch.dict(os.environ, {"HWSD_TUNING_PROFILE": filename}):
+                self.assertEqual(load_profile(), settings)
+            with mock.patch.dict(os.environ, {"HWSD_TUNING_PROFILE": "none"}):
+                self.assertIsNone(load_profile())
+
+            with open(filename, "w") as f:
+                f.write("{}")
+            self.assertIsNone(load_profile(filename))
+
+
+if __name__ == "__main__":
+    unittest.main()
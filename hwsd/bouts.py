@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Song bout extraction from the 1-second scores.
+
+A bout is a run of scores at or above a `low` threshold that reaches a `high`
+threshold at least once (hysteresis). Bouts separated by no more than
+`max_gap_seconds` are merged, and then those shorter than `min_seconds` are
+dropped. Missing (NaN) scores are taken as below the thresholds.
+
+Everything is done with vectorized run-length encoding over the concatenated
+days, so bouts crossing midnight (or the end of a year) are kept intact.
+The days are processed in blocks (of a year by default), with any bout
+still open at the end of a block carried over to the next.
+
+See USAGE.
+"""
+
+import csv
+import os
+import sys
+import time
+from argparse import ArgumentParser, RawTextHelpFormatter
+from collections.abc import Iterator
+from datetime import date, timedelta
+
+import numpy as np
+
+from hwsd.file_helper import DAY_SECONDS, DEFAULT_SCORE_BASE_DIR
+from hwsd.misc import elapsed_end, parse_days
+
+# Table of extracted bouts, with `end` exclusive.
+BOUT_DTYPE = np.dtype([("start", "datetime64[s]"), ("end", "datetime64[s]"), ("peak", "f4"), ("mean", "f4")])
+
+DEFAULT_HIGH = 0.9
+DEFAULT_LOW = 0.5
+DEFAULT_MIN_SECONDS = 10
+DEFAULT_MAX_GAP_SECONDS = 60
+
+USAGE = """
+hwsd/bouts.py: Extracts song bouts from the scores into a CSV table.
+Usage:
+    $ hwsd/bouts.py [--high h] [--low l] [--min-seconds s] [--max-gap-seconds g] [--output file] time-interval ...
+with time intervals as in hwsd/apply_model.py. See README.md for more details.
+"""
+
+
+def find_runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """See test_find_runs"""
+    edges = np.diff(mask.astype(np.int8), prepend=0, append=0)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def merge_runs(starts: np.ndarray, ends: np.ndarray, max_gap: int) -> tuple[np.ndarray, np.ndarray]:
+    """Merges the consecutive runs separated by no more than `max_gap`."""
+    if len(starts) < 2:
+        return starts, ends
+    separate = starts[1:] - ends[:-1] > max_gap
+    return np.concatenate((starts[:1], starts[1:][separate])), np.concatenate((ends[:-1][separate], ends[-1:]))
+
+
+def _reduce_runs(ufunc: np.ufunc, values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """ufunc reduction of `values` over each [start, end) run (all non-empty)."""
+    # a sentinel, as reduceat indices must be in range:
+    extended = np.concatenate((values, values[:1]))
+    return ufunc.reduceat(extended, np.column_stack((starts, ends)).ravel())[::2]
+
+
+def find_bouts(
+    scores: np.ndarray,
+    high: float = DEFAULT_HIGH,
+    low: float = DEFAULT_LOW,
+    max_gap_seconds: int = DEFAULT_MAX_GAP_SECONDS,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the bouts in the given scores, before applying the minimum duration.
+
+    :return:  (starts, ends), with `ends` exclusive
+    """
+    filled = np.where(np.isnan(scores), -np.inf, scores)
+    starts, ends = find_runs(filled >= low)
+    if len(starts) > 0:
+        reaches_high = _reduce_runs(np.maximum, filled, starts, ends) >= high
+        starts, ends = starts[reaches_high], ends[reaches_high]
+    return merge_runs(starts, ends, max_gap_seconds)
+
+
+def describe_bouts(scores: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    :return:  (peaks, means) for the given bouts, with the mean over the
+              non-missing scores in the bout (including any merged gaps).
+    """
+    if len(starts) == 0:
+        return np.zeros(0, np.float32), np.zeros(0, np.float32)
+    valid = ~np.isnan(scores)
+    peaks = _reduce_runs(np.maximum, np.where(valid, scores, -np.inf), starts, ends)
+    sums = _reduce_runs(np.add, np.where(valid, scores, 0).astype(np.float64), starts, ends)
+    counts = _reduce_runs(np.add, valid.astype(np.int64), starts, ends)
+    return peaks.astype(np.float32), (sums / counts).astype(np.float32)
+
+
+def extract_bouts(
+    scores: np.ndarray,
+    high: float = DEFAULT_HIGH,
+    low: float = DEFAULT_LOW,
+    min_seconds: int = DEFAULT_MIN_SECONDS,
+    max_gap_seconds: int = DEFAULT_MAX_GAP_SECONDS,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Extracts the bouts in the given scores (see module docstring).
+
+    :return:  (starts, ends, peaks, means), see find_bouts and describe_bouts.
+    """
+    starts, ends = find_bouts(scores, high, low, max_gap_seconds)
+    long_enough = ends - starts >= min_seconds
+    starts, ends = starts[long_enough], ends[long_enough]
+    return starts, ends, *describe_bouts(scores, starts, ends)
+
+
+def iter_score_blocks(
+    start: date,
+    end: date,
+    score_base_dir: str = DEFAULT_SCORE_BASE_DIR,
+    use_archive: bool = False,
+    block_days: int = 366,
+) -> Iterator[np.ndarray]:
+    """
+    Reads the scores for the days from `start` to `end` (inclusive), as
+    consecutive float32 blocks of up to `block_days` days, with NaN for
+    missing days. The per-day score files are memory mapped; with
+    `use_archive`, each block is read from the per-year archives.
+    """
+    from hwsd.score_archive import read_days
+
+    current = start
+    while current <= end:
+        num_days = min(block_days, (end - current).days + 1)
+        if use_archive:
+            block = read_days(current, current + timedelta(days=num_days - 1), score_base_dir).astype(np.float32)
+        else:
+            block = np.full((num_days, DAY_SECONDS), np.nan, dtype=np.float32)
+            for i in range(num_days):
+                day = current + timedelta(days=i)
+                filename = f"{score_base_dir}/{day.year:04}/{day.month:02}/Scores-{day:%Y%m%d}.npy"
+                if os.path.isfile(filename):
+                    block[i] = np.load(filename, mmap_mode="r")
+        yield block.ravel()
+        current += timedelta(days=num_days)
+
+
+def extract_bouts_range(
+    start: date,
+    end: date,
+    high: float = DEFAULT_HIGH,
+    low: float = DEFAULT_LOW,
+    min_seconds: int = DEFAULT_MIN_SECONDS,
+    max_gap_seconds: int = DEFAULT_MAX_GAP_SECONDS,
+    score_base_dir: str = DEFAULT_SCORE_BASE_DIR,
+    use_archive: bool = False,
+    block_days: int = 366,
+) -> np.ndarray:
+    """
+    Extracts the bouts for the days from `start` to `end` (inclusive).
+
+    :return:  Bout table (BOUT_DTYPE), in chronological order.
+    """
+    tables = []
+    origin = np.datetime64(start, "s")
+    # Trailing scores of the previous block that may still be part of an open bout:
+    carry = np.zeros(0, dtype=np.float32)
+    offset = 0  # position of `carry` in seconds from `origin`
+    blocks = iter_score_blocks(start, end, score_base_dir, use_archive, block_days)
+    block = next(blocks)
+    while block is not None:
+        next_block = next(blocks, None)
+        scores = np.concatenate((carry, block)) if len(carry) else block
+        starts, ends = find_bouts(scores, high, low, max_gap_seconds)
+
+        keep_from = len(scores)
+        if next_block is not None:
+            # A run at or above `low` reaching the end may continue in the next block:
+            below = np.flatnonzero(~(scores >= low))
+            keep_from = below[-1] + 1 if len(below) else 0
+            # and bouts ending within max_gap_seconds of the end may be merged with upcoming ones:
+            open_bouts = np.flatnonzero(ends >= len(scores) - max_gap_seconds)
+            if len(open_bouts):
+                keep_from = min(keep_from, starts[open_bouts[0]])
+            final = starts < keep_from
+            starts, ends = starts[final], ends[final]
+        long_enough = ends - starts >= min_seconds
+        starts, ends = starts[long_enough], ends[long_enough]
+        peaks, means = describe_bouts(scores, starts, ends)
+
+        table = np.zeros(len(starts), dtype=BOUT_DTYPE)
+        table["start"] = origin + (offset + starts).astype("timedelta64[s]")
+        table["end"] = origin + (offset + ends).astype("timedelta64[s]")
+        table["peak"] = peaks
+        table["mean"] = means
+        tables.append(table)
+
+        carry = scores[keep_from:]
+        offset += keep_from
+        block = next_block
+
+    return np.concatenate(tables)
+
+
+def write_bouts_csv(filename: str, bouts: np.ndarray) -> None:
+    """Writes the bout table as CSV, with times in UTC (ISO 8601)."""
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["start", "end", "duration_seconds", "peak", "mean"])
+        durations = (bouts["end"] - bouts["start"]).astype(np.int64)
+        for bout, duration in zip(bouts, durations, strict=True):
+            writer.writerow(
+                [f"{bout['start']}Z", f"{bout['end']}Z", duration, f"{bout['peak']:.4f}", f"{bout['mean']:.4f}"]
+            )
+
+
+def get_date_ranges(years_months_days: list[tuple[int, int, int]]) -> list[tuple[date, date]]:
+    """Groups the given days into ranges of consecutive days."""
+    ranges: list[tuple[date, date]] = []
+    for day in sorted({date(*ymd) for ymd in years_months_days}):
+        if ranges and (day - ranges[-1][1]).days == 1:
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+
+def parse_arguments():
+    """CLI definition."""
+    parser = ArgumentParser(description=USAGE, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "intervals",
+        nargs="+",
+        metavar="time-interval",
+        help="Of the form yearRange/monthRange/dayRange or yearRange/monthRange.",
+    )
+    parser.add_argument(
+        "--high",
+        type=float,
+        metavar="h",
+        default=DEFAULT_HIGH,
+        help=f"Score that a bout must reach. By default, {DEFAULT_HIGH}.",
+    )
+    parser.add_argument(
+        "--low",
+        type=float,
+        metavar="l",
+        default=DEFAULT_LOW,
+        help=f"Score at or above which a bout continues. By default, {DEFAULT_LOW}.",
+    )
+    parser.add_argument(
+        "--min-seconds",
+        type=int,
+        metavar="s",
+        default=DEFAULT_MIN_SECONDS,
+        help=f"Minimum bout duration (after merging). By default, {DEFAULT_MIN_SECONDS}.",
+    )
+    parser.add_argument(
+        "--max-gap-seconds",
+        type=int,
+        metavar="g",
+        default=DEFAULT_MAX_GAP_SECONDS,
+        help=f"Bouts separated by no more than this are merged. By default, {DEFAULT_MAX_GAP_SECONDS}.",
+    )
+    parser.add_argument(
+        "--score-base-dir",
+        type=str,
+        metavar="dir",
+        default=DEFAULT_SCORE_BASE_DIR,
+        help=f"Score base directory. By default, {DEFAULT_SCORE_BASE_DIR}.",
+    )
+    parser.add_argument(
+        "--use-archive",
+        action="store_true",
+        default=False,
+        help="Read the scores from the per-year score archives instead of the per-day files.",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        metavar="file",
+        default="bouts.csv",
+        help="Output CSV file. By default, bouts.csv.",
+    )
+    return parser.parse_args()
+
+
+def main(opts) -> None:
+    started = time.time()
+    all_bouts = []
+    for start, end in get_date_ranges(parse_days(*opts.intervals)):
+        print(f"==> Extracting bouts from {start} to {end}")
+        all_bouts.append(
+            extract_bouts_range(
+                start,
+                end,
+                opts.high,
+                opts.low,
+                opts.min_seconds,
+                opts.max_gap_seconds,
+                opts.score_base_dir,
+                opts.use_archive,
+            )
+        )
+    bouts = np.concatenate(all_bouts) if all_bouts else np.zeros(0, dtype=BOUT_DTYPE)
+    write_bouts_csv(opts.output, bouts)
+    print(f"==> {len(bouts):,} bouts written to {opts.output} in {elapsed_end(started)}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(parse_arguments())
+    else:
+        print(USAGE)
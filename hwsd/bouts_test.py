@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+import numpy as np
+
+from hwsd.bouts import extract_bouts, extract_bouts_range, find_runs, get_date_ranges
+from hwsd.file_helper import DAY_SECONDS
+
+
+class Test(unittest.TestCase):
+    def test_find_runs(self):
+        starts, ends = find_runs(np.array([1, 1, 0, 0, 1, 0, 1, 1], dtype=bool))
+        self.assertEqual(starts.tolist(), [0, 4, 6])
+        self.assertEqual(ends.tolist(), [2, 5, 8])
+        starts, ends = find_runs(np.zeros(3, dtype=bool))
+        self.assertEqual((starts.tolist(), ends.tolist()), ([], []))
+
+    def test_extract_bouts(self):
+        scores = np.zeros(100)
+        scores[10:20] = 0.6  # never reaches high
+        scores[30:40] = 0.6
+        scores[35] = 0.95
+        scores[43:50] = 0.7  # merged with the previous one (gap of 3)
+        scores[44] = 0.92
+        scores[46] = np.nan  # ends it, as the run 47-50 doesn't reach high
+        scores[80:82] = 0.99  # too short
+        starts, ends, peaks, means = extract_bouts(scores, high=0.9, low=0.5, min_seconds=5, max_gap_seconds=3)
+        self.assertEqual(starts.tolist(), [30])
+        self.assertEqual(ends.tolist(), [46])
+        self.assertAlmostEqual(float(peaks[0]), 0.95, places=5)
+        self.assertAlmostEqual(float(means[0]), (9 * 0.6 + 0.95 + 2 * 0.7 + 0.92) / 16, places=5)
+
+    def test_extract_bouts_range_across_days(self):
+        rng = np.random.default_rng(0)
+        days = [date(2019, 12, 31), date(2020, 1, 1), date(2020, 1, 2)]
+        all_scores = rng.random(len(days) * DAY_SECONDS) ** 4
+        all_scores[DAY_SECONDS - 50 : DAY_SECONDS + 50] = 0.95  # crossing midnight
+        all_scores[2 * DAY_SECONDS - 5 : 2 * DAY_SECONDS + 5] = np.nan
+        with tempfile.TemporaryDirectory() as base_dir:
+            for i, day in enumerate(days):
+                os.makedirs(f"{base_dir}/{day.year:04}/{day.month:02}", exist_ok=True)
+                day_scores = all_scores[i * DAY_SECONDS : (i + 1) * DAY_SECONDS]
+                np.save(f"{base_dir}/{day.year:04}/{day.month:02}/Scores-{day:%Y%m%d}.npy", day_scores)
+
+            expected = extract_bouts(all_scores.astype(np.float32), 0.9, 0.5, 3, 10)
+            for block_days in (1, 2, 3):
+                bouts = extract_bouts_range(days[0], days[-1], 0.9, 0.5, 3, 10, base_dir, block_days=block_days)
+                origin = np.datetime64("2019-12-31T00:00:00")
+                self.assertEqual((bouts["start"] - origin).astype(int).tolist(), expected[0].tolist())
+                self.assertEqual((bouts["end"] - origin).astype(int).tolist(), expected[1].tolist())
+                np.testing.assert_array_equal(bouts["peak"], expected[2])
+                np.testing.assert_allclose(bouts["mean"], expected[3], rtol=1e-6)
+            # the bout crossing midnight is kept intact:
+            crossing = (bouts["start"] <= np.datetime64("2019-12-31T23:59:10")) & (
+                bouts["end"] >= np.datetime64("2020-01-01T00:00:50")
+            )
+            self.assertEqual(crossing.sum(), 1)
+
+    def test_get_date_ranges(self):
+        ranges = get_date_ranges([(2020, 3, 1), (2020, 2, 28), (2020, 2, 29), (2020, 3, 5)])
+        self.assertEqual(ranges, [(date(2020, 2, 28), date(2020, 3, 1)), (date(2020, 3, 5), date(2020, 3, 5))])
@@ -4,67 +4,272 @@ File handling utilities.
 
 import os
 import sys
+from collections.abc import Iterator
+from datetime import date, timedelta
 from math import ceil, floor
+from typing import TYPE_CHECKING
 
 import numpy as np
 import soundfile as sf
 
+from hwsd.metrics import span
+from hwsd.misc import create_filled_npy
+from hwsd.provenance import audio_key, make_key
+from hwsd.resample import load_resampled
+from hwsd.resample_cache import ResampleCache, get_resample_cache
+
+if TYPE_CHECKING:
+    from hwsd.score_archive import ScoreArchive
+
 DEFAULT_AUDIO_BASE_DIR = "/mnt/PAM_Analysis/GoogleHumpbackModel/decimated_10kHz"
 
 DEFAULT_SCORE_BASE_DIR = "/mnt/PAM_Analysis/GoogleHumpbackModel/Scores"
 
+DAY_SECONDS = 24 * 60 * 60
+
+# Audio sample rates, per the suffix of the audio base directory (and of the files in it).
+# 10kHz is the rate expected by the model; 16kHz files are resampled in-process.
+AUDIO_RATES = {"10kHz": 10_000, "16kHz": 16_000}
+
+# The audio files have the voltage scaled by 1/3.
+VOLTS_SCALE = 3.0
+
+
+class AudioStream:
+    """
+    Reads segments of an audio file through a persistent SoundFile handle,
+    as float32, into a ring of `slots` preallocated buffers of up to
+    `block_samples` each, scaled by `scale` in place (by default, to volts).
+
+    Each returned segment is a view onto one of the buffers, so it is only
+    valid until `slots` further reads: size `slots` to the segments the
+    caller holds at once (e.g., a batch of chunks along with those being
+    prefetched). Longer segments are read into new arrays.
+    """
+
+    def __init__(self, filename: str, block_samples: int, slots: int = 2, scale: float = VOLTS_SCALE):
+        assert slots >= 1, slots
+        self.filename: str = filename
+        self.scale: float = scale
+        self._sound_file = sf.SoundFile(filename)
+        self.sample_rate: int = self._sound_file.samplerate
+        self.frames: int = self._sound_file.frames
+        channels = self._sound_file.channels
+        shape = (slots, block_samples) if channels == 1 else (slots, block_samples, channels)
+        self._buffers: np.ndarray = np.empty(shape, dtype=np.float32)
+        self._next_slot: int = 0
+
+    def read(self, start_sample: int, num_samples: int) -> np.ndarray:
+        """Reads up to `num_samples` starting at `start_sample` (fewer at the end of the file)."""
+        start_sample = min(start_sample, self.frames)
+        num_samples = max(0, min(num_samples, self.frames - start_sample))
+        self._sound_file.seek(start_sample)
+        if num_samples <= self._buffers.shape[1]:
+            psound = self._sound_file.read(dtype="float32", out=self._buffers[self._next_slot, :num_samples])
+            self._next_slot = (self._next_slot + 1) % len(self._buffers)
+        else:
+            psound = self._sound_file.read(num_samples, dtype="float32")
+        if psound.ndim > 1:
+            psound = psound[:, 0]
+        if self.scale != 1:
+            np.multiply(psound, self.scale, out=psound)
+        return psound
+
+    def close(self) -> None:
+        self._sound_file.close()
+
+    def __enter__(self) -> "AudioStream":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
 
 class FileHelper:
     """
     Helps loading audio segments, as well as initializing
     and updating score files.
+
+    The audio base directory is expected to end with `10kHz` or `16kHz`,
+    in the latter case with the audio resampled to 10kHz as it's loaded,
+    in bounded memory (see hwsd/resample.py).
+
+    With `use_archive`, the scores are kept in the per-year
+    score archive (see hwsd/score_archive.py) instead of
+    in per-day score files.
+
+    With resampling and the resample cache enabled (see hwsd/resample_cache.py),
+    the selected day's file is resampled as a whole into the cache (unless
+    already there) upon the first read of its audio, which is then read from
+    the cached 10kHz file; selecting a day alone (e.g., to check its scores)
+    doesn't resample it.
     """
 
     def __init__(
         self,
         audio_base_dir: str = DEFAULT_AUDIO_BASE_DIR,
         score_base_dir: str = DEFAULT_SCORE_BASE_DIR,
+        use_archive: bool = False,
     ):
-        if not audio_base_dir.endswith("10kHz"):
-            print(f"ERROR: Expecting audio_base_dir to end with `10kHz`: {audio_base_dir}")
+        rate_tags = [tag for tag in AUDIO_RATES if audio_base_dir.rstrip("/").endswith(tag)]
+        if not rate_tags:
+            print(f"ERROR: Expecting audio_base_dir to end with one of {list(AUDIO_RATES)}: {audio_base_dir}")
             sys.exit(1)
 
         self.audio_base_dir: str = audio_base_dir
+        self.audio_rate_tag: str = rate_tags[0]
+        self.audio_sample_rate: int = AUDIO_RATES[self.audio_rate_tag]
         self.score_base_dir: str = score_base_dir
         self.audio_filename: str | None = None
         self.score_filename: str | None = None
+        self.manifest_filename: str | None = None
+        self.ltsa_filename: str | None = None
+        self.skipped_filename: str | None = None
+        self.use_archive: bool = use_archive
         self.year: int = 0
         self.month: int = 0
         self.day: int = 0
+        self._audio_stream: AudioStream | None = None
+        self.resample_cache: ResampleCache | None = get_resample_cache() if self.resampling else None
+        # source audio file -> its resampled version in the cache:
+        self._cached_filenames: dict[str, str] = {}
 
     @property
     def sample_rate(self) -> int:
-        """The handled sample rate, 10kHz."""
+        """The handled sample rate, 10kHz, regardless of that of the audio files."""
         return 10_000
 
+    @property
+    def resampling(self) -> bool:
+        """Whether the audio files are resampled as loaded."""
+        return self.audio_sample_rate != self.sample_rate
+
+    def _get_audio_filename(self, year: int, month: int, day: int) -> str:
+        simple_name = f"MARS-{year:04}{month:02}{day:02}T000000Z-{self.audio_rate_tag}.wav"
+        return f"{self.audio_base_dir}/{year:04}/{month:02}/{simple_name}"
+
+    def _get_adjacent_audio_filename(self, days: int) -> str | None:
+        """
+        Audio file for the day `days` away from the selected one, if it exists.
+        A preceding day's file is only returned if complete, so its end is
+        actually contiguous with the start of the selected day.
+        """
+        adjacent = date(self.year, self.month, self.day) + timedelta(days=days)
+        filename = self._get_audio_filename(adjacent.year, adjacent.month, adjacent.day)
+        if not os.path.isfile(filename):
+            return None
+        if days < 0 and sf.info(filename).duration < DAY_SECONDS:
+            return None
+        return filename
+
+    def _get_cached_filename(self, filename: str) -> str | None:
+        """
+        The resampled version of the given audio file in the cache, if any,
+        first creating it for the selected day's file.
+        """
+        if self.resample_cache is None:
+            return None
+        if filename not in self._cached_filenames:
+            if filename == self.audio_filename:
+                cached_filename = self.resample_cache.resample(filename, self.sample_rate)
+            else:
+                cached_filename = self.resample_cache.get(filename, self.sample_rate)
+            if cached_filename is None:
+                return None
+            self._cached_filenames[filename] = cached_filename
+        return self._cached_filenames[filename]
+
+    def _read_samples(self, filename: str, start_sample: int, num_samples: int) -> np.ndarray:
+        """
+        Reads samples (in terms of the handled sample rate) from the given file,
+        resampling if needed (unless in the resample cache), and converted to volts.
+        Reads from the selected day's file go through its audio stream, if open.
+        """
+        filename = self._get_cached_filename(filename) or filename
+        resampling = self.resampling and filename not in self._cached_filenames.values()
+        stream = self._audio_stream
+        with span("read", resampling=resampling) as fields:
+            if stream is not None and filename == stream.filename:
+                # (already converted to volts)
+                psound = stream.read(start_sample, num_samples)
+            elif resampling:
+                psound = load_resampled(filename, self.sample_rate, start_sample, num_samples)
+                psound *= VOLTS_SCALE
+            else:
+                psound, sample_rate = sf.read(filename, start=start_sample, frames=num_samples, dtype="float32")
+                assert self.sample_rate == sample_rate  # sanity check
+                # convert scaled voltage to volts:
+                psound *= VOLTS_SCALE
+            fields["samples"] = len(psound)
+            fields["bytes"] = psound.nbytes
+
+        return psound
+
     def select_day(self, year: int, month: int, day: int) -> bool:
         """
         Selects a particular day, from which segments can then be loaded.
 
         :return:  True only if corresponding audio file exists.
         """
-        simple_name = f"MARS-{year:04}{month:02}{day:02}T000000Z-10kHz.wav"
-        self.audio_filename = f"{self.audio_base_dir}/{year:04}/{month:02}/{simple_name}"
+        self.close_audio_stream()
+        self.audio_filename = self._get_audio_filename(year, month, day)
         print(f"select_day {year:04}-{month:02}-{day:02}: {self.audio_filename}")
 
         if not os.path.isfile(self.audio_filename):
             print(f"ERROR: {self.audio_filename}: file not found\n")
             return False
 
-        scores_dest_dir = f"{self.score_base_dir}/{year:04}/{month:02}"
-        os.makedirs(scores_dest_dir, exist_ok=True)
-        self.score_filename = f"{scores_dest_dir}/Scores-{year:04}{month:02}{day:02}.npy"
+        # (the day's file is resampled into the cache, if enabled, upon its first read)
+        self._cached_filenames = {}
+
+        if self.use_archive:
+            from hwsd.score_archive import ScoreArchive
+
+            self.score_filename = ScoreArchive(year, self.score_base_dir).filename
+        else:
+            scores_dest_dir = f"{self.score_base_dir}/{year:04}/{month:02}"
+            os.makedirs(scores_dest_dir, exist_ok=True)
+            self.score_filename = f"{scores_dest_dir}/Scores-{year:04}{month:02}{day:02}.npy"
+        # per day, also with use_archive:
+        day_tag = f"{year:04}{month:02}{day:02}"
+        self.manifest_filename = f"{self.score_base_dir}/{year:04}/{month:02}/Scores-{day_tag}.json"
+        self.ltsa_filename = f"{self.score_base_dir}/{year:04}/{month:02}/LTSA-{day_tag}.npy"
+        self.skipped_filename = f"{self.score_base_dir}/{year:04}/{month:02}/Skipped-{day_tag}.npy"
 
         self.year = year
         self.month = month
         self.day = day
         return True
 
+    def audio_whole_seconds(self) -> int:
+        """The whole seconds of audio in the selected day's file."""
+        assert self.audio_filename is not None
+        return int(sf.info(self.audio_filename).duration)
+
+    def open_audio_stream(self, block_seconds: int, slots: int = 2) -> None:
+        """
+        Keeps the selected day's file open for the subsequent reads (until
+        `close_audio_stream` or another day is selected), reading segments of
+        up to `block_seconds` into a ring of `slots` reusable buffers, so each
+        read returns a view only valid until `slots` further reads (see AudioStream).
+        Not used with resampling (other than from the resample cache),
+        as that already reads in bounded blocks.
+        """
+        assert self.audio_filename is not None
+        self.close_audio_stream()
+        filename = self._get_cached_filename(self.audio_filename)
+        if filename is None:
+            if self.resampling:
+                return
+            filename = self.audio_filename
+        self._audio_stream = AudioStream(filename, block_seconds * self.sample_rate, slots)
+        assert self._audio_stream.sample_rate == self.sample_rate  # sanity check
+
+    def close_audio_stream(self) -> None:
+        if self._audio_stream is not None:
+            self._audio_stream.close()
+            self._audio_stream = None
+
     def load_audio_segment(
         self, at_hour: int = 0, at_minute: int = 0, hours: int = 0, minutes: int = 0
     ) -> tuple[np.ndarray, int]:
@@ -84,23 +289,101 @@ class FileHelper:
         num_samples = ceil(psound_segment_seconds * self.sample_rate)
 
         print(f"Loading {num_samples:,} samples starting at {start_sample:,}")
-        psound_segment, sample_rate = sf.read(
-            self.audio_filename,
-            start=start_sample,
-            frames=num_samples,
-            dtype="float32",
-        )
-
-        assert self.sample_rate == sample_rate  # sanity check
+        psound_segment = self._read_samples(self.audio_filename, start_sample, num_samples)
 
         print(f"    num_samples         = {num_samples:,}")
         print(f"    len(psound_segment) = {len(psound_segment):,}")
 
-        # convert scaled voltage to volts:
-        psound_segment *= 3
-
         return psound_segment, psound_segment_seconds
 
+    def iter_audio_segment(self, start_second: int, seconds: int, block_seconds: int = 600) -> Iterator[np.ndarray]:
+        """
+        Reads `seconds` of audio from the selected day starting at `start_second`,
+        in consecutive blocks of up to `block_seconds`, so a long segment can be
+        processed in bounded memory. Stops early at the end of the file.
+        """
+        assert self.audio_filename is not None
+
+        for offset in range(0, seconds, block_seconds):
+            block_samples = min(block_seconds, seconds - offset) * self.sample_rate
+            block = self._read_samples(self.audio_filename, (start_second + offset) * self.sample_rate, block_samples)
+            if len(block):
+                yield block
+            if len(block) < block_samples:
+                return
+
+    def load_audio_with_context(
+        self,
+        start_second: int,
+        seconds: int,
+        context_seconds: int,
+        cross_midnight: bool = False,
+    ) -> tuple[np.ndarray, int]:
+        """
+        Loads `seconds` of audio from the selected day starting at `start_second`,
+        along with up to `context_seconds` of the adjacent audio on each side.
+
+        The context is limited to the selected day's file, unless `cross_midnight`
+        is given, in which case context beyond midnight is taken from the
+        previous/next day's file, if available and contiguous.
+
+        :return: (signal, leading context in seconds)
+        """
+        assert self.audio_filename is not None
+
+        rate = self.sample_rate
+        left_seconds = min(context_seconds, start_second)
+        end_second = start_second + seconds + context_seconds
+        if cross_midnight:
+            # anything beyond midnight is taken from the next day's file:
+            end_second = min(end_second, DAY_SECONDS)
+        num_samples = (end_second - start_second + left_seconds) * rate
+        psound = self._read_samples(self.audio_filename, (start_second - left_seconds) * rate, num_samples)
+
+        if not cross_midnight:
+            return psound, left_seconds
+
+        parts = [psound]
+        if left_seconds < context_seconds:
+            prev_filename = self._get_adjacent_audio_filename(-1)
+            if prev_filename is not None:
+                prev_seconds = context_seconds - left_seconds
+                print(f"    context: {prev_seconds}s from the end of {prev_filename}")
+                parts.insert(
+                    0, self._read_samples(prev_filename, (DAY_SECONDS - prev_seconds) * rate, prev_seconds * rate)
+                )
+                left_seconds = context_seconds
+
+        next_seconds = start_second + seconds + context_seconds - DAY_SECONDS
+        # (only if the selected day's audio actually reaches midnight)
+        if next_seconds > 0 and len(psound) == num_samples:
+            next_filename = self._get_adjacent_audio_filename(1)
+            if next_filename is not None:
+                print(f"    context: {next_seconds}s from the start of {next_filename}")
+                parts.append(self._read_samples(next_filename, 0, next_seconds * rate))
+
+        return (np.concatenate(parts) if len(parts) > 1 else psound), left_seconds
+
+    def get_provenance_key(self, model: str | None, params: dict, cross_midnight: bool = False) -> dict:
+        """
+        Provenance key (see hwsd/provenance.py) for the scores of the selected day.
+        With `cross_midnight`, the adjacent days' audio files are also included,
+        as their audio is used as context at midnight.
+        """
+        assert self.audio_filename is not None
+
+        filenames = [self.audio_filename]
+        if cross_midnight:
+            for days in (-1, 1):
+                adjacent_filename = self._get_adjacent_audio_filename(days)
+                if adjacent_filename is not None:
+                    filenames.append(adjacent_filename)
+        audio = [audio_key(filename) for filename in filenames]
+        resampling = "none"
+        if self.resampling:
+            resampling = self.resample_cache.resampling if self.resample_cache is not None else "in-process"
+        return make_key(audio, model, params, resampling)
+
     def load_day_scores(self) -> np.ndarray:
         """
         Loads the score array for the selected day, initializing the
@@ -109,20 +392,117 @@ class FileHelper:
         """
         assert self.score_filename is not None
 
+        if self.use_archive:
+            print(f"\n==> Loading score array from {self.score_filename}")
+            return self._get_score_archive().read_day(self.month, self.day).astype(np.float64)
+
         if os.path.isfile(self.score_filename):
             print(f"\n==> Loading score array {self.score_filename}")
             day_scores = np.load(self.score_filename)
         else:
             print(f"\n==> Initializing score array {self.score_filename}")
-            day_scores = np.full(24 * 60 * 60, np.nan)
+            day_scores = np.full(DAY_SECONDS, np.nan)
             np.save(self.score_filename, day_scores)
 
         return day_scores
 
-    def save_day_scores(self, day_scores: np.ndarray) -> None:
+    def open_day_scores(self) -> np.memmap:
         """
-        Updates the score file for the selected day.
+        Opens the score array for the selected day as a memory map onto the
+        score file, initializing the file if not already created.
+        Scores assigned to the array can be written to the file in place
+        with `flush()`, with no need to call `save_day_scores`.
+        (With `use_archive`, this is the day's float16 row in the archive.)
+        :return: Memory-mapped day score array
+        """
+        assert self.score_filename is not None
+
+        if self.use_archive:
+            print(f"\n==> Opening score array in {self.score_filename}")
+            archive = self._get_score_archive()
+            return archive.open(writable=True)[archive.day_index(self.month, self.day)]
+
+        if os.path.isfile(self.score_filename):
+            print(f"\n==> Opening score array {self.score_filename}")
+            return np.lib.format.open_memmap(self.score_filename, mode="r+")
+
+        print(f"\n==> Initializing score array {self.score_filename}")
+        day_scores = np.lib.format.open_memmap(self.score_filename, mode="w+", dtype=np.float64, shape=(DAY_SECONDS,))
+        day_scores[:] = np.nan
+        day_scores.flush()
+        return day_scores
+
+    def save_day_scores(self, day_scores: np.ndarray, presence: bool = True) -> None:
+        """
+        Updates the score file for the selected day, along with its score pyramid
+        and, with `presence`, its presence rows (pass False if already updated,
+        e.g., per chunk by apply_model_day).
         """
         print(f"Saving scores in {self.score_filename}")
         assert self.score_filename
-        np.save(self.score_filename, day_scores)
+        with span("score_save", bytes=day_scores.nbytes):
+            if self.use_archive:
+                self._get_score_archive().write_day(self.month, self.day, day_scores)
+            else:
+                np.save(self.score_filename, day_scores)
+        if presence:
+            self.update_presence(day_scores)
+        self.update_score_pyramid(day_scores)
+
+    def open_day_ltsa(self, writable: bool = False) -> np.memmap | None:
+        """
+        Opens the LTSA (see hwsd/spectra.py) for the selected day as a memory map,
+        (DAY_SECONDS × LTSA_BANDS), with NaN for the seconds not computed.
+        If writable, the file is initialized if not already created;
+        otherwise, None if not created.
+        """
+        from hwsd.spectra import LTSA_BANDS, LTSA_DTYPE
+
+        assert self.ltsa_filename is not None
+
+        if writable:
+            create_filled_npy(self.ltsa_filename, (DAY_SECONDS, LTSA_BANDS), LTSA_DTYPE, np.nan)
+        elif not os.path.isfile(self.ltsa_filename):
+            return None
+        return np.lib.format.open_memmap(self.ltsa_filename, mode="r+" if writable else "r")
+
+    def open_day_skipped(self, writable: bool = False) -> np.memmap | None:
+        """
+        Opens the mask of the seconds of the selected day skipped by the pre-screen
+        (see hwsd/prescreen.py) as a memory map, so these are not taken as pending,
+        unlike other missing scores. If writable, the file is initialized
+        (no seconds skipped) if not already created; otherwise, None if not created.
+        """
+        assert self.skipped_filename is not None
+
+        if writable:
+            create_filled_npy(self.skipped_filename, (DAY_SECONDS,), np.bool_, False)
+        elif not os.path.isfile(self.skipped_filename):
+            return None
+        return np.lib.format.open_memmap(self.skipped_filename, mode="r+" if writable else "r")
+
+    def update_presence(self, day_scores: np.ndarray, start_second: int = 0, seconds: int = DAY_SECONDS) -> None:
+        """
+        Updates the hours overlapping the given range of the selected day in the
+        presence table (see hwsd/presence.py).
+        Called by `save_day_scores` for the whole day, and by apply_model_day per chunk.
+        """
+        from hwsd.presence import PresenceTable
+
+        PresenceTable(self.year, self.score_base_dir).update_hours(
+            self.month, self.day, day_scores, start_second, seconds
+        )
+
+    def update_score_pyramid(self, day_scores: np.ndarray) -> None:
+        """
+        Updates the selected day in the score pyramid (see hwsd/score_pyramid.py).
+        Called by `save_day_scores`; call it directly after updating a day in place.
+        """
+        from hwsd.score_pyramid import ScorePyramid
+
+        ScorePyramid(self.year, self.score_base_dir).update_day(self.month, self.day, day_scores)
+
+    def _get_score_archive(self) -> "ScoreArchive":
+        from hwsd.score_archive import ScoreArchive
+
+        return ScoreArchive(self.year, self.score_base_dir)
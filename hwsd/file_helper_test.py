@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from math import ceil
+from unittest import mock
+
+import numpy as np
+import soundfile as sf
+
+from hwsd.file_helper import VOLTS_SCALE, AudioStream, FileHelper
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.signal = np.random.default_rng(0).normal(scale=0.1, size=10_000 * 5 + 123).astype(np.float32)
+
+    def test_audio_stream(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "test-10kHz.wav")
+            sf.write(filename, self.signal, 10_000, subtype="FLOAT")
+            with AudioStream(filename, block_samples=20_000, slots=2) as stream:
+                self.assertEqual(stream.frames, len(self.signal))
+                first = stream.read(1000, 20_000)
+                np.testing.assert_array_equal(first, self.signal[1000:21_000] * VOLTS_SCALE)
+                second = stream.read(45_000, 20_000)  # up to the end of the file
+                np.testing.assert_array_equal(second, self.signal[45_000:] * VOLTS_SCALE)
+                longer = stream.read(0, 30_000)  # not in the ring
+                np.testing.assert_array_equal(longer, self.signal[:30_000] * VOLTS_SCALE)
+
+                # the ring is reused after `slots` reads:
+                third = stream.read(0, 10_000)
+                self.assertTrue(np.shares_memory(first, third))
+                self.assertFalse(np.shares_memory(second, third))
+                self.assertEqual(len(stream.read(60_000, 1000)), 0)
+
+            with AudioStream(filename, block_samples=20_000, scale=1) as stream:
+                np.testing.assert_array_equal(stream.read(5, 10), self.signal[5:15])
+
+    def test_resample_cache_on_first_read(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            audio_base_dir = f"{tmp_dir}/audio_16kHz"
+            os.makedirs(f"{audio_base_dir}/2020/01")
+            sf.write(f"{audio_base_dir}/2020/01/MARS-20200101T000000Z-16kHz.wav", self.signal, 16_000, subtype="FLOAT")
+            cache_dir = f"{tmp_dir}/cache"
+            with mock.patch.dict(os.environ, {"HWSD_RESAMPLE_CACHE": cache_dir}):
+                file_helper = FileHelper(audio_base_dir, f"{tmp_dir}/scores")
+            self.assertTrue(file_helper.select_day(2020, 1, 1))
+            self.assertFalse(os.path.exists(cache_dir))  # not resampled just by selecting the day
+
+            psound, _ = file_helper.load_audio_segment(minutes=1)
+            self.assertEqual(len(file_helper.resample_cache.entries()), 1)
+            self.assertEqual(len(psound), ceil(len(self.signal) * 10_000 / 16_000))
@@ -0,0 +1,198 @@
+"""
+Structured timing and metrics for the scoring pipeline.
+
+Stages (model load, warm-up, segment read, pre-screen, chunk inference, LTSA,
+score save) are recorded as spans by the process-wide recorder (see `span`),
+along with sample and byte counts, and accumulated into per-stage totals.
+If configured with a metrics directory (see `configure`), each span, per-day
+summary and progress heartbeat is also appended as a JSON line to
+`hwsd-metrics.jsonl` there, and `write_prometheus` can write the totals in
+the Prometheus textfile-collector format.
+"""
+
+import json
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from hwsd.misc import elapsed_end
+
+JSONL_NAME = "hwsd-metrics.jsonl"
+PROMETHEUS_NAME = "hwsd.prom"
+
+# The recorded stages, in pipeline order.
+STAGES = ("model_load", "warm_up", "read", "prescreen", "inference", "ltsa", "score_save")
+
+
+class MetricsRecorder:
+    """
+    Records spans and events, keeping per-stage totals of seconds, count,
+    and any numeric span fields (samples, bytes, audio_seconds, ...).
+    Safe to use from several threads (e.g., with the reads done by a
+    Prefetcher thread).
+    """
+
+    def __init__(self, jsonl_filename: str | None = None):
+        self.jsonl_filename: str | None = jsonl_filename
+        # Fields added to every JSON line, e.g., the day being processed:
+        self.context: dict = {}
+        self._totals: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage: str, **fields) -> Iterator[dict]:
+        """
+        Records the time spent in the block as a span of the given stage.
+        The yielded dict can be updated with fields only known at the end
+        (e.g., the number of samples actually read).
+        """
+        started = time.time()
+        try:
+            yield fields
+        finally:
+            self.record(stage, time.time() - started, **fields)
+
+    def record(self, stage: str, seconds: float, **fields) -> None:
+        with self._lock:
+            totals = self._totals.setdefault(stage, {"seconds": 0.0, "count": 0})
+            totals["seconds"] += seconds
+            totals["count"] += 1
+            for key, value in fields.items():
+                if isinstance(value, int | float) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+        self.event("span", stage=stage, seconds=round(seconds, 6), **fields)
+
+    def event(self, kind: str, **fields) -> None:
+        """Appends a JSON line of the given kind, if configured."""
+        if self.jsonl_filename is None:
+            return
+        line = json.dumps({"ts": round(time.time(), 3), "kind": kind, "pid": os.getpid(), **self.context, **fields})
+        with self._lock, open(self.jsonl_filename, "a") as f:
+            f.write(line + "\n")
+
+    def take_totals(self) -> dict[str, dict[str, float]]:
+        """Returns the per-stage totals accumulated so far, and resets them."""
+        with self._lock:
+            totals, self._totals = self._totals, {}
+        return totals
+
+
+_recorder = MetricsRecorder()
+
+
+def get_recorder() -> MetricsRecorder:
+    return _recorder
+
+
+def configure(metrics_dir: str | None) -> None:
+    """Sets the directory for the JSON lines output (None to disable it)."""
+    jsonl_filename = None
+    if metrics_dir is not None:
+        os.makedirs(metrics_dir, exist_ok=True)
+        jsonl_filename = os.path.join(metrics_dir, JSONL_NAME)
+    _recorder.jsonl_filename = jsonl_filename
+
+
+def span(stage: str, **fields):
+    """Shorthand for `get_recorder().span(...)`."""
+    return _recorder.span(stage, **fields)
+
+
+def add_totals(totals: dict[str, dict[str, float]], more: dict[str, dict[str, float]]) -> None:
+    """Accumulates the `more` per-stage totals into `totals`."""
+    for stage, values in more.items():
+        stage_totals = totals.setdefault(stage, {})
+        for key, value in values.items():
+            stage_totals[key] = stage_totals.get(key, 0) + value
+
+
+def summarize_day(date_tag: str, audio_seconds: float, wall_seconds: float, totals: dict) -> None:
+    """Prints and records the summary of a processed day."""
+    rate = audio_seconds / wall_seconds if wall_seconds > 0 else 0.0
+    print(f"==> Day {date_tag}: {audio_seconds:,.0f} audio-s in {wall_seconds:,.1f}s ({rate:,.1f} audio-s/s)")
+    for stage in sorted(totals, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES)):
+        values = totals[stage]
+        line = f"    {stage:<12} {values['seconds']:8.1f}s  n={values['count']:<5}"
+        if "samples" in values:
+            line += f"  samples={values['samples']:,}"
+        if "bytes" in values:
+            line += f"  bytes={values['bytes']:,}"
+        if "skipped_seconds" in values:
+            line += f"  skipped={values['skipped_seconds']:,}s of {values['audio_seconds']:,}s"
+        print(line)
+    _recorder.event(
+        "day",
+        date=date_tag,
+        audio_seconds=audio_seconds,
+        wall_seconds=round(wall_seconds, 3),
+        audio_seconds_per_second=round(rate, 3),
+        stages=totals,
+    )
+
+
+class Heartbeat:
+    """
+    Reports progress towards `total` (in any unit, e.g., audio seconds or days),
+    with an ETA based on the rate so far, at most every `interval` seconds
+    (and always upon completion).
+    """
+
+    def __init__(self, label: str, total: float, interval: float = 60.0):
+        self.label: str = label
+        self.total: float = total
+        self.interval: float = interval
+        self.started: float = time.time()
+        self.done: float = 0
+        self._last_report: float = 0.0
+
+    @property
+    def eta_seconds(self) -> float | None:
+        elapsed = time.time() - self.started
+        if self.done <= 0 or elapsed <= 0:
+            return None
+        return (self.total - self.done) * elapsed / self.done
+
+    def update(self, done: float) -> None:
+        self.done = done
+        now = time.time()
+        if done < self.total and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        eta = self.eta_seconds
+        eta_label = elapsed_end(now - eta) if eta is not None else "?"
+        ratio = done / self.total if self.total else 1.0
+        print(f"    [heartbeat] {self.label}: {ratio:.1%} ({done:,.0f} of {self.total:,.0f}), ETA {eta_label}")
+        _recorder.event(
+            "heartbeat",
+            label=self.label,
+            done=done,
+            total=self.total,
+            eta_seconds=round(eta, 1) if eta is not None else None,
+        )
+
+
+def write_prometheus(filename: str, totals: dict[str, dict[str, float]], gauges: dict[str, float]) -> None:
+    """
+    Writes the per-stage totals (as hwsd_stage_* counters) and the given
+    gauges (named hwsd_<name>) in the Prometheus textfile-collector format.
+    The file is replaced atomically, as the collector may read it anytime.
+    """
+    lines = []
+    for key, help_text in [
+        ("seconds", "Seconds spent per pipeline stage."),
+        ("count", "Number of spans per pipeline stage."),
+        ("samples", "Audio samples processed per pipeline stage."),
+        ("bytes", "Bytes processed per pipeline stage."),
+    ]:
+        name = f"hwsd_stage_{key}_total"
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        lines += [f'{name}{{stage="{stage}"}} {values.get(key, 0)}' for stage, values in sorted(totals.items())]
+    for gauge, value in gauges.items():
+        lines += [f"# TYPE hwsd_{gauge} gauge", f"hwsd_{gauge} {value}"]
+
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_filename, filename)
@@ -0,0 +1,40 @@
+import json
+import os
+import tempfile
+import unittest
+
+from hwsd.metrics import MetricsRecorder, add_totals, write_prometheus
+
+
+class Test(unittest.TestCase):
+    def test_recorder(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            recorder = MetricsRecorder(f"{base_dir}/metrics.jsonl")
+            recorder.context = {"day": "2020-01-01"}
+            for samples in (10, 20):
+                with recorder.span("read", resampling=True) as fields:
+                    fields["samples"] = samples
+            recorder.record("inference", 1.5, audio_seconds=600)
+
+            totals = recorder.take_totals()
+            self.assertEqual(totals["read"]["count"], 2)
+            self.assertEqual(totals["read"]["samples"], 30)
+            self.assertNotIn("resampling", totals["read"])
+            self.assertEqual(totals["inference"]["audio_seconds"], 600)
+            self.assertEqual(recorder.take_totals(), {})
+
+            with open(f"{base_dir}/metrics.jsonl") as f:
+                lines = [json.loads(line) for line in f]
+            self.assertEqual([line["stage"] for line in lines], ["read", "read", "inference"])
+            self.assertEqual(lines[0]["day"], "2020-01-01")
+
+            add_totals(totals, {"read": {"count": 1, "samples": 5}})
+            self.assertEqual(totals["read"]["samples"], 35)
+
+            prom_filename = f"{base_dir}/hwsd.prom"
+            write_prometheus(prom_filename, totals, {"days_done": 1})
+            with open(prom_filename) as f:
+                prom = f.read()
+            self.assertIn('hwsd_stage_samples_total{stage="read"} 35', prom)
+            self.assertIn("hwsd_days_done 1", prom)
+            self.assertFalse(os.path.exists(f"{prom_filename}.tmp"))
@@ -3,8 +3,21 @@ Some misc utilities.
 """
 
 import math
+import os
 import time
+import uuid
 from calendar import monthrange
+from collections.abc import Iterable, Iterator
+from contextlib import suppress
+from itertools import islice
+from typing import TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+# Items per write when initializing a file (see create_filled_npy).
+FILL_BLOCK_ITEMS = 1 << 20
 
 
 def elapsed_end(started: float) -> str:
@@ -21,6 +34,44 @@ def elapsed_end(started: float) -> str:
     return f"{secs:.1f}s"
 
 
+def batched(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    """See test_batched"""
+
+    assert size >= 1, size
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def create_filled_npy(filename: str, shape: tuple[int, ...], dtype, fill_value) -> None:
+    """
+    Creates the given .npy file, filled with `fill_value`, unless already there.
+    """
+    if os.path.isfile(filename):
+        return
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    print(f"\n==> Initializing {filename}")
+    # The array is written to a temporary file of its own, and published with a
+    # hard link, which fails if the file is already there. So concurrent processes
+    # (e.g., apply_model.py --workers) never overwrite what another has written,
+    # with no lock needed (flock on directories is not supported over NFS).
+    tmp_filename = f"{filename}.{uuid.uuid4().hex}.tmp"
+    fd = os.open(tmp_filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        # written in blocks, rather than through a memory map, so the file's pages are not all resident at once:
+        header = {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False, "shape": shape}
+        size = int(np.prod(shape))
+        block = np.full(min(size, FILL_BLOCK_ITEMS), fill_value, dtype=dtype)
+        with os.fdopen(fd, "wb") as f:
+            np.lib.format.write_array_header_1_0(f, header)
+            for offset in range(0, size, len(block)):
+                f.write(block[: size - offset].tobytes())
+        with suppress(FileExistsError):  # (if created by another process in the meantime)
+            os.link(tmp_filename, filename)
+    finally:
+        os.remove(tmp_filename)
+
+
 def parse_days(*args: str) -> list[tuple[int, int, int]]:
     """See test_parse_days"""
 
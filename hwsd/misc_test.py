@@ -1,7 +1,12 @@
+import os
+import tempfile
 import time
 import unittest
+from unittest import mock
 
-from hwsd.misc import elapsed_end, parse_days
+import numpy as np
+
+from hwsd.misc import batched, create_filled_npy, elapsed_end, parse_days
 
 
 class Test(unittest.TestCase):
@@ -15,6 +20,11 @@ class Test(unittest.TestCase):
         self.assertEqual("30m:00s", elapsed_end(time.time() - 30 * 60))
         self.assertEqual("02h:00m:00s", elapsed_end(time.time() - 2 * 60 * 60))
 
+    def test_batched(self):
+        self.assertEqual(list(batched(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(batched(range(4), 4)), [[0, 1, 2, 3]])
+        self.assertEqual(list(batched([], 3)), [])
+
     def test_parse_days(self):
         self.assertEqual(
             parse_days("2018/1/1", "2018/1/7-9"),
@@ -88,3 +98,19 @@ class Test(unittest.TestCase):
             parse_days("2021/2"),
             [(2021, 2, d) for d in range(1, 28 + 1)],
         )
+
+    def test_create_filled_npy_race(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            filename = f"{base_dir}/a/filled.npy"
+            create_filled_npy(filename, (3, 5), np.float32, np.nan)
+            array = np.lib.format.open_memmap(filename, mode="r+")
+            self.assertTrue(np.isnan(array).all())
+            array[0] = 1
+            array.flush()
+            del array
+
+            # another process creating the file in the meantime: what it has written is kept
+            with mock.patch("os.path.isfile", return_value=False):
+                create_filled_npy(filename, (3, 5), np.float32, np.nan)
+            np.testing.assert_array_equal(np.load(filename)[0], 1)
+            self.assertEqual(os.listdir(f"{base_dir}/a"), ["filled.npy"])
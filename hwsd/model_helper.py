@@ -3,14 +3,85 @@ Model use utilities.
 """
 
 import os
+import time
+from collections.abc import Iterable, Iterator
+from math import ceil
+from typing import NamedTuple
 
 import numpy as np
 
+from hwsd.metrics import get_recorder, span
+from hwsd.misc import elapsed_end
+from hwsd.provenance import model_fingerprint
+
 MODEL_URL = "https://tfhub.dev/google/humpback_whale/1"
 
 # Model saved locally here
 LOCAL_MODEL = "google/humpback_whale/1"
 
+# Input rate expected by the model, which is also the step to get 1-sec scores.
+SAMPLE_RATE = 10_000
+
+# Audio needed by the model for a single score (~3.9 s); the actual value
+# is taken from the model metadata upon loading.
+DEFAULT_CONTEXT_WIDTH_SAMPLES = 39_124
+
+# The inputs are zero-padded to a few lengths (see bucket_seconds), so the model
+# only sees a bounded set of shapes, each paying the first-call overhead (graph
+# optimization, oneDNN primitive creation, XLA compilation) only once.
+# With this many lengths per octave, at most 1/8 of an input is padding.
+BUCKETS_PER_OCTAVE = 8
+MIN_BUCKET_SECONDS = 8
+
+
+class ModelChunk(NamedTuple):
+    """
+    An audio chunk to be scored. For overlap-save processing, the audio
+    includes extra context around the seconds whose scores are of interest,
+    so the model's context windows can span the chunk boundaries.
+    """
+
+    start_second: int  # Position of the seconds of interest, in the caller's time axis
+    seconds: int  # Number of seconds of interest
+    psound: np.ndarray  # The audio, including any context
+    context_seconds: int = 0  # Length of the leading context in psound
+
+    def trim_scores(self, scores: np.ndarray) -> np.ndarray:
+        """Returns the scores corresponding to the seconds of interest."""
+        return scores[self.context_seconds : self.context_seconds + self.seconds]
+
+
+def split_into_chunks(
+    psound: np.ndarray,
+    chunk_seconds: int,
+    context_seconds: int = 0,
+    start_second: int = 0,
+) -> Iterator[ModelChunk]:
+    """
+    Splits the given 10 kHz signal into chunks of `chunk_seconds`, each one
+    including up to `context_seconds` of the adjacent audio on each side.
+    `start_second` is the position of the signal in the caller's time axis.
+    """
+    total_seconds = ceil(len(psound) / SAMPLE_RATE)
+    for offset in range(0, total_seconds, chunk_seconds):
+        seconds = min(chunk_seconds, total_seconds - offset)
+        left = min(context_seconds, offset)
+        from_sample = (offset - left) * SAMPLE_RATE
+        to_sample = (offset + seconds + context_seconds) * SAMPLE_RATE
+        yield ModelChunk(start_second + offset, seconds, psound[from_sample:to_sample], left)
+
+
+def bucket_seconds(seconds: int, buckets: Iterable[int] = ()) -> int:
+    """
+    The input length in seconds to which a signal of `seconds` is padded:
+    the smallest of the given (warmed-up) buckets fitting it, if smaller than
+    the next length of the ladder with BUCKETS_PER_OCTAVE lengths per octave.
+    """
+    padded = max(seconds, MIN_BUCKET_SECONDS)
+    step = max(1, (1 << (padded.bit_length() - 1)) // BUCKETS_PER_OCTAVE)
+    ladder = -(-padded // step) * step
+    return min((bucket for bucket in buckets if seconds <= bucket < ladder), default=ladder)
+
 
 class ModelHelper:
     """
@@ -20,16 +91,64 @@ class ModelHelper:
     def __init__(self):
         self.model = None
         self.score_fn = None
+        self.context_width_samples: int = DEFAULT_CONTEXT_WIDTH_SAMPLES
+        # Input lengths (seconds) given to warm_up, used as buckets:
+        self.buckets: set[int] = set()
+        self._warmed_up: set[tuple[int, int]] = set()
+        # (batch size, samples) of the inputs the model has been called with:
+        self._called_shapes: set[tuple[int, int]] = set()
+        self._score_waveforms = None
+        # Settings given to load_model (reported by the model server to its clients):
+        self.load_settings: dict = {}
 
-    def load_model(self) -> None:
+    @property
+    def context_seconds(self) -> int:
+        """
+        Seconds of context to add on each side of a chunk so that the scores
+        of its seconds of interest are as with a single pass on the whole signal.
+        """
+        return ceil(self.context_width_samples / SAMPLE_RATE)
+
+    def load_model(
+        self,
+        intra_op_threads: int | None = None,
+        inter_op_threads: int | None = None,
+        xla: bool = False,
+        onednn: bool | None = None,
+    ) -> None:
         """
         Loads the model, initially by downloading it from its original place,
         then from a local copy in subsequent calls.
         The model and score function are maintained internally.
+
+        :param intra_op_threads:  If given, size of the TensorFlow thread pool
+                                  used within individual ops.
+        :param inter_op_threads:  If given, size of the TensorFlow thread pool
+                                  used to run independent ops.
+        (These can only be set before TensorFlow executes any op in the process.)
+        :param xla:               Compile the score function with XLA, once per
+                                  input shape (see bucket_seconds and warm_up).
+        :param onednn:            If given, enables/disables the oneDNN graph
+                                  optimizations on CPU (TF_ENABLE_ONEDNN_OPTS),
+                                  only effective if TensorFlow is not yet imported.
         """
+        started = time.time()
+        self.load_settings = {
+            "intra_op_threads": intra_op_threads,
+            "inter_op_threads": inter_op_threads,
+            "xla": xla,
+            "onednn": onednn,
+        }
+        if onednn is not None:
+            os.environ["TF_ENABLE_ONEDNN_OPTS"] = "1" if onednn else "0"
         import tensorflow as tf
         import tensorflow_hub as hub
 
+        if intra_op_threads is not None:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        if inter_op_threads is not None:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
         if os.path.isdir(LOCAL_MODEL):
             print(f"\n==> Loading model from {LOCAL_MODEL}")
             model = hub.load(LOCAL_MODEL)
@@ -46,31 +165,124 @@ class ModelHelper:
 
         self.model = model
 
-        self.score_fn = model.signatures["score"]
+        self.score_fn = score_fn = model.signatures["score"]
+        context_step_samples = tf.constant(SAMPLE_RATE, tf.int64)
+
+        def score_waveforms(waveforms):
+            return score_fn(waveform=waveforms, context_step_samples=context_step_samples)["scores"]
+
+        score_tf = tf.function(score_waveforms, jit_compile=True) if xla else score_waveforms
+
+        def score_batch(waveforms: np.ndarray) -> np.ndarray:
+            return score_tf(tf.constant(waveforms)).numpy()
+
+        self._score_waveforms = score_batch
 
         metadata_fn = model.signatures["metadata"]
         metadata = metadata_fn()
         print("metadata:")
         for key, val in metadata.items():
             print(f"  {key}: {val}")
+        if "context_width_samples" in metadata:
+            self.context_width_samples = int(metadata["context_width_samples"].numpy())
+        get_recorder().record("model_load", time.time() - started)
+
+    def fingerprint(self) -> str | None:
+        """Identifies the model version, see hwsd/provenance.py."""
+        return model_fingerprint(LOCAL_MODEL)
+
+    def add_bucket(self, seconds: int) -> None:
+        """
+        Adds a bucket (see bucket_seconds) for inputs of the given seconds (e.g.,
+        a chunk along with its context), so these are not padded, and shorter
+        ones (e.g., with context on one side only) share their shape.
+        """
+        self.buckets.add(seconds)
+
+    def warm_up(self, seconds: int, batch_size: int = 1) -> None:
+        """
+        Adds the bucket for inputs of the given seconds, and has the model score
+        a batch of such inputs (silence), so the first-call overhead for that
+        shape (e.g., XLA compilation) is paid upfront and not by the first
+        actual chunks. No-op if already warmed up.
+        """
+        self.add_bucket(seconds)
+        if (seconds, batch_size) in self._warmed_up:
+            return
+        self._warmed_up.add((seconds, batch_size))
+        started = time.time()
+        with span("warm_up", samples=batch_size * seconds * SAMPLE_RATE):
+            psound = np.zeros(seconds * SAMPLE_RATE, dtype=np.float32)
+            if batch_size == 1:
+                self.apply_model(psound)
+            else:
+                self.apply_model_batch([psound] * batch_size)
+        print(f"    >> model warmed up for {batch_size} x {seconds}s inputs in {elapsed_end(started)}")
+
+    def _pad_to_bucket(self, psounds: list[np.ndarray]) -> np.ndarray:
+        """The signals zero-padded at the end, to the bucket of the longest one, as a batch."""
+        max_seconds = -(-max(len(psound) for psound in psounds) // SAMPLE_RATE)
+        samples = bucket_seconds(max_seconds, self.buckets) * SAMPLE_RATE
+        waveforms = np.zeros((len(psounds), samples, 1), dtype=np.float32)
+        for i, psound in enumerate(psounds):
+            waveforms[i, : len(psound), 0] = psound
+        return waveforms
+
+    def _score(self, waveforms: np.ndarray) -> np.ndarray:
+        """
+        Scores the given batch of waveforms, reporting any first call with its shape.
+
+        :return:  The scores as [batch, seconds] (the model's trailing axis dropped).
+        """
+        assert self._score_waveforms is not None, "Model not loaded. Call load_model() first."
+        started = time.time()
+        scores = self._score_waveforms(waveforms)
+        shape = waveforms.shape[:2]
+        if shape not in self._called_shapes:
+            self._called_shapes.add(shape)
+            print(f"    first model call with {shape[0]} x {shape[1]:,} samples in {elapsed_end(started)}")
+        # (the model's scores are shaped [batch, seconds, 1])
+        return scores[..., 0]
 
     def apply_model(self, psound: np.ndarray) -> np.ndarray:
         """
         Applies the model on given audio segment.
 
         :param psound:  The input signal, assumed sampled at 10 kHz.
-        :return:        Array of corresponding scores at 1-sec resolution.
+        :return:        Array of corresponding scores at 1-sec resolution,
+                        one per (started) second of the signal.
         """
-        import tensorflow as tf
+        return self.apply_model_batch([psound])[0]
 
-        assert self.score_fn is not None, "Model not loaded. Call load_model() first."
+    def apply_model_batch(self, psounds: list[np.ndarray]) -> list[np.ndarray]:
+        """
+        Applies the model on several audio chunks in a single call,
+        stacking them into the batch dimension. The chunks may come from
+        anywhere (same segment, different days or files).
+        The chunks are zero-padded at the end to a common length (the
+        bucket of the longest one, see bucket_seconds), with their scores
+        trimmed accordingly.
 
-        # We apply the model to get a 1-sec score resolution
-        # (Note that the model expects input signals sampled at 10 kHz.)
-        context_step_samples = tf.cast(10_000, tf.int64)
+        :param psounds:  The input signals, assumed sampled at 10 kHz.
+        :return:         For each input signal, its scores at 1-sec resolution.
+        """
+        assert len(psounds) > 0
+        batch_scores = self._score(self._pad_to_bucket(psounds))
 
-        waveform1 = np.expand_dims(psound, axis=1)
-        waveform_exp = tf.expand_dims(waveform1, 0)  # makes a batch of size 1
+        # One score per (started) second of each original signal:
+        return [batch_scores[i, : -(-len(psound) // SAMPLE_RATE)] for i, psound in enumerate(psounds)]
 
-        psound_scores = self.score_fn(waveform=waveform_exp, context_step_samples=context_step_samples)
-        return psound_scores["scores"].numpy()[0]
+    def apply_model_chunks(self, chunks: list[ModelChunk]) -> list[np.ndarray]:
+        """
+        Applies the model on the given chunks, as a single batch if more than one.
+
+        :return:  For each chunk, the scores for its seconds of interest.
+        """
+        samples = sum(len(chunk.psound) for chunk in chunks)
+        audio_seconds = sum(chunk.seconds for chunk in chunks)
+        with span("inference", chunks=len(chunks), samples=samples, audio_seconds=audio_seconds):
+            if len(chunks) == 1:
+                scores = [self.apply_model(chunks[0].psound)]
+            else:
+                scores = self.apply_model_batch([chunk.psound for chunk in chunks])
+        return [chunk.trim_scores(chunk_scores) for chunk, chunk_scores in zip(chunks, scores, strict=True)]
@@ -0,0 +1,74 @@
+import unittest
+
+import numpy as np
+
+from hwsd.model_helper import SAMPLE_RATE, ModelHelper, bucket_seconds, split_into_chunks
+
+
+class WindowedEnergyModel(ModelHelper):
+    """
+    TF-free stand-in for the model: the score for each second is the mean
+    energy of the signal over a window extending 3 s to each side.
+    As the model, it scores padded batches, shaped [batch, seconds, 1].
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._score_waveforms = self.score_waveforms
+
+    @staticmethod
+    def score_waveforms(waveforms: np.ndarray) -> np.ndarray:
+        batch, samples, _ = waveforms.shape
+        seconds = samples // SAMPLE_RATE
+        signals = waveforms[:, : seconds * SAMPLE_RATE, 0].astype(np.float64)
+        energy = (signals.reshape(batch, seconds, SAMPLE_RATE) ** 2).sum(axis=2)
+        scores = np.array([np.convolve(row, np.ones(7), mode="same") for row in energy])
+        return scores[..., np.newaxis]
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.model = WindowedEnergyModel()
+        self.psound = np.random.default_rng(0).normal(size=95 * SAMPLE_RATE + 1234)
+
+    def score_chunked(self, chunk_seconds: int, context_seconds: int, batch_size: int = 1) -> np.ndarray:
+        chunks = list(split_into_chunks(self.psound, chunk_seconds, context_seconds))
+        scores = []
+        for i in range(0, len(chunks), batch_size):
+            scores.extend(self.model.apply_model_chunks(chunks[i : i + batch_size]))
+        return np.concatenate(scores)
+
+    def test_split_into_chunks(self):
+        chunks = list(split_into_chunks(self.psound, 30, 4, start_second=100))
+        self.assertEqual([c.start_second for c in chunks], [100, 130, 160, 190])
+        self.assertEqual([c.seconds for c in chunks], [30, 30, 30, 6])
+        self.assertEqual([c.context_seconds for c in chunks], [0, 4, 4, 4])
+        self.assertEqual(len(chunks[0].psound), 34 * SAMPLE_RATE)
+        self.assertEqual(len(chunks[1].psound), 38 * SAMPLE_RATE)
+
+    def test_overlap_save_matches_whole_pass(self):
+        whole = self.model.apply_model(self.psound)
+        self.assertEqual(whole.shape, (96,))  # one score per (started) second
+        for chunk_seconds in (7, 10, 60):
+            np.testing.assert_allclose(self.score_chunked(chunk_seconds, 4), whole)
+            np.testing.assert_allclose(self.score_chunked(chunk_seconds, 4, batch_size=3), whole)
+
+    def test_hard_chunks_differ_at_boundaries(self):
+        whole = self.model.apply_model(self.psound)
+        self.assertFalse(np.allclose(self.score_chunked(10, 0), whole))
+
+    def test_bucket_seconds(self):
+        self.assertEqual(bucket_seconds(3), 8)
+        self.assertEqual(bucket_seconds(600), 640)
+        self.assertEqual(bucket_seconds(604, [608]), 608)
+        self.assertEqual(bucket_seconds(500, [608]), 512)
+        self.assertEqual(bucket_seconds(609, [608]), 640)
+        # at most 1/8 of padding:
+        paddings = [bucket_seconds(seconds) / seconds - 1 for seconds in range(8, 7200)]
+        self.assertLessEqual(max(paddings), 1 / 8)
+        # 8 per octave, from 8 s to 2 h:
+        self.assertEqual(len({bucket_seconds(seconds) for seconds in range(8, 7200)}), 8 * 10)
+
+    def test_warm_up(self):
+        self.model.warm_up(608, batch_size=2)
+        self.assertEqual(self.model.buckets, {608})
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Local model server, to keep the model loaded across invocations.
+
+Loading the model (importing TensorFlow, `hub.load`, and the metadata call)
+takes many seconds before any audio is scored. With the server running,
+`hwsd/apply_model.py`, `hwsd/apply_model_day.py` and `scripts/score_file.py`
+(via `get_model_helper`) instead use a RemoteModelHelper, which sends the
+audio to the server over a Unix socket, so no TensorFlow import at all.
+
+Usage:
+    $ hwsd/model_server.py [--socket path]
+and leave it running (e.g., with nohup). Clients look for the server at
+$HWSD_MODEL_SOCKET, or DEFAULT_SOCKET_PATH if not set; set HWSD_MODEL_SOCKET=none
+to always load the model in-process.
+
+As requests and replies are pickled, the socket directory must be private to
+the user (owned by the user, mode 0700; otherwise the server refuses to start
+and clients load the model in-process), and both ends authenticate with a
+random key that the server writes to AUTHKEY_FILENAME (mode 0600) in there.
+"""
+
+import os
+import stat
+import threading
+import time
+import traceback
+from argparse import ArgumentParser, RawTextHelpFormatter
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+
+import numpy as np
+
+from hwsd.misc import elapsed_end
+from hwsd.model_helper import ModelHelper
+
+# In a directory only accessible by the user (see check_private_dir), by default
+# in the user's runtime directory if any.
+DEFAULT_SOCKET_PATH = (
+    os.path.join(os.environ["XDG_RUNTIME_DIR"], "hwsd-model", "model.sock")
+    if os.environ.get("XDG_RUNTIME_DIR")
+    else f"/tmp/hwsd-model-{os.getuid()}/model.sock"
+)
+
+# Key to authenticate the connections, next to the socket.
+AUTHKEY_FILENAME = "authkey"
+
+
+def get_socket_path() -> str | None:
+    """The socket path for clients, or None if disabled (HWSD_MODEL_SOCKET=none)."""
+    socket_path = os.environ.get("HWSD_MODEL_SOCKET", DEFAULT_SOCKET_PATH)
+    return None if socket_path == "none" else socket_path
+
+
+def check_private_dir(path: str) -> None:
+    """Raises PermissionError unless the given path is a directory owned by the user with mode 0700."""
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) != 0o700:
+        raise PermissionError(f"{path} is not a directory private to the user (owned by the user, mode 0700)")
+
+
+def authkey_path(socket_path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(socket_path)), AUTHKEY_FILENAME)
+
+
+def write_authkey(socket_path: str) -> bytes:
+    """A new random key, written (mode 0600) for the clients of the server at the given socket."""
+    authkey = os.urandom(32)
+    filename = authkey_path(socket_path)
+    tmp_filename = f"{filename}.tmp{os.getpid()}"
+    fd = os.open(tmp_filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(authkey)
+    os.replace(tmp_filename, filename)
+    return authkey
+
+
+def read_authkey(socket_path: str) -> bytes:
+    """The key of the server at the given socket, checking the file is private to the user."""
+    filename = authkey_path(socket_path)
+    fd = os.open(filename, os.O_RDONLY | os.O_NOFOLLOW)
+    with os.fdopen(fd, "rb") as f:
+        st = os.fstat(f.fileno())
+        if not stat.S_ISREG(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) != 0o600:
+            raise PermissionError(f"{filename} is not a file private to the user (owned by the user, mode 0600)")
+        return f.read()
+
+
+class ModelServer:
+    """
+    Serves the given (loaded) model on a Unix socket.
+    Each client connection is handled in its own thread.
+
+    Requests are (op, payload) tuples, with replies ("ok", result) or ("error", traceback):
+    - ("info", None): dict with the model's context_width_samples, fingerprint, and load_settings
+    - ("apply", psound): scores, as with ModelHelper.apply_model
+    - ("apply_batch", psounds): list of scores, as with ModelHelper.apply_model_batch
+    - ("add_bucket", seconds): None, as with ModelHelper.add_bucket (for all clients)
+    - ("warm_up", (seconds, batch_size)): None, as with ModelHelper.warm_up
+    """
+
+    def __init__(self, model_helper: ModelHelper, socket_path: str = DEFAULT_SOCKET_PATH):
+        self.model_helper: ModelHelper = model_helper
+        self.socket_path: str = socket_path
+        self.requests: int = 0
+        self._listener: Listener | None = None
+
+    def start(self) -> None:
+        """
+        Starts listening, replacing any stale socket file, with a new key.
+        Raises PermissionError if the socket directory is not private to the user.
+        """
+        socket_dir = os.path.dirname(os.path.abspath(self.socket_path))
+        os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+        check_private_dir(socket_dir)
+        if os.path.exists(self.socket_path):
+            if connect(self.socket_path) is not None:
+                raise RuntimeError(f"Model server already running at {self.socket_path}")
+            os.remove(self.socket_path)
+        self._listener = Listener(self.socket_path, family="AF_UNIX", authkey=write_authkey(self.socket_path))
+        os.chmod(self.socket_path, 0o600)
+
+    def serve_forever(self) -> None:
+        """Accepts connections until `close` is called."""
+        listener = self._listener
+        assert listener is not None, "Call start() first."
+        while True:
+            try:
+                conn = listener.accept()
+            except AuthenticationError:
+                print("WARNING: rejected a model server connection with a wrong key")
+                continue
+            except OSError:
+                break  # closed
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def close(self) -> None:
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def _handle(self, conn: Connection) -> None:
+        with conn:
+            while True:
+                try:
+                    op, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    conn.send(("ok", self._dispatch(op, payload)))
+                except Exception:
+                    conn.send(("error", traceback.format_exc()))
+
+    def _dispatch(self, op: str, payload):
+        self.requests += 1
+        if op == "info":
+            return {
+                "context_width_samples": self.model_helper.context_width_samples,
+                "fingerprint": self.model_helper.fingerprint(),
+                "load_settings": self.model_helper.load_settings,
+            }
+        if op == "apply":
+            return self.model_helper.apply_model(payload)
+        if op == "apply_batch":
+            return self.model_helper.apply_model_batch(payload)
+        if op == "add_bucket":
+            return self.model_helper.add_bucket(payload)
+        if op == "warm_up":
+            return self.model_helper.warm_up(*payload)
+        raise ValueError(f"Unknown op: {op}")
+
+
+def connect(socket_path: str) -> Connection | None:
+    """
+    Connection to the server at the given socket, or None if it is not running,
+    or if the socket directory or key file is not private to the user (reported).
+    """
+    if not os.path.exists(socket_path):
+        return None
+    try:
+        check_private_dir(os.path.dirname(os.path.abspath(socket_path)))
+        authkey = read_authkey(socket_path)
+    except PermissionError as e:
+        print(f"WARNING: ignoring the model server at {socket_path}: {e}")
+        return None
+    except OSError:
+        return None
+    try:
+        return Client(socket_path, family="AF_UNIX", authkey=authkey)
+    except (OSError, AuthenticationError):
+        return None
+
+
+class RemoteModelHelper(ModelHelper):
+    """
+    ModelHelper backed by a model server (see ModelServer).
+
+    The model is loaded by the server, with its own settings: those given to
+    `load_model` are only checked against them (see there). The buckets (see
+    `add_bucket` and `warm_up`) are server-wide, that is, those added by a
+    client apply to the inputs of all the clients of the server.
+    """
+
+    def __init__(self, conn: Connection):
+        super().__init__()
+        self._conn: Connection = conn
+        self._lock = threading.Lock()
+        self._fingerprint: str | None = None
+
+    def _request(self, op: str, payload=None):
+        with self._lock:
+            self._conn.send((op, payload))
+            status, result = self._conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Model server error:\n{result}")
+        return result
+
+    def load_model(
+        self,
+        intra_op_threads: int | None = None,
+        inter_op_threads: int | None = None,
+        xla: bool = False,
+        onednn: bool | None = None,
+    ) -> None:
+        """
+        Gets the model info from the server; the model is already loaded there,
+        with its own settings, so a warning is reported for each of those given
+        (not None, nor xla=False) that differs from the server's.
+        """
+        info = self._request("info")
+        self.context_width_samples = info["context_width_samples"]
+        self._fingerprint = info["fingerprint"]
+        self.load_settings = info["load_settings"]
+        requested = {
+            "intra_op_threads": intra_op_threads,
+            "inter_op_threads": inter_op_threads,
+            "xla": xla or None,
+            "onednn": onednn,
+        }
+        for name, value in requested.items():
+            if value is not None and name in self.load_settings and self.load_settings[name] != value:
+                print(
+                    f"WARNING: the model server has {name}={self.load_settings[name]}, not {value} as requested;"
+                    " restart the server with the desired settings, or set HWSD_MODEL_SOCKET=none"
+                )
+
+    def fingerprint(self) -> str | None:
+        if self._fingerprint is None:
+            self._fingerprint = self._request("info")["fingerprint"]
+        return self._fingerprint
+
+    def add_bucket(self, seconds: int) -> None:
+        self._request("add_bucket", seconds)
+
+    def warm_up(self, seconds: int, batch_size: int = 1) -> None:
+        """Has the server warm up its model, only once for all its clients."""
+        self._request("warm_up", (seconds, batch_size))
+
+    def apply_model(self, psound: np.ndarray) -> np.ndarray:
+        return self._request("apply", np.asarray(psound, dtype=np.float32))
+
+    def apply_model_batch(self, psounds: list[np.ndarray]) -> list[np.ndarray]:
+        return self._request("apply_batch", [np.asarray(psound, dtype=np.float32) for psound in psounds])
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def get_model_helper() -> ModelHelper:
+    """
+    A RemoteModelHelper if the model server is running, otherwise a ModelHelper
+    to load the model in-process. In both cases, call `load_model` before use.
+    """
+    socket_path = get_socket_path()
+    conn = connect(socket_path) if socket_path is not None else None
+    if conn is None:
+        return ModelHelper()
+    print(f"\n==> Using model server at {socket_path}")
+    return RemoteModelHelper(conn)
+
+
+def parse_arguments():
+    """CLI definition."""
+    description = "Serves the model on a Unix socket, so clients don't need to load it."
+    parser = ArgumentParser(description=description, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "--socket",
+        type=str,
+        metavar="path",
+        default=get_socket_path() or DEFAULT_SOCKET_PATH,
+        help=f"Socket path. By default, $HWSD_MODEL_SOCKET or {DEFAULT_SOCKET_PATH}.",
+    )
+    parser.add_argument(
+        "--intra-op-threads",
+        type=int,
+        metavar="n",
+        default=None,
+        help="Size of the TensorFlow intra-op thread pool. By default, TensorFlow's.",
+    )
+    parser.add_argument(
+        "--inter-op-threads",
+        type=int,
+        metavar="n",
+        default=None,
+        help="Size of the TensorFlow inter-op thread pool. By default, TensorFlow's.",
+    )
+    parser.add_argument(
+        "--xla",
+        action="store_true",
+        default=False,
+        help="Compile the model with XLA, once per input shape.",
+    )
+    parser.add_argument(
+        "--onednn",
+        choices=["on", "off"],
+        default=None,
+        help="Enable/disable the oneDNN graph optimizations on CPU. By default, TensorFlow's.",
+    )
+    parser.add_argument(
+        "--warm-up-seconds",
+        type=int,
+        nargs="+",
+        metavar="s",
+        default=[],
+        help="Input lengths in seconds (e.g., a chunk along with its context) to warm up the model for,\n"
+        "so the clients don't pay the first-call overhead of those shapes. By default, none.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opts = parse_arguments()
+    server_model_helper = ModelHelper()
+    model_load_started = time.time()
+    server_model_helper.load_model(
+        opts.intra_op_threads,
+        opts.inter_op_threads,
+        opts.xla,
+        None if opts.onednn is None else opts.onednn == "on",
+    )
+    print(f"    >> model loaded in {elapsed_end(model_load_started)}")
+    for warm_up_seconds in opts.warm_up_seconds:
+        server_model_helper.warm_up(warm_up_seconds)
+
+    server = ModelServer(server_model_helper, opts.socket)
+    server.start()
+    print(f"\n==> Serving model at {opts.socket} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        print(f"\n==> Stopped after {server.requests:,} requests")
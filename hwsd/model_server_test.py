@@ -0,0 +1,87 @@
+import io
+import os
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+from unittest import mock
+
+import numpy as np
+
+from hwsd.model_helper import ModelChunk
+from hwsd.model_helper_test import WindowedEnergyModel
+from hwsd.model_server import ModelServer, RemoteModelHelper, connect, get_model_helper
+
+
+class Test(unittest.TestCase):
+    def test_remote_model_helper(self):
+        local = WindowedEnergyModel()
+        local.context_width_samples = 70_000
+        local.load_settings = {"intra_op_threads": 4, "inter_op_threads": None, "xla": False, "onednn": None}
+        with tempfile.TemporaryDirectory() as base_dir:
+            socket_path = f"{base_dir}/model.sock"
+            server = ModelServer(local, socket_path)
+            server.start()
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                with mock.patch.dict(os.environ, {"HWSD_MODEL_SOCKET": socket_path}):
+                    remote = get_model_helper()
+                self.assertIsInstance(remote, RemoteModelHelper)
+                with redirect_stdout(io.StringIO()) as output:
+                    remote.load_model(4)
+                self.assertNotIn("WARNING", output.getvalue())
+                self.assertEqual(remote.context_seconds, 7)
+                # settings other than the server's are reported:
+                with redirect_stdout(io.StringIO()) as output:
+                    remote.load_model(2, xla=True)
+                self.assertIn("intra_op_threads=4, not 2", output.getvalue())
+                self.assertIn("xla=False, not True", output.getvalue())
+
+                rng = np.random.default_rng(0)
+                psounds = [rng.normal(size=n).astype(np.float32) for n in (50_000, 123_456)]
+                np.testing.assert_array_equal(remote.apply_model(psounds[0]), local.apply_model(psounds[0]))
+                for remote_scores, psound in zip(remote.apply_model_batch(psounds), psounds, strict=True):
+                    np.testing.assert_array_equal(remote_scores, local.apply_model(psound))
+                chunks = [ModelChunk(0, 3, psounds[0][:30_000]), ModelChunk(3, 2, psounds[0][20_000:], 1)]
+                for remote_scores, local_scores in zip(
+                    remote.apply_model_chunks(chunks), local.apply_model_chunks(chunks), strict=True
+                ):
+                    np.testing.assert_array_equal(remote_scores, local_scores)
+
+                with self.assertRaises(RuntimeError):
+                    remote._request("unknown")
+                remote.close()
+
+                # a client without the key is rejected, and the server keeps serving:
+                with self.assertRaises(AuthenticationError):
+                    Client(socket_path, family="AF_UNIX", authkey=b"wrong")
+                connect(socket_path).close()
+            finally:
+                server.close()
+
+            # with no server running:
+            with mock.patch.dict(os.environ, {"HWSD_MODEL_SOCKET": socket_path}):
+                self.assertNotIsInstance(get_model_helper(), RemoteModelHelper)
+
+    def test_shared_socket_dir_refused(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            socket_path = f"{base_dir}/model.sock"
+            os.chmod(base_dir, 0o755)
+            with self.assertRaises(PermissionError):
+                ModelServer(WindowedEnergyModel(), socket_path).start()
+
+            os.chmod(base_dir, 0o700)
+            server = ModelServer(WindowedEnergyModel(), socket_path)
+            server.start()
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                connect(socket_path).close()
+                os.chmod(base_dir, 0o755)
+                self.assertIsNone(connect(socket_path))
+                os.chmod(base_dir, 0o700)
+                os.chmod(f"{base_dir}/authkey", 0o644)
+                self.assertIsNone(connect(socket_path))
+            finally:
+                server.close()
@@ -1,37 +1,212 @@
 #!/usr/bin/env python3
 """
-Script to run plot_scores_day as needed.
-No options from command line; adjust the script itself.
+Batch rendering of the day plots (see hwsd/plot_scores_day.py) on given time intervals.
+See USAGE.
 """
 
-from calendar import monthrange
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from argparse import ArgumentParser, RawTextHelpFormatter
+from typing import NamedTuple
 
-from hwsd.file_helper import FileHelper
-from hwsd.plot_scores_day import plot_segment
+import matplotlib
 
+from hwsd.file_helper import DEFAULT_AUDIO_BASE_DIR, DEFAULT_SCORE_BASE_DIR, FileHelper
+from hwsd.misc import elapsed_end, parse_days
 
-def main() -> None:
-    "Main program."
+USAGE = """
+hwsd/plot_scores.py: Generates the day plots on given time intervals.
+Usage:
+    $ hwsd/plot_scores.py [--workers N] [--force] time-interval ...
+with time intervals as in hwsd/apply_model.py. See README.md for more details.
+"""
+
+
+class PlotResult(NamedTuple):
+    """Outcome of plotting a day."""
+
+    year: int
+    month: int
+    day: int
+    status: str  # "ok", "current" (plot newer than its inputs), "missing" (no audio/score file), or "failed"
+    seconds: float
+    error: str | None = None
+
+    @property
+    def date_tag(self) -> str:
+        return f"{self.year:04}-{self.month:02}-{self.day:02}"
+
+
+def is_plot_current(plot_filename: str, input_filenames: list[str | None]) -> bool:
+    """Whether the plot file exists and is newer than all the given (existing) input files."""
+    if not os.path.isfile(plot_filename):
+        return False
+    plot_mtime = os.path.getmtime(plot_filename)
+    return all(
+        os.path.getmtime(filename) < plot_mtime
+        for filename in input_filenames
+        if filename is not None and os.path.isfile(filename)
+    )
+
+
+def plot_day(
+    year: int,
+    month: int,
+    day: int,
+    audio_base_dir: str = DEFAULT_AUDIO_BASE_DIR,
+    score_base_dir: str = DEFAULT_SCORE_BASE_DIR,
+    use_archive: bool = False,
+    force: bool = False,
+) -> PlotResult:
+    """
+    Generates the full-day plot, unless already newer than the day's score,
+    LTSA, and audio files (or `force`). Never raises; failures are reported
+    in the result.
+    Note that, with `use_archive`, the score input is the year's archive, so
+    any day scored later in the year makes the plots of that year outdated.
+    """
+    from hwsd.plot_scores_day import get_plot_filename, plot_segment
+
+    started = time.time()
+    try:
+        file_helper = FileHelper(audio_base_dir, score_base_dir, use_archive)
+        if not file_helper.select_day(year, month, day) or not os.path.isfile(file_helper.score_filename or ""):
+            return PlotResult(year, month, day, "missing", time.time() - started)
+
+        plot_filename = get_plot_filename(score_base_dir, year, month, day)
+        inputs = [file_helper.score_filename, file_helper.ltsa_filename, file_helper.audio_filename]
+        if not force and is_plot_current(plot_filename, inputs):
+            print(f"==> {plot_filename} is up to date")
+            return PlotResult(year, month, day, "current", time.time() - started)
+
+        plot_segment(file_helper, year, month, day)
+    except Exception:
+        return PlotResult(year, month, day, "failed", time.time() - started, traceback.format_exc())
+    return PlotResult(year, month, day, "ok", time.time() - started)
+
+
+_worker_day_options: dict = {}
+
+
+def _init_worker(day_options: dict) -> None:
+    global _worker_day_options
+    _worker_day_options = day_options
+    matplotlib.use("Agg")
+
+
+def _plot_day_in_worker(year_month_day: tuple[int, int, int]) -> PlotResult:
+    return plot_day(*year_month_day, **_worker_day_options)
+
+
+def report_results(results: list[PlotResult]) -> None:
+    """Prints a summary of the plotted days."""
+    statuses = ["ok", "current", "missing", "failed"]
+    counts = {status: sum(1 for r in results if r.status == status) for status in statuses}
+    print(f"\n==> {len(results)} days: " + ", ".join(f"{counts[s]} {s}" for s in statuses))
+    for result in results:
+        if result.status == "failed":
+            print(f"\n    FAILED {result.date_tag}:\n{result.error}")
+
+
+def main(
+    intervals: list[str],
+    workers: int = 1,
+    audio_base_dir: str = DEFAULT_AUDIO_BASE_DIR,
+    score_base_dir: str = DEFAULT_SCORE_BASE_DIR,
+    use_archive: bool = False,
+    force: bool = False,
+) -> list[PlotResult]:
+    """
+    Generates the full-day plots for the given intervals, skipping those
+    already up to date (see plot_day). With `workers` > 1, the days are
+    plotted by a pool of that many processes.
+    """
+    years_months_days = parse_days(*intervals)
+    print(f"\nSTARTING plot_scores with intervals={intervals} workers={workers} force={force}")
+    program_started = time.time()
+    matplotlib.use("Agg")
+    day_options = {
+        "audio_base_dir": audio_base_dir,
+        "score_base_dir": score_base_dir,
+        "use_archive": use_archive,
+        "force": force,
+    }
+
+    results: list[PlotResult] = []
+    if workers <= 1:
+        for year, month, day in years_months_days:
+            print(f"\n *** DAY {year:04}-{month:02}-{day:02} ***")
+            results.append(plot_day(year, month, day, **day_options))
+    else:
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(workers, initializer=_init_worker, initargs=(day_options,)) as pool:
+            for result in pool.imap_unordered(_plot_day_in_worker, years_months_days, chunksize=1):
+                print(f"\n*** DAY {result.date_tag}: {result.status} in {result.seconds:.1f}s ***")
+                results.append(result)
 
-    # Using defaults on gizo:
-    file_helper = FileHelper()
+    report_results(results)
+    print(f"\n>> complete plot_scores in {elapsed_end(program_started)}\n")
+    return results
 
-    # adjust as needed:
-    years_months = [
-        (2018, [11, 12]),
-        (2019, range(1, 12 + 1)),
-        (2020, range(1, 10 + 1)),
-    ]
 
-    for year, months in years_months:
-        print(f"\n *** YEAR {year:04} ***")
-        for month in months:
-            print(f"\n *** MONTH {year:04}-{month:02} ***")
-            num_days = monthrange(year, month)[1]
-            for day in range(1, num_days + 1):
-                print(f"\n *** DAY {year:04}-{month:02}-{day:02} ***")
-                plot_segment(file_helper, year, month, day)
+def parse_arguments():
+    """CLI definition."""
+    parser = ArgumentParser(description=USAGE, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "intervals",
+        nargs="+",
+        metavar="time-interval",
+        help="Of the form yearRange/monthRange/dayRange or yearRange/monthRange.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        default=1,
+        help="Number of worker processes, each plotting a day at a time. By default, 1.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        default=False,
+        help="Regenerate the plots even if newer than their score and audio files.",
+    )
+    parser.add_argument(
+        "--audio-base-dir",
+        type=str,
+        metavar="dir",
+        default=DEFAULT_AUDIO_BASE_DIR,
+        help=f"Audio base directory. By default, {DEFAULT_AUDIO_BASE_DIR}.",
+    )
+    parser.add_argument(
+        "--score-base-dir",
+        type=str,
+        metavar="dir",
+        default=DEFAULT_SCORE_BASE_DIR,
+        help=f"Score base directory. By default, {DEFAULT_SCORE_BASE_DIR}.",
+    )
+    parser.add_argument(
+        "--use-archive",
+        action="store_true",
+        default=False,
+        help="Read the scores from the per-year score archives instead of the per-day files.",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1:
+        opts = parse_arguments()
+        main(
+            opts.intervals,
+            opts.workers,
+            opts.audio_base_dir,
+            opts.score_base_dir,
+            opts.use_archive,
+            opts.force,
+        )
+    else:
+        print(USAGE)
@@ -4,18 +4,19 @@ Module for plotting the results for a day.
 """
 
 from argparse import ArgumentParser, RawTextHelpFormatter
+from collections.abc import Iterable
 
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib import gridspec
 
 from hwsd.file_helper import DEFAULT_AUDIO_BASE_DIR, DEFAULT_SCORE_BASE_DIR, FileHelper
-from hwsd.plotting import plot_scores, plot_spectrogram_scipy
+from hwsd.plotting import DEFAULT_TIME_BINS, plot_ltsa, plot_scores, plot_spectrogram_streaming
 
 
 def plot_results(
     scores: np.ndarray,
-    signal: np.ndarray,
+    signal: np.ndarray | Iterable[np.ndarray] | None,
     sample_rate: int,
     hydrophone_sensitivity: float,
     title: str | None = None,
@@ -24,13 +25,23 @@ def plot_results(
     scores_med_filt_size: int | None = None,
     show_plot: bool = True,
     out_image_filename: str | None = None,
+    signal_seconds: int | None = None,
+    ltsa: np.ndarray | None = None,
 ):
     """
     Creates a combined figure with spectrogram and score plots.
+    The signal can also be given as consecutive blocks (e.g., from
+    FileHelper.iter_audio_segment) with its `signal_seconds` duration,
+    so it's never completely in memory.
+    Alternatively, the spectrogram is drawn from the given `ltsa` segment
+    (see hwsd/spectra.py), with no signal needed.
     """
 
-    # As numpy array:
-    signal = np.array(signal)
+    if ltsa is None and signal_seconds is None:
+        # As a single block:
+        signal = np.asarray(signal, dtype=np.float32)
+        signal_seconds = len(signal) // sample_rate
+        signal = [signal]
 
     fig = plt.figure(figsize=(24, 8))
     grid = gridspec.GridSpec(2, 1, height_ratios=[1, 1])
@@ -38,13 +49,18 @@ def plot_results(
     # Plot spectrogram:
     print("    plotting spectrogram")
     plt.subplot(grid[0])
-    plot_spectrogram_scipy(
-        signal,
-        sample_rate,
-        hydrophone_sensitivity,
-        title,
-        with_colorbar=False,
-    )
+    if ltsa is not None:
+        plot_ltsa(ltsa, sample_rate, hydrophone_sensitivity, title, with_colorbar=False)
+    else:
+        assert signal is not None and signal_seconds is not None
+        plot_spectrogram_streaming(
+            signal,
+            signal_seconds,
+            sample_rate,
+            hydrophone_sensitivity,
+            title,
+            with_colorbar=False,
+        )
 
     # Plot scores:
     print("    plotting scores")
@@ -54,6 +70,7 @@ def plot_results(
         with_dots=scores_with_dots,
         with_steps=scores_with_steps,
         med_filt_size=scores_med_filt_size,
+        max_points=DEFAULT_TIME_BINS,
     )
 
     plt.tight_layout()
@@ -65,6 +82,29 @@ def plot_results(
     if show_plot:
         plt.show()
 
+    # so figures don't accumulate when plotting many days:
+    plt.close(fig)
+
+
+def get_plot_filename(
+    score_base_dir: str,
+    year: int,
+    month: int,
+    day: int,
+    at_hour: int = 0,
+    at_minute: int = 0,
+    hours: int = 24,
+    minutes: int = 0,
+) -> str:
+    """The image file for a plotted segment, next to the day's score file."""
+    scores_dest_dir = f"{score_base_dir}/{year:04}/{month:02}"
+    if at_hour == 0 and at_minute == 0 and hours == 24 and minutes == 0:
+        return f"{scores_dest_dir}/Scores-{year:04}{month:02}{day:02}.png"
+    return (
+        f"{scores_dest_dir}/Scores-{year:04}{month:02}{day:02}"
+        + f"-at-{at_hour:02}h{at_minute:02}m-dur-{hours:02}h{minutes:02}m.png"
+    )
+
 
 def plot_segment(
     file_helper: FileHelper,
@@ -76,32 +116,50 @@ def plot_segment(
     hours: int = 24,
     minutes: int = 0,
     show_plot: bool = False,
-):
-    """Plots an audio segment."""
+    from_ltsa: bool = True,
+) -> str | None:
+    """
+    Plots an audio segment.
+    With `from_ltsa`, the spectrogram is drawn from the day's LTSA (see
+    hwsd/spectra.py) if computed for all the scored seconds in the segment,
+    with no audio reads; otherwise, from the audio.
+
+    :return:  The generated image file, or None if no audio file for the day.
+    """
     print("\n==> Selecting day")
     if not file_helper.select_day(year, month, day):
-        return
+        return None
 
-    print("\n==> Loading audio segment")
-    psound_segment, psound_segment_seconds = file_helper.load_audio_segment(
-        at_hour=at_hour, at_minute=at_minute, hours=hours, minutes=minutes
-    )
+    start_second = (at_hour * 60 + at_minute) * 60
+    psound_segment_seconds = (hours * 60 + minutes) * 60
 
     scores_dest_dir = f"{file_helper.score_base_dir}/{year:04}/{month:02}"
     score_filename = f"{scores_dest_dir}/Scores-{year:04}{month:02}{day:02}.npy"
-    print(f"\n==> Loading score segment {score_filename}")
-    day_scores = np.load(score_filename)
-    day_scores_offset_seconds = (at_hour * 60 + at_minute) * 60
-    segment_scores = day_scores[day_scores_offset_seconds : day_scores_offset_seconds + psound_segment_seconds]
+    if file_helper.use_archive:
+        day_scores = file_helper.load_day_scores()
+    else:
+        print(f"\n==> Loading score segment {score_filename}")
+        day_scores = np.load(score_filename)
+    segment_scores = day_scores[start_second : start_second + psound_segment_seconds]
     print(f"     segment_scores ({len(segment_scores)}) = {segment_scores}")
 
-    if at_hour == 0 and at_minute == 0 and hours == 24 and minutes == 0:
-        out_image_filename = f"{scores_dest_dir}/Scores-{year:04}{month:02}{day:02}.png"
-    else:
-        out_image_filename = (
-            f"{scores_dest_dir}/Scores-{year:04}{month:02}{day:02}"
-            + f"-at-{at_hour:02}h{at_minute:02}m-dur-{hours:02}h{minutes:02}m.png"
-        )
+    segment_ltsa = None
+    day_ltsa = file_helper.open_day_ltsa() if from_ltsa else None
+    if day_ltsa is not None:
+        segment_ltsa = np.asarray(day_ltsa[start_second : start_second + len(segment_scores)])
+        if (np.isnan(segment_ltsa[:, 0]) & ~np.isnan(segment_scores)).any():
+            print(f"\n==> LTSA incomplete for the segment, using the audio: {file_helper.ltsa_filename}")
+            segment_ltsa = None
+        else:
+            print(f"\n==> Using LTSA {file_helper.ltsa_filename}")
+    # otherwise, only read (in blocks) as the spectrogram is computed:
+    psound_blocks = None
+    if segment_ltsa is None:
+        psound_blocks = file_helper.iter_audio_segment(start_second, psound_segment_seconds)
+
+    out_image_filename = get_plot_filename(
+        file_helper.score_base_dir, year, month, day, at_hour, at_minute, hours, minutes
+    )
 
     print(f"\n==> Plotting results -> {out_image_filename}")
     title = f"Scores for segment {year:04}-{month:02}-{day:02}"
@@ -110,7 +168,9 @@ def plot_segment(
 
     plot_results(
         segment_scores,
-        signal=psound_segment,
+        signal=psound_blocks,
+        signal_seconds=psound_segment_seconds,
+        ltsa=segment_ltsa,
         sample_rate=file_helper.sample_rate,
         hydrophone_sensitivity=-168.8,
         title=title,
@@ -119,6 +179,7 @@ def plot_segment(
         show_plot=show_plot,
         out_image_filename=out_image_filename,
     )
+    return out_image_filename
 
 
 def parse_arguments():
@@ -181,6 +242,12 @@ Examples:
         help="Additional number of minutes to plot. By default, 0",
     )
     parser.add_argument("--show-plot", action="store_true", default=False, help="Also show the plot.")
+    parser.add_argument(
+        "--from-audio",
+        action="store_true",
+        default=False,
+        help="Compute the spectrogram from the audio even if the day's LTSA is available.",
+    )
 
     return parser.parse_args()
 
@@ -197,4 +264,5 @@ if __name__ == "__main__":
         opts.hours,
         opts.minutes,
         show_plot=opts.show_plot,
+        from_ltsa=not opts.from_audio,
     )
@@ -0,0 +1,22 @@
+import os
+import tempfile
+import unittest
+
+from hwsd.plot_scores import is_plot_current
+
+
+class Test(unittest.TestCase):
+    def test_is_plot_current(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            plot, scores, audio = (os.path.join(tmp_dir, name) for name in ["plot.png", "scores.npy", "audio.wav"])
+            for filename, mtime in [(scores, 100), (audio, 50), (plot, 200)]:
+                open(filename, "w").close()
+                os.utime(filename, (mtime, mtime))
+            self.assertTrue(is_plot_current(plot, [scores, audio, None, os.path.join(tmp_dir, "missing")]))
+            os.utime(scores, (300, 300))
+            self.assertFalse(is_plot_current(plot, [scores, audio]))
+            self.assertFalse(is_plot_current(os.path.join(tmp_dir, "other.png"), [audio]))
+
+
+if __name__ == "__main__":
+    unittest.main()
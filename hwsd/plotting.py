@@ -2,6 +2,9 @@
 Plotting utilities.
 """
 
+import warnings
+from collections.abc import Iterable
+
 import matplotlib.pyplot as plt
 import numpy as np
 
@@ -10,6 +13,13 @@ import numpy as np
 # be required on notebooks, at least in Colab.
 import scipy.signal as sp_signal
 
+from hwsd.spectra import StreamingSpectrogram, log_bands, reduce_ltsa
+
+# Default resolution of the streaming spectrogram, about the pixels
+# of the spectrogram panel in plot_results (24×4 inches at 120 dpi).
+DEFAULT_TIME_BINS = 2880
+DEFAULT_FREQ_BANDS = 400
+
 
 def plot_spectrogram_scipy(
     signal: np.ndarray,
@@ -53,17 +63,151 @@ def plot_spectrogram_scipy(
     plt.title(title or f"Calibrated spectrum levels, 16 {sample_rate / 1000.0} kHz data")
 
 
+def plot_spectrogram_streaming(
+    signal_blocks: Iterable[np.ndarray],
+    seconds: int,
+    sample_rate: int,
+    hydrophone_sensitivity: float,
+    title: str | None = None,
+    with_colorbar: bool = True,
+    time_bins: int = DEFAULT_TIME_BINS,
+    num_bands: int = DEFAULT_FREQ_BANDS,
+) -> None:
+    """
+    Plots the spectrogram of a signal of `seconds` duration given in blocks,
+    as `plot_spectrogram_scipy` but in bounded memory, with the 1-second frames
+    averaged into `time_bins` columns and `num_bands` log-spaced bands
+    (see hwsd/spectra.py). For a full day, this is tens of megabytes instead
+    of the gigabytes of the complete PSD matrix.
+    """
+    spectrogram = StreamingSpectrogram(sample_rate, seconds, time_bins, num_bands)
+    for block in signal_blocks:
+        spectrogram.add(block)
+    time_edges, freq_edges, psd = spectrogram.result()
+    with np.errstate(divide="ignore"):
+        psd_db = 10 * np.log10(psd) - hydrophone_sensitivity
+    _draw_spectrogram(time_edges, freq_edges, psd_db, 30, 90, with_colorbar)
+    plt.title(title or f"Calibrated spectrum levels, {sample_rate / 1000.0} kHz data")
+
+
+def plot_ltsa(
+    ltsa: np.ndarray,
+    sample_rate: int,
+    hydrophone_sensitivity: float,
+    title: str | None = None,
+    with_colorbar: bool = True,
+    time_bins: int = DEFAULT_TIME_BINS,
+    vmin: float | None = 30,
+    vmax: float | None = 90,
+) -> None:
+    """
+    Plots a segment of a stored LTSA (see hwsd/spectra.py), as
+    `plot_spectrogram_streaming` would from the audio, with its seconds
+    averaged into `time_bins` columns. Missing seconds are left blank.
+    With `vmin`/`vmax` of None, the 5th/99th percentiles are used.
+    """
+    time_edges, levels = reduce_ltsa(ltsa, time_bins)
+    freq_edges = log_bands(sample_rate, ltsa.shape[1])[0]
+    levels -= hydrophone_sensitivity
+    finite = levels[np.isfinite(levels)]
+    if vmin is None:
+        vmin = float(np.percentile(finite, 5)) if len(finite) else None
+    if vmax is None:
+        vmax = float(np.percentile(finite, 99)) if len(finite) else None
+    _draw_spectrogram(time_edges, freq_edges, levels, vmin, vmax, with_colorbar)
+    plt.title(title or f"Calibrated spectrum levels (LTSA), {sample_rate / 1000.0} kHz data")
+
+
+def _draw_spectrogram(
+    time_edges: np.ndarray,
+    freq_edges: np.ndarray,
+    levels: np.ndarray,
+    vmin: float | None,
+    vmax: float | None,
+    with_colorbar: bool,
+) -> None:
+    plt.pcolormesh(time_edges, freq_edges, levels, vmin=vmin, vmax=vmax, cmap="Blues", shading="flat")
+    plt.yscale("log")
+    plt.ylim(freq_edges[0], freq_edges[-1])
+    plt.xlim(time_edges[0], time_edges[-1])
+
+    if with_colorbar:
+        plt.colorbar()
+
+    plt.xlabel("Seconds")
+    plt.ylabel("Frequency (Hz)")
+
+
+def nan_median_filter(values: np.ndarray, size: int) -> np.ndarray:
+    """
+    Median filter of odd `size` ignoring missing (NaN) values, with NaN where
+    the window has no values (including beyond the ends).
+    """
+    half = size // 2
+    padded = np.pad(np.asarray(values, dtype=np.float64), half, constant_values=np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, size)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN windows
+        return np.nanmedian(windows, axis=1)
+
+
+def min_max_decimate(values: np.ndarray, bins: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Splits the values into `bins` consecutive runs of equal length (but the
+    last one) and returns their centers and their NaN-aware min and max
+    (NaN for runs with no values). Drawing these keeps every peak and dip
+    that would be visible at that horizontal resolution.
+
+    :return:  (centers, mins, maxs)
+    """
+    per_bin = -(-len(values) // bins)
+    num_bins = -(-len(values) // per_bin)
+    padded = np.full(num_bins * per_bin, np.nan)
+    padded[: len(values)] = values
+    grouped = padded.reshape(num_bins, per_bin)
+    valid = ~np.isnan(grouped)
+    some = valid.any(axis=1)
+    mins = np.where(some, np.where(valid, grouped, np.inf).min(axis=1), np.nan)
+    maxs = np.where(some, np.where(valid, grouped, -np.inf).max(axis=1), np.nan)
+    centers = np.minimum(np.arange(num_bins) * per_bin + (per_bin - 1) / 2, len(values) - 1)
+    return centers, mins, maxs
+
+
 def plot_scores(
     scores: np.ndarray,
     with_steps: bool = False,
     with_dots: bool = True,
     med_filt_size: int | None = None,
+    max_points: int | None = None,
 ) -> None:
-    """Plots the given scores."""
+    """
+    Plots the given scores.
+    With `max_points` (e.g., the plot width in pixels), longer scores are
+    drawn decimated to that many columns (see min_max_decimate), each one
+    as a vertical bar over its min-max range (instead of steps and dots),
+    which looks the same at that resolution, at a fraction of the cost.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    meds = nan_median_filter(scores, med_filt_size) if med_filt_size is not None else None
+
+    plt.grid(axis="x", color="0.95")
+    plt.ylabel("Model Score")
+    plt.xlabel("Seconds")
+
+    if max_points is not None and len(scores) > max_points:
+        # with round caps and the width of the markers below, as if drawn as overlapping dots:
+        for values, color in [(scores, "lightgrey"), (meds, "black")]:
+            if values is not None:
+                centers, mins, maxs = min_max_decimate(values, max_points)
+                plt.vlines(centers, mins, maxs, color=color, linewidth=9, capstyle="round")
+        plt.xlim(xmin=0, xmax=len(scores) - 1)
+        return
 
     if with_steps:
         # repeat last value to also see a step at the end:
         scores = np.concatenate((scores, scores[-1:]))
+        if meds is not None:
+            meds = np.concatenate((meds, meds[-1:]))
         x_values = range(len(scores))
         plt.step(x_values, scores, where="post")
     else:
@@ -72,13 +216,7 @@ def plot_scores(
     if with_dots:
         plt.plot(x_values, scores, "o", color="lightgrey", markersize=9)
 
-    plt.grid(axis="x", color="0.95")
-    plt.xlim(xmin=0, xmax=len(scores) - 1)
-    plt.ylabel("Model Score")
-    plt.xlabel("Seconds")
-
-    if med_filt_size is not None:
-        scores_int = [int(s * 1000) for s in scores]
-        meds_int = sp_signal.medfilt(scores_int, kernel_size=med_filt_size)
-        meds = [m / 1000.0 for m in meds_int]
+    if meds is not None:
         plt.plot(x_values, meds, "p", color="black", markersize=9)
+
+    plt.xlim(xmin=0, xmax=len(scores) - 1)
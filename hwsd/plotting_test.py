@@ -0,0 +1,31 @@
+import unittest
+
+import numpy as np
+import scipy.signal as sp_signal
+
+from hwsd.plotting import min_max_decimate, nan_median_filter
+
+
+class Test(unittest.TestCase):
+    def test_nan_median_filter(self):
+        values = np.random.default_rng(0).random(100)
+        # as scipy's away from the ends (where scipy pads with zeros):
+        np.testing.assert_allclose(nan_median_filter(values, 5)[2:-2], sp_signal.medfilt(values, 5)[2:-2])
+
+        values[10:20] = np.nan
+        meds = nan_median_filter(values, 5)
+        self.assertEqual(len(meds), 100)
+        self.assertEqual(meds[9], np.median(values[7:10]))
+        self.assertTrue(np.isnan(meds[12:18]).all())
+
+    def test_min_max_decimate(self):
+        values = np.arange(10, dtype=np.float64)
+        values[4:6] = np.nan
+        centers, mins, maxs = min_max_decimate(values, 4)
+        np.testing.assert_allclose(centers, [1, 4, 7, 9])
+        np.testing.assert_allclose(mins, [0, 3, 6, 9])
+        np.testing.assert_allclose(maxs, [2, 3, 8, 9])
+
+
+if __name__ == "__main__":
+    unittest.main()
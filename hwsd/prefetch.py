@@ -0,0 +1,84 @@
+"""
+Background prefetching utilities.
+"""
+
+import queue
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+# Marks the end of the produced items in the queue.
+_DONE = object()
+
+
+class Prefetcher(Generic[T]):
+    """
+    Iterates the given items in a background thread, keeping up to `depth`
+    of them ready in a bounded queue while the consumer works on the
+    current one.
+
+    Any exception raised while producing an item is re-raised in the
+    consumer at the corresponding position.
+
+    Accumulated times (in seconds):
+    - `producer_seconds`: spent by the background thread producing items
+    - `wait_seconds`: spent by the consumer waiting for the next item
+    """
+
+    def __init__(self, items: Iterable[T], depth: int = 1):
+        assert depth >= 1, depth
+        self.producer_seconds: float = 0.0
+        self.wait_seconds: float = 0.0
+        self._items = items
+        self._queue: queue.Queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._produce, name="prefetcher", daemon=True)
+        self._thread.start()
+
+    def _put(self, entry) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self) -> None:
+        iterator = iter(self._items)
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._put((_DONE, None))
+                return
+            except BaseException as exc:  # handed over to the consumer
+                self._put((_DONE, exc))
+                return
+            finally:
+                self.producer_seconds += time.time() - started
+            if not self._put((item, None)):
+                return
+
+    def __iter__(self) -> Iterator[T]:
+        try:
+            while True:
+                started = time.time()
+                item, exc = self._queue.get()
+                self.wait_seconds += time.time() - started
+                if item is _DONE:
+                    if exc is not None:
+                        raise exc
+                    return
+                yield item
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Stops the background thread, discarding any pending items."""
+        self._stop.set()
+        self._thread.join()
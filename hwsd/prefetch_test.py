@@ -0,0 +1,26 @@
+import unittest
+
+from hwsd.prefetch import Prefetcher
+
+
+class Test(unittest.TestCase):
+    def test_prefetcher_order(self):
+        self.assertEqual(list(Prefetcher(range(10), depth=3)), list(range(10)))
+
+    def test_prefetcher_exception(self):
+        def items():
+            yield 1
+            raise ValueError("boom")
+
+        received = []
+        with self.assertRaises(ValueError):
+            for item in Prefetcher(items()):
+                received.append(item)
+        self.assertEqual(received, [1])
+
+    def test_prefetcher_early_stop(self):
+        prefetcher = Prefetcher(iter(range(1000)), depth=2)
+        for item in prefetcher:
+            if item == 3:
+                break
+        self.assertFalse(prefetcher._thread.is_alive())
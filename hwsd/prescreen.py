@@ -0,0 +1,148 @@
+"""
+Cheap pre-screen of the audio, to skip model inference on empty stretches.
+
+Per second, the RMS (of the de-meaned signal) and the mean spectrum level in
+the humpback song band (SONG_BAND, as calibrated with HYDROPHONE_SENSITIVITY)
+are computed with a single vectorized FFT over the 1-second frames. A second
+is active unless it's a dropout (RMS at most DROPOUT_RMS, e.g., zero-filled
+gaps) or quiet (band level below QUIET_LEVEL_DB). The seconds within the
+model's context of an active second are retained, as their scores may depend
+on it, as well as any run of inactive seconds shorter than MIN_SKIP_SECONDS.
+The other seconds are left as missing (NaN) scores, with no model inference.
+
+The skipped seconds are also recorded in a per-day mask next to the scores
+(see FileHelper.open_day_skipped), so `--resume` and `--incremental` take
+them as done, rather than as pending like other missing scores; readers of
+the scores just see NaN. See scripts/validate_prescreen.py to check the
+settings against the scores of historical days.
+"""
+
+import numpy as np
+
+from hwsd.metrics import span
+from hwsd.misc import batched
+from hwsd.model_helper import ModelChunk, ModelHelper
+from hwsd.spectra import frame_psd
+
+# Adjust as needed, then check with scripts/validate_prescreen.py:
+SONG_BAND = (100.0, 2000.0)  # Hz
+QUIET_LEVEL_DB = 40.0  # dB re 1 µPa²/Hz, mean level in the song band
+DROPOUT_RMS = 1e-6  # volts
+MIN_SKIP_SECONDS = 30
+
+# dB re V/µPa, as in hwsd/plot_scores_day.py.
+HYDROPHONE_SENSITIVITY = -168.8
+
+
+def prescreen_params() -> dict:
+    """The pre-screen settings, for the provenance of the scores (see hwsd/provenance.py)."""
+    return {
+        "song_band": list(SONG_BAND),
+        "quiet_level_db": QUIET_LEVEL_DB,
+        "dropout_rms": DROPOUT_RMS,
+        "min_skip_seconds": MIN_SKIP_SECONDS,
+    }
+
+
+def second_levels(psound: np.ndarray, sample_rate: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Per (started) second of the signal, its RMS, and its mean spectrum level
+    in SONG_BAND in dB re 1 µPa²/Hz (-inf for silence).
+
+    :return:  (rms, band_level_db)
+    """
+    seconds = -(-len(psound) // sample_rate)
+    frames = np.zeros((seconds, sample_rate), dtype=np.float32)
+    frames.reshape(-1)[: len(psound)] = psound
+    # (the zero padding of the last second is not counted as signal:)
+    lengths = np.full(seconds, sample_rate)
+    lengths[-1:] = len(psound) - (seconds - 1) * sample_rate
+    means = frames.sum(axis=1) / lengths
+    centered = frames - means[:, np.newaxis]
+    centered.reshape(-1)[len(psound) :] = 0
+    rms = np.sqrt(np.square(centered).sum(axis=1) / lengths)
+
+    psd = frame_psd(frames, sample_rate)
+    low, high = (int(round(frequency)) for frequency in SONG_BAND)
+    with np.errstate(divide="ignore"):
+        band_level_db = 10 * np.log10(psd[:, low : high + 1].mean(axis=1)) - HYDROPHONE_SENSITIVITY
+    return rms, band_level_db
+
+
+def active_seconds(psound: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Whether each (started) second of the signal is active (see module doc)."""
+    rms, band_level_db = second_levels(psound, sample_rate)
+    return (rms > DROPOUT_RMS) & (band_level_db >= QUIET_LEVEL_DB)
+
+
+def retained_seconds(active: np.ndarray, context_seconds: int, min_skip_seconds: int = MIN_SKIP_SECONDS) -> np.ndarray:
+    """
+    The seconds to score: those within `context_seconds` of an active second,
+    along with the runs of other seconds shorter than `min_skip_seconds`.
+    """
+    window = np.ones(2 * context_seconds + 1)
+    retained = np.convolve(active.astype(np.float64), window, mode="same") > 0.5
+
+    edges = np.diff((~retained).astype(np.int8), prepend=0, append=0)
+    for run_start, run_end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1), strict=True):
+        if run_end - run_start < min_skip_seconds:
+            retained[run_start:run_end] = True
+    return retained
+
+
+def gate_chunk(chunk: ModelChunk, sample_rate: int, context_seconds: int) -> tuple[list[ModelChunk], np.ndarray]:
+    """
+    Splits the chunk into sub-chunks covering the runs of its seconds of
+    interest to score, each one with (up to) `context_seconds` of its audio
+    on each side.
+
+    :return:  (sub-chunks, with start_second relative to the chunk's; retained mask of its seconds of interest)
+    """
+    active = active_seconds(chunk.psound, sample_rate)
+    retained = retained_seconds(active, context_seconds)
+    retained = retained[chunk.context_seconds : chunk.context_seconds + chunk.seconds]
+
+    sub_chunks = []
+    edges = np.diff(retained.astype(np.int8), prepend=0, append=0)
+    for run_start, run_end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1), strict=True):
+        left = min(context_seconds, chunk.context_seconds + run_start)
+        from_sample = (chunk.context_seconds + run_start - left) * sample_rate
+        to_sample = (chunk.context_seconds + run_end + context_seconds) * sample_rate
+        sub_chunks.append(
+            ModelChunk(int(run_start), int(run_end - run_start), chunk.psound[from_sample:to_sample], left)
+        )
+    return sub_chunks, retained
+
+
+def apply_model_gated(
+    model_helper: ModelHelper,
+    chunks: list[ModelChunk],
+    sample_rate: int,
+) -> tuple[list[np.ndarray], int]:
+    """
+    As ModelHelper.apply_model_chunks, but only scoring the seconds retained
+    by the pre-screen, with NaN for the skipped ones.
+
+    :return:  (for each chunk, the scores for its seconds of interest; skipped seconds)
+    """
+    with span("prescreen", audio_seconds=sum(chunk.seconds for chunk in chunks)) as fields:
+        gated = [gate_chunk(chunk, sample_rate, model_helper.context_seconds) for chunk in chunks]
+        skipped_seconds = sum(int((~retained).sum()) for _, retained in gated)
+        fields["skipped_seconds"] = skipped_seconds
+
+    # in batches of as many sub-chunks as chunks, so no more audio than the chunks' at a time:
+    sub_chunks = [sub_chunk for chunk_sub_chunks, _ in gated for sub_chunk in chunk_sub_chunks]
+    sub_scores = (
+        scores
+        for sub_batch in batched(sub_chunks, len(chunks))
+        for scores in model_helper.apply_model_chunks(sub_batch)
+    )
+
+    batch_scores = []
+    for chunk, (chunk_sub_chunks, _) in zip(chunks, gated, strict=True):
+        scores = np.full(chunk.seconds, np.nan, dtype=np.float32)
+        for sub_chunk in chunk_sub_chunks:
+            sub_chunk_scores = next(sub_scores)
+            scores[sub_chunk.start_second : sub_chunk.start_second + len(sub_chunk_scores)] = sub_chunk_scores
+        batch_scores.append(scores)
+    return batch_scores, skipped_seconds
@@ -0,0 +1,38 @@
+import unittest
+
+import numpy as np
+
+from hwsd.model_helper import SAMPLE_RATE, split_into_chunks
+from hwsd.model_helper_test import WindowedEnergyModel
+from hwsd.prescreen import active_seconds, apply_model_gated, retained_seconds
+
+
+class Test(unittest.TestCase):
+    def test_retained_seconds(self):
+        active = np.zeros(100, dtype=bool)
+        active[[10, 50]] = True
+        retained = retained_seconds(active, 4, min_skip_seconds=20)
+        # the runs of 31 and 45 seconds are skipped, the shorter leading one not:
+        np.testing.assert_array_equal(np.flatnonzero(~retained), np.r_[15:46, 55:100])
+        self.assertTrue(retained_seconds(active, 4, min_skip_seconds=46).all())
+
+    def test_active_seconds(self):
+        psound = np.random.default_rng(0).normal(scale=0.3, size=10 * SAMPLE_RATE)
+        psound[3 * SAMPLE_RATE : 6 * SAMPLE_RATE] = 0.5  # a constant (DC) dropout
+        psound[8 * SAMPLE_RATE :] *= 1e-6  # quiet
+        np.testing.assert_array_equal(active_seconds(psound, SAMPLE_RATE), [1, 1, 1, 0, 0, 0, 1, 1, 0, 0])
+
+    def test_gated_scores(self):
+        model = WindowedEnergyModel()
+        psound = np.random.default_rng(0).normal(scale=0.3, size=300 * SAMPLE_RATE)
+        psound[100 * SAMPLE_RATE : 200 * SAMPLE_RATE] = 0
+        chunks = list(split_into_chunks(psound, 150, model.context_seconds))
+        whole = model.apply_model(psound)
+
+        batch_scores, skipped_seconds = apply_model_gated(model, chunks, SAMPLE_RATE)
+        scores = np.concatenate(batch_scores)
+        skipped = np.isnan(scores)
+        self.assertEqual(skipped_seconds, skipped.sum())
+        context_seconds = model.context_seconds
+        np.testing.assert_array_equal(np.flatnonzero(skipped), np.arange(100 + context_seconds, 200 - context_seconds))
+        np.testing.assert_allclose(scores[~skipped], whole[~skipped])
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Hourly song presence aggregates.
+
+For each year, and each hour of each day, the table keeps the number of
+scored seconds, the sum of the scores (for the mean), and, for each
+threshold in PRESENCE_THRESHOLDS, the number of seconds with a score at or
+above it. Each of these is a memory-mappable (day-of-year × 24) .npy file
+under `{score_base_dir}/{year:04}/`:
+    Presence-{year:04}-scored.npy          int32
+    Presence-{year:04}-sum.npy             float64
+    Presence-{year:04}-above-{t:.2f}.npy   int32, per threshold
+
+The hours are updated as each chunk is scored (see apply_model_day) and as
+each day's scores are saved (see FileHelper), so hourly and daily presence
+over any period is a lookup, see `read_presence`.
+For the existing scores, or after changing PRESENCE_THRESHOLDS (a threshold
+only needs its own file to be built), rebuild the table with this script,
+see USAGE. Each process only writes the rows of the days it handles, so the
+days can be rebuilt in parallel, also while scoring other days.
+"""
+
+import csv
+import multiprocessing
+import os
+import sys
+import time
+from argparse import ArgumentParser, RawTextHelpFormatter
+from calendar import isleap
+from datetime import date
+from typing import NamedTuple
+
+import numpy as np
+
+from hwsd.file_helper import DAY_SECONDS, DEFAULT_SCORE_BASE_DIR
+from hwsd.misc import create_filled_npy, elapsed_end, parse_days
+from hwsd.score_archive import ScoreArchive
+
+# Adjust as needed, then rebuild the table for the existing scores:
+PRESENCE_THRESHOLDS = (0.5, 0.7, 0.9)
+
+HOUR_SECONDS = 60 * 60
+
+USAGE = """
+hwsd/presence.py: (Re)builds the hourly presence table from the existing scores,
+or exports it as CSV.
+Usage:
+    $ hwsd/presence.py [--workers N] [--thresholds t ...] [--use-archive] time-interval ...
+    $ hwsd/presence.py --export file.csv time-interval ...
+with time intervals as in hwsd/apply_model.py. See README.md for more details.
+"""
+
+
+def hour_stats(
+    day_scores: np.ndarray,
+    first_hour: int,
+    end_hour: int,
+    thresholds: tuple[float, ...] = PRESENCE_THRESHOLDS,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Presence statistics of the given day scores for the hours from `first_hour` to `end_hour` (exclusive).
+
+    :return:  (scored seconds, score sums, seconds at or above each threshold (thresholds × hours))
+    """
+    hours = np.asarray(day_scores[first_hour * HOUR_SECONDS : end_hour * HOUR_SECONDS]).reshape(-1, HOUR_SECONDS)
+    valid = ~np.isnan(hours)
+    scored = valid.sum(axis=1)
+    sums = np.where(valid, hours, 0).sum(axis=1, dtype=np.float64)
+    filled = np.where(valid, hours, -np.inf)
+    above = np.array([(filled >= threshold).sum(axis=1) for threshold in thresholds]).reshape(len(thresholds), -1)
+    return scored, sums, above
+
+
+class PresenceTable:
+    """
+    The presence table for a year.
+    """
+
+    def __init__(
+        self,
+        year: int,
+        score_base_dir: str = DEFAULT_SCORE_BASE_DIR,
+        thresholds: tuple[float, ...] = PRESENCE_THRESHOLDS,
+    ):
+        self.year: int = year
+        self.score_base_dir: str = score_base_dir
+        self.thresholds: tuple[float, ...] = thresholds
+
+    @property
+    def num_days(self) -> int:
+        return 366 if isleap(self.year) else 365
+
+    def filename(self, name: str | float) -> str:
+        """Filename for "scored", "sum", or a threshold."""
+        tag = name if isinstance(name, str) else f"above-{name:.2f}"
+        return f"{self.score_base_dir}/{self.year:04}/Presence-{self.year:04}-{tag}.npy"
+
+    def day_index(self, month: int, day: int) -> int:
+        return (date(self.year, month, day) - date(self.year, 1, 1)).days
+
+    def open(self, name: str | float, writable: bool = False) -> np.memmap | None:
+        """
+        Opens the given file as a memory map, initializing it if writable and
+        not already created. None if not writable and not created.
+        """
+        filename = self.filename(name)
+        if writable:
+            dtype = np.float64 if name == "sum" else np.int32
+            create_filled_npy(filename, (self.num_days, 24), dtype, 0)
+        elif not os.path.isfile(filename):
+            return None
+        return np.lib.format.open_memmap(filename, mode="r+" if writable else "r")
+
+    def update_hours(
+        self,
+        month: int,
+        day: int,
+        day_scores: np.ndarray,
+        start_second: int = 0,
+        seconds: int = DAY_SECONDS,
+    ) -> None:
+        """Updates the hours overlapping the given range of the day from the day scores."""
+        first_hour = start_second // HOUR_SECONDS
+        end_hour = min(24, -(-(start_second + seconds) // HOUR_SECONDS))
+        scored, sums, above = hour_stats(day_scores, first_hour, end_hour, self.thresholds)
+        index = self.day_index(month, day)
+        for name, values in [("scored", scored), ("sum", sums), *zip(self.thresholds, above, strict=True)]:
+            array = self.open(name, writable=True)
+            assert array is not None
+            array[index, first_hour:end_hour] = values
+            array.flush()
+
+
+class Presence(NamedTuple):
+    """Result of `read_presence`, with (days × 24) arrays."""
+
+    days: np.ndarray  # datetime64[D]
+    scored: np.ndarray  # scored seconds
+    sums: np.ndarray  # sum of the scores
+    above: dict[float, np.ndarray]  # seconds at or above each threshold
+
+    def mean(self, axis: int | None = None) -> np.ndarray:
+        """Mean score, per hour, or over the given axis (e.g., 1 for daily), NaN where nothing scored."""
+        scored, sums = (self.scored, self.sums) if axis is None else (self.scored.sum(axis), self.sums.sum(axis))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums / scored
+
+    def fraction(self, threshold: float, axis: int | None = None) -> np.ndarray:
+        """Fraction of scored seconds at or above the threshold, as with `mean`."""
+        scored, above = self.scored, self.above[threshold]
+        if axis is not None:
+            scored, above = scored.sum(axis), above.sum(axis)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return above / scored
+
+
+def read_presence(
+    start: date,
+    end: date,
+    score_base_dir: str = DEFAULT_SCORE_BASE_DIR,
+    thresholds: tuple[float, ...] = PRESENCE_THRESHOLDS,
+) -> Presence:
+    """
+    Reads the presence table for the days from `start` to `end` (inclusive),
+    with zeros for days not in the table (and NaN for thresholds not built).
+    """
+    num_days = (end - start).days + 1
+    scored = np.zeros((num_days, 24), dtype=np.int32)
+    sums = np.zeros((num_days, 24), dtype=np.float64)
+    above = {threshold: np.zeros((num_days, 24)) for threshold in thresholds}
+    pos = 0
+    current = start
+    while pos < num_days:
+        table = PresenceTable(current.year, score_base_dir, thresholds)
+        take = min(num_days - pos, (date(current.year, 12, 31) - current).days + 1)
+        index = table.day_index(current.month, current.day)
+        for name, target in [("scored", scored), ("sum", sums), *above.items()]:
+            array = table.open(name)
+            if array is not None:
+                target[pos : pos + take] = array[index : index + take]
+            elif name not in ("scored", "sum"):
+                target[pos : pos + take] = np.nan
+        pos += take
+        current = date(current.year + 1, 1, 1)
+
+    days = np.datetime64(start, "D") + np.arange(num_days).astype("timedelta64[D]")
+    return Presence(days, scored, sums, above)
+
+
+def _rebuild_day(year: int, month: int, day: int, score_base_dir: str, use_archive: bool, thresholds) -> bool:
+    if use_archive:
+        archive = ScoreArchive(year, score_base_dir)
+        if not archive.exists():
+            return False
+        day_scores = archive.read_day(month, day)
+    else:
+        filename = f"{score_base_dir}/{year:04}/{month:02}/Scores-{year:04}{month:02}{day:02}.npy"
+        if not os.path.isfile(filename):
+            return False
+        day_scores = np.load(filename, mmap_mode="r")
+    PresenceTable(year, score_base_dir, thresholds).update_hours(month, day, day_scores)
+    return True
+
+
+def _rebuild_day_in_worker(args: tuple) -> bool:
+    return _rebuild_day(*args)
+
+
+def rebuild(
+    years_months_days: list[tuple[int, int, int]],
+    score_base_dir: str = DEFAULT_SCORE_BASE_DIR,
+    use_archive: bool = False,
+    thresholds: tuple[float, ...] = PRESENCE_THRESHOLDS,
+    workers: int = 1,
+) -> int:
+    """
+    (Re)builds the presence table for the given days from the existing scores,
+    with `workers` processes.
+
+    :return:  Number of days with scores.
+    """
+    tasks = [(*ymd, score_base_dir, use_archive, thresholds) for ymd in years_months_days]
+    if workers <= 1:
+        return sum(_rebuild_day(*task) for task in tasks)
+    # The files are created upfront, and not by the workers racing to do it:
+    for year in sorted({year for year, _, _ in years_months_days}):
+        table = PresenceTable(year, score_base_dir, thresholds)
+        for name in ("scored", "sum", *thresholds):
+            table.open(name, writable=True)
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        return sum(pool.imap_unordered(_rebuild_day_in_worker, tasks, chunksize=8))
+
+
+def export_csv(filename: str, presence: Presence) -> None:
+    """Writes the hourly presence as CSV, one row per hour with scores."""
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["date", "hour", "scored_seconds", "mean", *[f"fraction_{t:.2f}" for t in presence.above]])
+        mean = presence.mean()
+        fractions = [presence.fraction(threshold) for threshold in presence.above]
+        for d, h in zip(*np.nonzero(presence.scored), strict=True):
+            row = [str(presence.days[d]), h, presence.scored[d, h], f"{mean[d, h]:.4f}"]
+            writer.writerow(row + [f"{fraction[d, h]:.4f}" for fraction in fractions])
+
+
+def parse_arguments():
+    """CLI definition."""
+    parser = ArgumentParser(description=USAGE, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "intervals",
+        nargs="+",
+        metavar="time-interval",
+        help="Of the form yearRange/monthRange/dayRange or yearRange/monthRange.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        default=1,
+        help="Number of worker processes for the rebuild. By default, 1.",
+    )
+    parser.add_argument(
+        "--thresholds",
+        type=float,
+        nargs="+",
+        metavar="t",
+        default=PRESENCE_THRESHOLDS,
+        help=f"Presence thresholds. By default, {' '.join(map(str, PRESENCE_THRESHOLDS))}.",
+    )
+    parser.add_argument(
+        "--score-base-dir",
+        type=str,
+        metavar="dir",
+        default=DEFAULT_SCORE_BASE_DIR,
+        help=f"Score base directory. By default, {DEFAULT_SCORE_BASE_DIR}.",
+    )
+    parser.add_argument(
+        "--use-archive",
+        action="store_true",
+        default=False,
+        help="Read the scores from the per-year score archives instead of the per-day files.",
+    )
+    parser.add_argument(
+        "--export",
+        type=str,
+        metavar="file",
+        default=None,
+        help="Instead of rebuilding, export the hourly presence for the intervals as CSV.",
+    )
+    return parser.parse_args()
+
+
+def main(opts) -> None:
+    started = time.time()
+    years_months_days = parse_days(*opts.intervals)
+    thresholds = tuple(opts.thresholds)
+    if opts.export is not None:
+        days = [date(*ymd) for ymd in years_months_days]
+        presence = read_presence(min(days), max(days), opts.score_base_dir, thresholds)
+        export_csv(opts.export, presence)
+        print(f"==> Hourly presence written to {opts.export} in {elapsed_end(started)}")
+        return
+
+    print(f"==> Rebuilding presence for {len(years_months_days)} days, thresholds={thresholds}")
+    num_days = rebuild(years_months_days, opts.score_base_dir, opts.use_archive, thresholds, opts.workers)
+    print(f"==> Presence updated for {num_days} days in {elapsed_end(started)}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(parse_arguments())
+    else:
+        print(USAGE)
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+import numpy as np
+
+from hwsd.file_helper import DAY_SECONDS
+from hwsd.presence import PresenceTable, hour_stats, read_presence, rebuild
+
+
+class Test(unittest.TestCase):
+    def test_hour_stats(self):
+        day_scores = np.full(DAY_SECONDS, np.nan)
+        day_scores[3600:5400] = 0.8  # half of hour 1
+        day_scores[5400:7200] = 0.4
+        scored, sums, above = hour_stats(day_scores, 0, 3, thresholds=(0.5, 0.9))
+        np.testing.assert_array_equal(scored, [0, 3600, 0])
+        np.testing.assert_allclose(sums, [0, 1800 * 1.2, 0])
+        np.testing.assert_array_equal(above, [[0, 1800, 0], [0, 0, 0]])
+
+    def test_update_rebuild_and_read(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            thresholds = (0.5, 0.9)
+            day_scores = np.full(DAY_SECONDS, np.nan)
+            day_scores[:7200] = 0.95
+            table = PresenceTable(2020, base_dir, thresholds)
+            # as per chunk: only the overlapping hours are updated
+            table.update_hours(12, 31, day_scores, start_second=3000, seconds=600)
+            presence = read_presence(date(2020, 12, 31), date(2021, 1, 1), base_dir, thresholds)
+            np.testing.assert_array_equal(presence.scored[0, :3], [3600, 0, 0])
+
+            os.makedirs(f"{base_dir}/2020/12")
+            np.save(f"{base_dir}/2020/12/Scores-20201231.npy", day_scores)
+            self.assertEqual(rebuild([(2020, 12, 31), (2021, 1, 1)], base_dir, thresholds=thresholds, workers=2), 1)
+
+            presence = read_presence(date(2020, 12, 31), date(2021, 1, 1), base_dir, thresholds)
+            self.assertEqual(presence.scored.shape, (2, 24))
+            np.testing.assert_array_equal(presence.scored[0, :3], [3600, 3600, 0])
+            np.testing.assert_allclose(presence.mean(axis=1)[0], 0.95)
+            self.assertTrue(np.isnan(presence.mean(axis=1)[1]))  # no 2021 table
+            np.testing.assert_allclose(presence.fraction(0.9, axis=1)[0], 1.0)
+            self.assertEqual(presence.above[0.5][0].sum(), 7200)
+
+
+if __name__ == "__main__":
+    unittest.main()
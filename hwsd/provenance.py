@@ -0,0 +1,106 @@
+"""
+Provenance of score files.
+
+Each score file can be accompanied by a sidecar JSON manifest recording what
+produced the scores: the audio file version (size and mtime), a fingerprint of
+the model, the parameters affecting the scores, and the resampling path.
+A score file whose manifest matches the key for a new run is up to date and
+doesn't need to be recomputed (see `manifest_status`).
+"""
+
+import hashlib
+import json
+import os
+
+# Bumped if the manifest contents change in an incompatible way.
+MANIFEST_VERSION = 1
+
+# Model fingerprints already computed in this process, by model directory.
+_model_fingerprints: dict[str, str] = {}
+
+
+def audio_key(filename: str) -> dict:
+    """Identifies the version of the given audio file by its size and mtime."""
+    stat = os.stat(filename)
+    return {"path": os.path.abspath(filename), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def model_fingerprint(model_dir: str) -> str | None:
+    """
+    SHA-256 of the files in the given saved model directory (along with their
+    relative paths), or None if the directory doesn't exist (yet).
+    Computed once per process for a given directory.
+    """
+    if model_dir in _model_fingerprints:
+        return _model_fingerprints[model_dir]
+    if not os.path.isdir(model_dir):
+        return None
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(model_dir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            digest.update(os.path.relpath(path, model_dir).encode())
+            with open(path, "rb") as f:
+                while block := f.read(1 << 20):
+                    digest.update(block)
+    _model_fingerprints[model_dir] = digest.hexdigest()
+    return _model_fingerprints[model_dir]
+
+
+def make_key(audio: list[dict], model: str | None, params: dict, resampling: str) -> dict:
+    """
+    The provenance key for a score file.
+
+    :param audio:       audio_key of each file whose audio affects the scores
+    :param model:       model fingerprint
+    :param params:      parameters affecting the scores
+    :param resampling:  how the audio was brought to 10 kHz, e.g., "none", "in-process", "sox"
+    """
+    return {"version": MANIFEST_VERSION, "audio": audio, "model": model, "params": params, "resampling": resampling}
+
+
+def manifest_filename(score_filename: str) -> str:
+    """The manifest for a score file is alongside it, with .json extension."""
+    return os.path.splitext(score_filename)[0] + ".json"
+
+
+def read_manifest(filename: str) -> dict | None:
+    """The given manifest, or None if there is none (or it's invalid)."""
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(filename: str, key: dict, complete: bool = True) -> None:
+    """
+    Writes the given manifest (atomically). A manifest is written as not
+    `complete` before the scores are (re)computed, so an interrupted run
+    can later be resumed under the same key.
+    """
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, "w") as f:
+        json.dump({**key, "complete": complete}, f, indent=2)
+    os.replace(tmp_filename, filename)
+
+
+def manifest_status(filename: str, key: dict, score_filename: str) -> str:
+    """
+    Status of the scores in the given score file relative to the inputs,
+    model and parameters indicated by `key`, per the given manifest:
+
+    - "current":  completely computed under `key`, no need to recompute;
+    - "partial":  computation under `key` started but not completed;
+    - "stale":    computed under a different key, so to be recomputed;
+    - "unknown":  no score file or no manifest (e.g., scores computed before manifests).
+    """
+    manifest = read_manifest(filename)
+    if manifest is None or not os.path.isfile(score_filename):
+        return "unknown"
+    complete = manifest.pop("complete", False)
+    if key["model"] is None or manifest != key:
+        return "stale"
+    return "current" if complete else "partial"
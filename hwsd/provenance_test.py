@@ -0,0 +1,38 @@
+import os
+import tempfile
+import unittest
+
+from hwsd.provenance import make_key, manifest_status, model_fingerprint, write_manifest
+
+
+class Test(unittest.TestCase):
+    def test_manifest_status(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            score_filename = f"{base_dir}/Scores-20200101.npy"
+            manifest = f"{base_dir}/Scores-20200101.json"
+            key = make_key([{"path": "a.wav", "size": 1, "mtime_ns": 2}], "abc", {"overlap": True}, "none")
+
+            self.assertEqual(manifest_status(manifest, key, score_filename), "unknown")
+            write_manifest(manifest, key, complete=False)
+            self.assertEqual(manifest_status(manifest, key, score_filename), "unknown")  # no score file
+            with open(score_filename, "wb"):
+                pass
+            self.assertEqual(manifest_status(manifest, key, score_filename), "partial")
+            write_manifest(manifest, key)
+            self.assertEqual(manifest_status(manifest, key, score_filename), "current")
+
+            other_audio = make_key([{"path": "a.wav", "size": 1, "mtime_ns": 3}], "abc", {"overlap": True}, "none")
+            self.assertEqual(manifest_status(manifest, other_audio, score_filename), "stale")
+            other_params = make_key([{"path": "a.wav", "size": 1, "mtime_ns": 2}], "abc", {"overlap": False}, "none")
+            self.assertEqual(manifest_status(manifest, other_params, score_filename), "stale")
+
+    def test_model_fingerprint(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            model_dir = f"{base_dir}/model"
+            self.assertIsNone(model_fingerprint(model_dir))
+            os.makedirs(f"{model_dir}/variables")
+            with open(f"{model_dir}/variables/variables.data", "wb") as f:
+                f.write(b"weights")
+            fingerprint = model_fingerprint(model_dir)
+            self.assertEqual(len(fingerprint or ""), 64)
+            self.assertEqual(model_fingerprint(model_dir), fingerprint)
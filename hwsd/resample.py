@@ -0,0 +1,128 @@
+"""
+In-process streaming resampling, e.g., of the 16 kHz MARS files to the 10 kHz
+expected by the model, with no need for intermediate resampled files.
+"""
+
+from collections.abc import Iterator
+from math import ceil, gcd
+
+import numpy as np
+
+# Per `help(scipy)` one actually needs to do an explicit import
+# of certain subpackages.
+import scipy.signal as sp_signal
+import soundfile as sf
+
+# Default number of input frames read at a time.
+DEFAULT_BLOCK_FRAMES = 16_000 * 60
+
+
+class StreamingResampler:
+    """
+    Resamples by a rational factor with a polyphase FIR filter, the same as
+    `scipy.signal.resample_poly` with its default filter, but processing the
+    signal block by block in bounded memory.
+
+    The filter state across block boundaries is kept as the input samples
+    still needed by upcoming output samples, so the concatenated output is
+    the same as with a single `resample_poly` call on the whole signal.
+
+    The stream can start at any output sample that is a multiple of `up`,
+    in which case the input is expected to start at `input_start`, which
+    includes the samples needed as filter context for that first output.
+    """
+
+    def __init__(self, in_rate: int, out_rate: int, start: int = 0):
+        divisor = gcd(in_rate, out_rate)
+        self.up: int = out_rate // divisor
+        self.down: int = in_rate // divisor
+        assert start % self.up == 0, f"start must be a multiple of {self.up}"
+
+        max_rate = max(self.up, self.down)
+        half_len = 10 * max_rate
+        self.filter: np.ndarray = sp_signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+
+        # Input samples needed on each side of an output sample,
+        # rounded up to a multiple of `down` to keep blocks aligned:
+        self.margin: int = ceil((ceil(half_len / self.up) + 1) / self.down) * self.down
+
+        first_input = start // self.up * self.down
+        self.input_start: int = max(0, first_input - self.margin)
+        self._buffer: np.ndarray = np.zeros(0, dtype=np.float32)
+        self._buffer_start: int = self.input_start
+        self._next_output: int = start
+
+    def process(self, block: np.ndarray, final: bool = False) -> np.ndarray:
+        """
+        Takes the next block of input and returns all the output samples that
+        can already be determined. With `final`, the input is complete and
+        the remaining output samples are returned.
+        """
+        self._buffer = np.concatenate((self._buffer, block)) if len(self._buffer) else block
+        buffer_end = self._buffer_start + len(self._buffer)
+
+        if final:
+            end_output = ceil(buffer_end * self.up / self.down)
+        else:
+            end_output = max(0, (buffer_end - self.margin) * self.up // self.down)
+        if end_output <= self._next_output:
+            return np.zeros(0, dtype=np.float32)
+
+        # Output sample `first_output + m` corresponds to the m-th output for the buffer:
+        first_output = self._buffer_start * self.up // self.down
+        output = sp_signal.resample_poly(self._buffer, self.up, self.down, window=self.filter)
+        output = output[self._next_output - first_output : end_output - first_output].astype(np.float32)
+        self._next_output = end_output
+
+        # Keep only the input still needed:
+        keep_from = self._next_output * self.down // self.up - self.margin
+        keep_from = max(self._buffer_start, keep_from // self.down * self.down)
+        self._buffer = self._buffer[keep_from - self._buffer_start :]
+        self._buffer_start = keep_from
+        return output
+
+
+def read_resampled(
+    filename: str,
+    out_rate: int,
+    start: int,
+    frames: int,
+    block_frames: int = DEFAULT_BLOCK_FRAMES,
+) -> Iterator[np.ndarray]:
+    """
+    Reads a segment of the given audio file resampled to `out_rate`,
+    one block at a time, so only a block of input is in memory at once.
+
+    :param start:   First sample to read, in terms of `out_rate`.
+    :param frames:  Number of samples to read, in terms of `out_rate`.
+    :return:        Iterator over the resampled float32 blocks.
+    """
+    with sf.SoundFile(filename) as sound_file:
+        resampler = StreamingResampler(sound_file.samplerate, out_rate, start)
+        if start * sound_file.samplerate >= sound_file.frames * out_rate:
+            return  # beyond the end of the file
+        sound_file.seek(resampler.input_start)
+        remaining = frames
+        while remaining > 0:
+            block = sound_file.read(block_frames, dtype="float32")
+            if block.ndim > 1:
+                block = block[:, 0]
+            final = len(block) < block_frames
+            output = resampler.process(block, final)[:remaining]
+            remaining -= len(output)
+            if len(output):
+                yield output
+            if final:
+                break
+
+
+def load_resampled(filename: str, out_rate: int, start: int = 0, frames: int = -1) -> np.ndarray:
+    """
+    Like `read_resampled` but returning the whole segment (by default,
+    the complete file), still only resampling a block at a time.
+    """
+    if frames < 0:
+        info = sf.info(filename)
+        frames = ceil(info.frames * out_rate / info.samplerate) - start
+    blocks = list(read_resampled(filename, out_rate, start, frames))
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Size-bounded on-disk cache of resampled audio files, e.g., of the 16 kHz
+MARS day files resampled to the 10 kHz expected by the model, so re-scoring
+or re-plotting a recent day doesn't resample it all over again.
+
+Each entry is keyed by the source file's path, size and mtime, the target
+rate, and the format of the entry, so a modified source file is resampled
+again (its old entry is eventually evicted). When the entries exceed the
+byte budget, the least recently used ones are removed (each use of an
+entry touches its mtime, as atime is often disabled).
+
+The entries are resampled in-process (see hwsd/resample.py), and shared by
+hwsd/file_helper.py, scripts/score_file.py (instead of its `sox` intermediate
+files) and scripts/plot_score.py, per these environment variables:
+- HWSD_RESAMPLE_CACHE: the cache directory (unset or "none" to disable);
+- HWSD_RESAMPLE_CACHE_GB: the byte budget in GB (by default, DEFAULT_MAX_GB);
+- HWSD_RESAMPLE_CACHE_FORMAT: the format of the entries (see FORMATS; by default,
+  "float32", the exact resampled samples; "int16" and "flac" take half and
+  about a third of that, with the samples quantized).
+
+Run `hwsd/resample_cache.py` to report the cache usage, optionally evicting
+down to a given budget.
+"""
+
+import hashlib
+import os
+import time
+from argparse import ArgumentParser, RawTextHelpFormatter
+from collections.abc import Callable
+from math import ceil
+from pathlib import Path
+
+import soundfile as sf
+
+from hwsd.misc import elapsed_end
+from hwsd.resample import read_resampled
+
+DEFAULT_MAX_GB = 50.0
+
+# format: (soundfile format, soundfile subtype, extension)
+FORMATS = {
+    "float32": ("WAV", "FLOAT", ".wav"),
+    "int16": ("WAV", "PCM_16", ".wav"),
+    "flac": ("FLAC", "PCM_24", ".flac"),
+}
+DEFAULT_FORMAT = "float32"
+
+# Leftovers of interrupted writes older than this are removed on eviction.
+STALE_TMP_SECONDS = 24 * 60 * 60
+
+
+class ResampleCache:
+    """
+    LRU cache of resampled audio files in `cache_dir`, within `max_bytes`.
+    Safe to share among processes: entries are written under a temporary
+    name and then renamed, and an entry evicted while being read remains
+    readable through any handle already open on it.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, format: str = DEFAULT_FORMAT):
+        assert format in FORMATS, f"format must be one of {list(FORMATS)}"
+        self.cache_dir: str = cache_dir
+        self.max_bytes: int = max_bytes
+        self.format: str = format
+
+    @property
+    def resampling(self) -> str:
+        """The resampling path of the entries, for the provenance of scores (see hwsd/provenance.py)."""
+        # (as with no cache, unless quantized)
+        return "in-process" if self.format == DEFAULT_FORMAT else f"in-process:{self.format}"
+
+    def entry_filename(self, source: str, rate: int) -> str:
+        """The entry for the given source file (in its current version) resampled to `rate`."""
+        stat = os.stat(source)
+        key = f"{os.path.abspath(source)}|{stat.st_size}|{stat.st_mtime_ns}|{rate}|{self.format}"
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        extension = FORMATS[self.format][2]
+        return os.path.join(self.cache_dir, f"{Path(source).stem}-{rate}-{digest}{extension}")
+
+    def owns(self, filename: str | Path) -> bool:
+        """Whether the given file is an entry of this cache."""
+        return os.path.dirname(os.path.abspath(filename)) == os.path.abspath(self.cache_dir)
+
+    def get(self, source: str, rate: int) -> str | None:
+        """The entry for the source file at the given rate, if cached (marking it as used)."""
+        filename = self.entry_filename(source, rate)
+        try:
+            os.utime(filename)
+        except FileNotFoundError:
+            return None
+        return filename
+
+    def get_or_create(self, source: str, rate: int, create: Callable[[str], None]) -> str:
+        """
+        The entry for the source file at the given rate, first created (if not
+        cached) by calling `create` with the (temporary) filename to write.
+        """
+        filename = self.get(source, rate)
+        if filename is not None:
+            return filename
+
+        filename = self.entry_filename(source, rate)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        stem, extension = os.path.splitext(filename)
+        tmp_filename = f"{stem}.tmp{os.getpid()}{extension}"
+        try:
+            create(tmp_filename)
+            os.replace(tmp_filename, filename)
+        finally:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+        self.evict(keep=filename)
+        return filename
+
+    def resample(self, source: str, rate: int) -> str:
+        """The entry for the source file resampled in-process (see hwsd/resample.py)."""
+
+        def create(filename: str) -> None:
+            print(f"==> Resampling {source} to {rate} Hz into the resample cache {self.cache_dir}")
+            started = time.time()
+            sf_format, subtype, _ = FORMATS[self.format]
+            info = sf.info(source)
+            frames = ceil(info.frames * rate / info.samplerate)
+            with sf.SoundFile(filename, "w", rate, 1, subtype, format=sf_format) as out:
+                for block in read_resampled(source, rate, 0, frames):
+                    out.write(block)
+            print(f"    >> resampled in {elapsed_end(started)}")
+
+        return self.get_or_create(source, rate, create)
+
+    def entries(self) -> list[os.DirEntry]:
+        """The entries, least recently used first."""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        with os.scandir(self.cache_dir) as scan:
+            entries = [entry for entry in scan if entry.is_file() and ".tmp" not in entry.name]
+        return sorted(entries, key=lambda entry: entry.stat().st_mtime)
+
+    def evict(self, keep: str | None = None) -> int:
+        """
+        Removes the least recently used entries (other than `keep`) until
+        within the byte budget, as well as stale temporary files.
+
+        :return:  bytes freed
+        """
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        with os.scandir(self.cache_dir) as scan:
+            for entry in scan:
+                if ".tmp" in entry.name and time.time() - entry.stat().st_mtime > STALE_TMP_SECONDS:
+                    os.remove(entry.path)
+
+        entries = self.entries()
+        total_bytes = sum(entry.stat().st_size for entry in entries)
+        freed = 0
+        for entry in entries:
+            if total_bytes - freed <= self.max_bytes:
+                break
+            if keep is not None and os.path.abspath(entry.path) == os.path.abspath(keep):
+                continue
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue  # evicted by another process
+            print(f"    resample cache: evicted {entry.name} ({size / 2**20:,.1f} MB)")
+            freed += size
+        return freed
+
+
+def get_resample_cache() -> ResampleCache | None:
+    """The cache per the environment variables (see module doc), or None if disabled."""
+    cache_dir = os.environ.get("HWSD_RESAMPLE_CACHE", "none")
+    if cache_dir == "none" or not cache_dir:
+        return None
+    max_gb = float(os.environ.get("HWSD_RESAMPLE_CACHE_GB", DEFAULT_MAX_GB))
+    return ResampleCache(cache_dir, int(max_gb * 2**30), os.environ.get("HWSD_RESAMPLE_CACHE_FORMAT", DEFAULT_FORMAT))
+
+
+def parse_arguments():
+    """CLI definition."""
+    description = "Reports the usage of the resample cache ($HWSD_RESAMPLE_CACHE)."
+    parser = ArgumentParser(description=description, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "--evict-to-gb",
+        type=float,
+        metavar="gb",
+        default=None,
+        help="Evict the least recently used entries down to this budget. By default, none are evicted.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opts = parse_arguments()
+    cache = get_resample_cache()
+    if cache is None:
+        print("No resample cache configured (set HWSD_RESAMPLE_CACHE)")
+    else:
+        if opts.evict_to_gb is not None:
+            cache.max_bytes = int(opts.evict_to_gb * 2**30)
+            freed = cache.evict()
+            print(f"==> Evicted {freed / 2**30:,.2f} GB")
+        cache_entries = cache.entries()
+        used = sum(entry.stat().st_size for entry in cache_entries)
+        print(f"==> {cache.cache_dir}: {len(cache_entries):,} entries, {used / 2**30:,.2f} GB")
+        print(f"    budget {cache.max_bytes / 2**30:,.2f} GB, format {cache.format}")
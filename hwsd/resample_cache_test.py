@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import soundfile as sf
+
+from hwsd.resample import load_resampled
+from hwsd.resample_cache import ResampleCache
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        signal = np.random.default_rng(0).normal(scale=0.1, size=16_000 * 3 + 123).astype(np.float32)
+        self.sources = []
+        for i in range(3):
+            source = os.path.join(self.tmp_dir.name, f"test{i}-16kHz.wav")
+            sf.write(source, signal, 16_000, subtype="FLOAT")
+            self.sources.append(source)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_resample(self):
+        cache = ResampleCache(self.cache_dir, 2**30)
+        filename = cache.resample(self.sources[0], 10_000)
+        self.assertTrue(cache.owns(filename))
+        audio, rate = sf.read(filename, dtype="float32")
+        self.assertEqual(rate, 10_000)
+        np.testing.assert_array_equal(audio, load_resampled(self.sources[0], 10_000))
+        self.assertEqual(cache.get(self.sources[0], 10_000), filename)
+
+        # a modified source is a different entry:
+        os.utime(self.sources[0], ns=(0, 0))
+        self.assertIsNone(cache.get(self.sources[0], 10_000))
+
+        quantized = ResampleCache(self.cache_dir, 2**30, "int16")
+        self.assertNotEqual(quantized.resample(self.sources[0], 10_000), filename)
+        self.assertEqual(quantized.resampling, "in-process:int16")
+
+    def test_lru_eviction(self):
+        cache = ResampleCache(self.cache_dir, 2**30)
+        filenames = [cache.resample(source, 10_000) for source in self.sources[:2]]
+        entry_bytes = os.path.getsize(filenames[0])
+        os.utime(filenames[0], (1, 1))
+        os.utime(filenames[1], (2, 2))
+        cache.get(self.sources[0], 10_000)  # now the most recently used
+
+        cache.max_bytes = 2 * entry_bytes
+        cache.resample(self.sources[2], 10_000)
+        self.assertIsNotNone(cache.get(self.sources[0], 10_000))
+        self.assertIsNone(cache.get(self.sources[1], 10_000))
+        self.assertEqual(len(cache.entries()), 2)
@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import scipy.signal as sp_signal
+import soundfile as sf
+
+from hwsd.resample import StreamingResampler, load_resampled
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.signal = np.random.default_rng(0).normal(scale=0.1, size=16_000 * 3 + 123).astype(np.float32)
+        self.expected = sp_signal.resample_poly(self.signal, 5, 8)
+
+    def test_streaming_matches_whole_signal(self):
+        for block_size in (1000, 4096, 16_000, len(self.signal)):
+            resampler = StreamingResampler(16_000, 10_000)
+            blocks = []
+            for i in range(0, len(self.signal), block_size):
+                block = self.signal[i : i + block_size]
+                blocks.append(resampler.process(block, final=i + block_size >= len(self.signal)))
+            output = np.concatenate(blocks)
+            self.assertEqual(len(output), len(self.expected))
+            np.testing.assert_allclose(output, self.expected, atol=1e-6)
+
+    def test_load_resampled_segment(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "test-16kHz.wav")
+            sf.write(filename, self.signal, 16_000, subtype="FLOAT")
+            np.testing.assert_allclose(load_resampled(filename, 10_000), self.expected, atol=1e-6)
+            segment = load_resampled(filename, 10_000, start=10_000, frames=12_345)
+            np.testing.assert_allclose(segment, self.expected[10_000 : 10_000 + 12_345], atol=1e-6)
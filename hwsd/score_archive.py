@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Consolidated per-year score archive.
+
+All the scores for a year are kept in a single memory-mappable .npy file,
+`{score_base_dir}/{year:04}/Scores-{year:04}.npy`, as a (day-of-year × 86,400)
+float16 array, with NaN for missing scores, as in the per-day files.
+Compared to the per-day float64 files, this is a fourth of the size, and a
+whole year (or any range of days) is loaded with a single sequential read.
+(float16 has a resolution of ~0.0005 or better for scores in [0, 1].)
+
+Per-day score files can be imported with this script, see USAGE.
+FileHelper can also directly target the archive (`use_archive=True`).
+"""
+
+import os
+import sys
+from argparse import ArgumentParser, RawTextHelpFormatter
+from calendar import isleap
+from datetime import date, timedelta
+
+import numpy as np
+
+from hwsd.file_helper import DAY_SECONDS, DEFAULT_SCORE_BASE_DIR
+from hwsd.misc import create_filled_npy, parse_days
+
+ARCHIVE_DTYPE = np.float16
+
+USAGE = """
+hwsd/score_archive.py: Imports per-day score files into per-year archives.
+Usage:
+    $ hwsd/score_archive.py [--score-base-dir dir] time-interval ...
+with time intervals as in hwsd/apply_model.py. See README.md for more details.
+"""
+
+
+class ScoreArchive:
+    """
+    The score archive for a year.
+    """
+
+    def __init__(self, year: int, score_base_dir: str = DEFAULT_SCORE_BASE_DIR):
+        self.year: int = year
+        self.score_base_dir: str = score_base_dir
+        self.filename: str = f"{score_base_dir}/{year:04}/Scores-{year:04}.npy"
+
+    @property
+    def num_days(self) -> int:
+        return 366 if isleap(self.year) else 365
+
+    def day_index(self, month: int, day: int) -> int:
+        """Row of the given day in the archive."""
+        return (date(self.year, month, day) - date(self.year, 1, 1)).days
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.filename)
+
+    def open(self, writable: bool = False) -> np.memmap:
+        """
+        Opens the archive as a memory map, initializing the file (with all
+        scores missing) if writable and not already created.
+        """
+        if not writable:
+            return np.lib.format.open_memmap(self.filename, mode="r")
+        if not self.exists():
+            self._create()
+        return np.lib.format.open_memmap(self.filename, mode="r+")
+
+    def _create(self) -> None:
+        create_filled_npy(self.filename, (self.num_days, DAY_SECONDS), ARCHIVE_DTYPE, np.nan)
+
+    def load(self) -> np.ndarray:
+        """Loads the complete year with a single read."""
+        return np.load(self.filename)
+
+    def read_day(self, month: int, day: int) -> np.ndarray:
+        """Scores for the given day, all NaN if not in the archive."""
+        if not self.exists():
+            return np.full(DAY_SECONDS, np.nan, dtype=ARCHIVE_DTYPE)
+        return np.array(self.open()[self.day_index(month, day)])
+
+    def write_day(self, month: int, day: int, day_scores: np.ndarray) -> None:
+        """Stores the scores for the given day."""
+        archive = self.open(writable=True)
+        archive[self.day_index(month, day)] = day_scores
+        archive.flush()
+
+
+def read_days(start: date, end: date, score_base_dir: str = DEFAULT_SCORE_BASE_DIR) -> np.ndarray:
+    """
+    Reads the scores for the days from `start` to `end` (inclusive),
+    with a single sequential read per year involved.
+    Days not in the archives are all NaN.
+
+    :return:  (days × 86,400) float16 score array
+    """
+    num_days = (end - start).days + 1
+    res = np.full((max(0, num_days), DAY_SECONDS), np.nan, dtype=ARCHIVE_DTYPE)
+    row = 0
+    current = start
+    while current <= end:
+        year_end = min(end, date(current.year, 12, 31))
+        span = (year_end - current).days + 1
+        archive = ScoreArchive(current.year, score_base_dir)
+        if archive.exists():
+            first = archive.day_index(current.month, current.day)
+            res[row : row + span] = archive.open()[first : first + span]
+        row += span
+        current = year_end + timedelta(days=1)
+    return res
+
+
+def import_day_files(
+    years_months_days: list[tuple[int, int, int]], score_base_dir: str = DEFAULT_SCORE_BASE_DIR
+) -> int:
+    """
+    Imports the existing per-day score files for the given days into the
+    corresponding per-year archives.
+
+    :return:  Number of imported days.
+    """
+    imported = 0
+    archives: dict[int, tuple[ScoreArchive, np.memmap]] = {}
+    for year, month, day in years_months_days:
+        day_filename = f"{score_base_dir}/{year:04}/{month:02}/Scores-{year:04}{month:02}{day:02}.npy"
+        if not os.path.isfile(day_filename):
+            continue
+        if year not in archives:
+            archive = ScoreArchive(year, score_base_dir)
+            archives[year] = archive, archive.open(writable=True)
+        archive, scores = archives[year]
+        scores[archive.day_index(month, day)] = np.load(day_filename)
+        imported += 1
+    for archive, scores in archives.values():
+        scores.flush()
+        print(f"    {archive.filename} updated")
+    return imported
+
+
+def parse_arguments():
+    """CLI definition."""
+    parser = ArgumentParser(description=USAGE, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "intervals",
+        nargs="+",
+        metavar="time-interval",
+        help="Of the form yearRange/monthRange/dayRange or yearRange/monthRange.",
+    )
+    parser.add_argument(
+        "--score-base-dir",
+        type=str,
+        metavar="dir",
+        default=DEFAULT_SCORE_BASE_DIR,
+        help=f"Score base directory. By default, {DEFAULT_SCORE_BASE_DIR}.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        opts = parse_arguments()
+        num_imported = import_day_files(parse_days(*opts.intervals), opts.score_base_dir)
+        print(f"==> {num_imported} days imported")
+    else:
+        print(USAGE)
@@ -0,0 +1,39 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+import numpy as np
+
+from hwsd.file_helper import DAY_SECONDS
+from hwsd.score_archive import ScoreArchive, import_day_files, read_days
+
+
+class Test(unittest.TestCase):
+    def test_import_and_read(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            rng = np.random.default_rng(0)
+            day_scores = {}
+            for year, month, day in [(2019, 12, 31), (2020, 1, 1), (2020, 3, 1)]:
+                scores = rng.random(DAY_SECONDS)
+                scores[:100] = np.nan
+                day_scores[(year, month, day)] = scores
+                os.makedirs(f"{base_dir}/{year:04}/{month:02}", exist_ok=True)
+                np.save(f"{base_dir}/{year:04}/{month:02}/Scores-{year:04}{month:02}{day:02}.npy", scores)
+
+            imported = import_day_files([(2019, 12, 30), (2019, 12, 31), (2020, 1, 1), (2020, 3, 1)], base_dir)
+            self.assertEqual(imported, 3)
+
+            archive = ScoreArchive(2020, base_dir)
+            self.assertEqual(archive.load().shape, (366, DAY_SECONDS))
+            self.assertEqual(archive.day_index(3, 1), 31 + 29)
+            np.testing.assert_allclose(archive.read_day(3, 1), day_scores[(2020, 3, 1)], atol=5e-4)
+
+            days = read_days(date(2019, 12, 30), date(2020, 1, 2), base_dir)
+            self.assertEqual(days.shape, (4, DAY_SECONDS))
+            self.assertTrue(np.isnan(days[0]).all())
+            self.assertTrue(np.isnan(days[3]).all())
+            np.testing.assert_allclose(days[1], day_scores[(2019, 12, 31)], atol=5e-4)
+            np.testing.assert_allclose(days[2], day_scores[(2020, 1, 1)], atol=5e-4)
+            self.assertTrue(np.isnan(days[2, :100]).all())
+            self.assertEqual(sorted(os.listdir(f"{base_dir}/2020")), ["01", "03", "Scores-2020.npy"])  # no lock files
@@ -0,0 +1,38 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import soundfile as sf
+
+from hwsd.autotune import TrialSettings
+from hwsd.model_helper_test import WindowedEnergyModel
+from scripts.score_file import score_files
+
+
+class Test(unittest.TestCase):
+    def test_retuned_overlap_scores_current(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            wav_filename = f"{tmp_dir}/clip.wav"
+            psound = np.random.default_rng(0).normal(scale=0.1, size=150 * 10_000).astype(np.float32)
+            sf.write(wav_filename, psound, 10_000, subtype="FLOAT")
+            profile_filename = f"{tmp_dir}/hwsd-tuning.json"
+            model = WindowedEnergyModel()
+
+            def score(model_minutes: int) -> str:
+                with open(profile_filename, "w") as f:
+                    json.dump({"settings": TrialSettings(1, model_minutes, 1)._asdict()}, f)
+                with (
+                    mock.patch.dict(os.environ, {"HWSD_TUNING_PROFILE": profile_filename}),
+                    mock.patch("scripts.score_file.get_model_helper", return_value=model),
+                    mock.patch.object(model, "load_model"),
+                    mock.patch.object(model, "fingerprint", return_value="stub"),
+                ):
+                    (result,) = score_files([wav_filename], overlap=True)
+                return result.status
+
+            self.assertEqual(score(1), "ok")
+            # the tuned chunk minutes don't affect the overlap scores:
+            self.assertEqual(score(2), "current")
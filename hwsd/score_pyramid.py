@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Multi-resolution score pyramids.
+
+For each year and each level in LEVELS (10 s, 1 min, 10 min, 1 h), the
+pyramid keeps the NaN-aware min, max, mean and count of the scores in each
+interval of that length, as a memory-mappable float32 .npy file,
+`{score_base_dir}/{year:04}/Pyramid-{year:04}-{level}s.npy`, of shape
+(day-of-year × intervals-per-day × 4). Intervals with no scores have count 0
+(NaN for days never updated) and NaN statistics.
+
+The pyramid is updated as each day's scores are saved (see FileHelper), and
+can also be (re)built from the existing scores with this script, see USAGE.
+`query` picks the coarsest level giving at least the requested number of
+points (e.g., the pixel width of a plot), so a multi-year overview only
+reads the 1-hour level, a few hundred kilobytes per year.
+"""
+
+import os
+import sys
+from argparse import ArgumentParser, RawTextHelpFormatter
+from calendar import isleap
+from datetime import date, datetime
+from typing import NamedTuple
+
+import numpy as np
+
+from hwsd.file_helper import DAY_SECONDS, DEFAULT_SCORE_BASE_DIR
+from hwsd.misc import create_filled_npy, parse_days
+from hwsd.score_archive import ScoreArchive
+
+# Interval lengths in seconds, from the finest level.
+LEVELS = (10, 60, 600, 3600)
+
+# Statistics per interval, in this order in the last axis.
+STATS = ("min", "max", "mean", "count")
+
+USAGE = """
+hwsd/score_pyramid.py: (Re)builds the score pyramids from the existing scores.
+Usage:
+    $ hwsd/score_pyramid.py [--score-base-dir dir] [--use-archive] time-interval ...
+with time intervals as in hwsd/apply_model.py. See README.md for more details.
+"""
+
+
+def _stats_from_scores(scores: np.ndarray, level: int) -> np.ndarray:
+    """Statistics of the given 1-second scores over intervals of `level` seconds."""
+    grouped = scores.reshape(-1, level)
+    valid = ~np.isnan(grouped)
+    count = valid.sum(axis=1)
+    res = np.full((len(grouped), len(STATS)), np.nan, dtype=np.float32)
+    res[:, 3] = count
+    some = count > 0
+    res[some, 0] = np.where(valid, grouped, np.inf).min(axis=1)[some]
+    res[some, 1] = np.where(valid, grouped, -np.inf).max(axis=1)[some]
+    res[some, 2] = np.where(valid, grouped, 0).sum(axis=1, dtype=np.float64)[some] / count[some]
+    return res
+
+
+def _stats_from_stats(stats: np.ndarray, factor: int) -> np.ndarray:
+    """Combines the given interval statistics, `factor` intervals at a time."""
+    grouped = stats.reshape(-1, factor, len(STATS))
+    count = grouped[:, :, 3].sum(axis=1)
+    res = np.full((len(grouped), len(STATS)), np.nan, dtype=np.float32)
+    res[:, 3] = count
+    some = count > 0
+    res[some, 0] = np.nanmin(grouped[some, :, 0], axis=1)
+    res[some, 1] = np.nanmax(grouped[some, :, 1], axis=1)
+    sums = np.nansum(grouped[:, :, 2].astype(np.float64) * grouped[:, :, 3], axis=1)
+    res[some, 2] = sums[some] / count[some]
+    return res
+
+
+def compute_day_levels(day_scores: np.ndarray) -> dict[int, np.ndarray]:
+    """
+    Computes all the pyramid levels for the given day scores, each one
+    from the previous (finer) one.
+
+    :return:  (intervals × 4) statistics per level
+    """
+    levels = {LEVELS[0]: _stats_from_scores(np.asarray(day_scores, dtype=np.float32), LEVELS[0])}
+    for finer, level in zip(LEVELS[:-1], LEVELS[1:], strict=True):
+        levels[level] = _stats_from_stats(levels[finer], level // finer)
+    return levels
+
+
+class ScorePyramid:
+    """
+    The score pyramid for a year.
+    """
+
+    def __init__(self, year: int, score_base_dir: str = DEFAULT_SCORE_BASE_DIR):
+        self.year: int = year
+        self.score_base_dir: str = score_base_dir
+
+    @property
+    def num_days(self) -> int:
+        return 366 if isleap(self.year) else 365
+
+    def filename(self, level: int) -> str:
+        return f"{self.score_base_dir}/{self.year:04}/Pyramid-{self.year:04}-{level}s.npy"
+
+    def day_index(self, month: int, day: int) -> int:
+        return (date(self.year, month, day) - date(self.year, 1, 1)).days
+
+    def open(self, level: int, writable: bool = False) -> np.memmap | None:
+        """
+        Opens the given level as a memory map, initializing the file if writable
+        and not already created. None if not writable and not created.
+        """
+        filename = self.filename(level)
+        if writable:
+            create_filled_npy(filename, (self.num_days, DAY_SECONDS // level, len(STATS)), np.float32, np.nan)
+        elif not os.path.isfile(filename):
+            return None
+        return np.lib.format.open_memmap(filename, mode="r+" if writable else "r")
+
+    def update_day(self, month: int, day: int, day_scores: np.ndarray) -> None:
+        """Updates all the levels for the given day."""
+        index = self.day_index(month, day)
+        for level, stats in compute_day_levels(day_scores).items():
+            array = self.open(level, writable=True)
+            assert array is not None
+            array[index] = stats
+            array.flush()
+
+
+class PyramidQuery(NamedTuple):
+    """Result of `query`."""
+
+    level: int  # interval length in seconds
+    times: np.ndarray  # start of each interval (datetime64[s])
+    min: np.ndarray
+    max: np.ndarray
+    mean: np.ndarray
+    count: np.ndarray
+
+
+def choose_level(seconds: float, points: int) -> int:
+    """See test_choose_level"""
+    suitable = [level for level in LEVELS if seconds / level >= points]
+    return suitable[-1] if suitable else LEVELS[0]
+
+
+def query(
+    start: datetime,
+    end: datetime,
+    points: int,
+    score_base_dir: str = DEFAULT_SCORE_BASE_DIR,
+) -> PyramidQuery:
+    """
+    Statistics of the scores from `start` to `end` (exclusive; both in UTC and
+    aligned with the level intervals) at the coarsest level giving at least
+    `points` intervals, or the finest level if none does.
+    Only the needed rows of the per-year level files are read.
+    """
+    level = choose_level((end - start).total_seconds(), points)
+    per_day = DAY_SECONDS // level
+    first = int((start - datetime(start.year, start.month, start.day)).total_seconds()) // level
+    num_intervals = int((end - start).total_seconds()) // level
+    res = np.full((num_intervals, len(STATS)), np.nan, dtype=np.float32)
+    res[:, 3] = 0
+
+    # Rows (days) from each year:
+    pos = 0
+    current = start.date()
+    while pos < num_intervals:
+        pyramid = ScorePyramid(current.year, score_base_dir)
+        year_days = (date(current.year, 12, 31) - current).days + 1
+        take = min(num_intervals - pos, year_days * per_day - first)
+        array = pyramid.open(level)
+        if array is not None:
+            index = pyramid.day_index(current.month, current.day)
+            flat = array[index : index + (first + take - 1) // per_day + 1].reshape(-1, len(STATS))
+            res[pos : pos + take] = flat[first : first + take]
+        pos += take
+        first = 0
+        current = date(current.year + 1, 1, 1)
+
+    res[np.isnan(res[:, 3]), 3] = 0  # days never written
+    times = np.datetime64(start, "s") + (np.arange(num_intervals) * level).astype("timedelta64[s]")
+    return PyramidQuery(level, times, res[:, 0], res[:, 1], res[:, 2], res[:, 3])
+
+
+def build(years_months_days: list[tuple[int, int, int]], score_base_dir: str, use_archive: bool = False) -> int:
+    """
+    (Re)builds the pyramids for the given days from the existing scores.
+
+    :return:  Number of days with scores.
+    """
+    built = 0
+    for year, month, day in years_months_days:
+        if use_archive:
+            archive = ScoreArchive(year, score_base_dir)
+            if not archive.exists():
+                continue
+            day_scores = archive.read_day(month, day)
+        else:
+            filename = f"{score_base_dir}/{year:04}/{month:02}/Scores-{year:04}{month:02}{day:02}.npy"
+            if not os.path.isfile(filename):
+                continue
+            day_scores = np.load(filename)
+        ScorePyramid(year, score_base_dir).update_day(month, day, day_scores)
+        built += 1
+    return built
+
+
+def parse_arguments():
+    """CLI definition."""
+    parser = ArgumentParser(description=USAGE, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "intervals",
+        nargs="+",
+        metavar="time-interval",
+        help="Of the form yearRange/monthRange/dayRange or yearRange/monthRange.",
+    )
+    parser.add_argument(
+        "--score-base-dir",
+        type=str,
+        metavar="dir",
+        default=DEFAULT_SCORE_BASE_DIR,
+        help=f"Score base directory. By default, {DEFAULT_SCORE_BASE_DIR}.",
+    )
+    parser.add_argument(
+        "--use-archive",
+        action="store_true",
+        default=False,
+        help="Read the scores from the per-year score archives instead of the per-day files.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        opts = parse_arguments()
+        num_built = build(parse_days(*opts.intervals), opts.score_base_dir, opts.use_archive)
+        print(f"==> Pyramids updated for {num_built} days")
+    else:
+        print(USAGE)
@@ -0,0 +1,55 @@
+import tempfile
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+from hwsd.file_helper import DAY_SECONDS
+from hwsd.score_pyramid import LEVELS, ScorePyramid, choose_level, compute_day_levels, query
+
+
+class Test(unittest.TestCase):
+    def test_choose_level(self):
+        self.assertEqual(choose_level(DAY_SECONDS, 1000), 60)
+        self.assertEqual(choose_level(365 * DAY_SECONDS, 2000), 3600)
+        self.assertEqual(choose_level(3600, 1000), 10)  # the finest one, even if short of points
+
+    def test_compute_day_levels(self):
+        rng = np.random.default_rng(0)
+        day_scores = rng.random(DAY_SECONDS)
+        day_scores[:3605] = np.nan
+        levels = compute_day_levels(day_scores)
+        for level in LEVELS:
+            stats = levels[level]
+            self.assertEqual(stats.shape, (DAY_SECONDS // level, 4))
+            grouped = day_scores.reshape(-1, level)
+            some = ~np.isnan(grouped).all(axis=1)
+            np.testing.assert_allclose(stats[some, 0], np.nanmin(grouped[some], axis=1), rtol=1e-6)
+            np.testing.assert_allclose(stats[some, 1], np.nanmax(grouped[some], axis=1), rtol=1e-6)
+            np.testing.assert_allclose(stats[some, 2], np.nanmean(grouped[some], axis=1), rtol=1e-5)
+            np.testing.assert_array_equal(stats[:, 3], (~np.isnan(grouped)).sum(axis=1))
+            self.assertTrue(np.isnan(stats[~some, :3]).all())
+
+    def test_update_and_query(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            for year, month, day in [(2019, 12, 31), (2020, 1, 1)]:
+                ScorePyramid(year, base_dir).update_day(month, day, np.full(DAY_SECONDS, day / 100))
+
+            # 2 days at 1000 points: 1-minute level, across the year boundary.
+            res = query(datetime(2019, 12, 31), datetime(2020, 1, 2), 1000, base_dir)
+            self.assertEqual(res.level, 60)
+            self.assertEqual(len(res.mean), 2 * 1440)
+            np.testing.assert_allclose(res.mean[:1440], 0.31)
+            np.testing.assert_allclose(res.max[1440:], 0.01)
+            self.assertEqual(res.times[1440], np.datetime64("2020-01-01T00:00:00"))
+
+            # Missing days have count 0.
+            res = query(datetime(2020, 1, 1, 12), datetime(2020, 1, 3), 10, base_dir)
+            self.assertEqual(res.level, 3600)
+            np.testing.assert_array_equal(res.count[:12], 3600)
+            np.testing.assert_array_equal(res.count[12:], 0)
+            self.assertTrue(np.isnan(res.mean[12:]).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+Bounded-memory spectra of long signals.
+
+The spectrogram of a full day is reduced on the fly to the resolution it is
+actually shown at: the 1-second frames (as with `plot_spectrogram_scipy`)
+are averaged (in linear power) into `time_bins` columns and `num_bands`
+log-spaced frequency bands, so only a block of frames is in memory at a time.
+
+The long-term spectral average (LTSA) keeps the same 1-second frames in
+LTSA_BANDS log-spaced bands, as float16 dB re 1 V²/Hz (before hydrophone
+calibration). It's computed while scoring and stored next to the scores
+(about 11 MB per day), so plots can be redrawn with no audio at all.
+"""
+
+import numpy as np
+
+# Per `help(scipy)` one actually needs to do an explicit import
+# of certain subpackages.
+import scipy.fft as sp_fft
+import scipy.signal as sp_signal
+
+# Lowest frequency of the log-spaced bands.
+MIN_FREQUENCY = 10.0
+
+# Frames transformed at a time, bounding the memory of the FFTs.
+FRAMES_PER_FFT = 60
+
+LTSA_BANDS = 64
+LTSA_DTYPE = np.float16
+
+
+def frame_psd(frames: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    Power spectral density of each 1-second frame (rows of `frames`), as with
+    `scipy.signal.spectrogram` with the settings in `plot_spectrogram_scipy`
+    (Hann window, constant detrend, one-sided density scaling), but in float32.
+    """
+    window = sp_signal.get_window("hann", sample_rate).astype(np.float32)
+    scale = np.float32(1.0 / (sample_rate * (window**2).sum()))
+    detrended = frames - frames.mean(axis=1, keepdims=True)
+    spectrum = sp_fft.rfft(detrended * window, axis=1)
+    psd = (spectrum.real**2 + spectrum.imag**2) * scale
+    if sample_rate % 2 == 0:
+        psd[:, 1:-1] *= 2
+    else:
+        psd[:, 1:] *= 2
+    return psd
+
+
+def log_bands(
+    sample_rate: int,
+    num_bands: int,
+    min_frequency: float = MIN_FREQUENCY,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Log-spaced frequency bands from `min_frequency` to the Nyquist frequency,
+    over the frequency bins of 1-second frames (1 Hz apart).
+    Bands narrower than a bin take the nearest bin.
+
+    :return:  (band edges in Hz, first bin, end bin (exclusive)) per band
+    """
+    nyquist = sample_rate / 2
+    edges = np.geomspace(min_frequency, nyquist, num_bands + 1)
+    starts = np.minimum(np.floor(edges[:-1] + 0.5).astype(np.int64), int(nyquist))
+    ends = np.maximum(np.floor(edges[1:] + 0.5).astype(np.int64), starts + 1)
+    return edges, starts, ends
+
+
+def band_means(psd: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Mean of the `psd` rows over each band of bins."""
+    cumulative = np.zeros((len(psd), psd.shape[1] + 1), dtype=np.float64)
+    np.cumsum(psd, axis=1, out=cumulative[:, 1:])
+    return ((cumulative[:, ends] - cumulative[:, starts]) / (ends - starts)).astype(np.float32)
+
+
+class StreamingSpectrogram:
+    """
+    Spectrogram of a signal of `seconds` duration given in blocks (see `add`),
+    reduced to `time_bins` × `num_bands`.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        seconds: int,
+        time_bins: int,
+        num_bands: int,
+        min_frequency: float = MIN_FREQUENCY,
+    ):
+        self.sample_rate: int = sample_rate
+        self.num_frames: int = seconds
+        self.time_bins: int = max(1, min(time_bins, seconds))
+        self.freq_edges, self._band_starts, self._band_ends = log_bands(sample_rate, num_bands, min_frequency)
+        self._sums: np.ndarray = np.zeros((self.time_bins, num_bands), dtype=np.float64)
+        self._counts: np.ndarray = np.zeros(self.time_bins, dtype=np.int64)
+        self._pending: np.ndarray = np.zeros(0, dtype=np.float32)
+        self._next_frame: int = 0
+
+    def add(self, block: np.ndarray) -> None:
+        """Takes the next block of the signal, of any length."""
+        samples = np.concatenate((self._pending, block)) if len(self._pending) else block
+        num_frames = min(len(samples) // self.sample_rate, self.num_frames - self._next_frame)
+        for offset in range(0, num_frames, FRAMES_PER_FFT):
+            count = min(FRAMES_PER_FFT, num_frames - offset)
+            start = offset * self.sample_rate
+            frames = samples[start : start + count * self.sample_rate].reshape(count, self.sample_rate)
+            psd = frame_psd(frames.astype(np.float32, copy=False), self.sample_rate)
+            bands = band_means(psd, self._band_starts, self._band_ends)
+            columns = (self._next_frame + np.arange(count)) * self.time_bins // self.num_frames
+            np.add.at(self._sums, columns, bands)
+            np.add.at(self._counts, columns, 1)
+            self._next_frame += count
+        if self._next_frame < self.num_frames:
+            self._pending = samples[num_frames * self.sample_rate :].astype(np.float32)
+        else:
+            self._pending = np.zeros(0, dtype=np.float32)
+
+    def result(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :return:  (time edges in seconds, frequency edges in Hz,
+                  mean PSD (bands × time bins), NaN for columns with no frames)
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            psd = (self._sums / self._counts[:, None]).T.astype(np.float32)
+        time_edges = np.arange(self.time_bins + 1) * self.num_frames / self.time_bins
+        return time_edges, self.freq_edges, psd
+
+
+def ltsa_filename(score_filename: str) -> str:
+    """The LTSA file next to a `<stem>_scores.npy` file (see scripts/score_file.py): `<stem>_ltsa.npy`."""
+    return score_filename.removesuffix("_scores.npy").removesuffix(".npy") + "_ltsa.npy"
+
+
+def compute_ltsa(
+    signal: np.ndarray,
+    sample_rate: int,
+    num_bands: int = LTSA_BANDS,
+    min_frequency: float = MIN_FREQUENCY,
+) -> np.ndarray:
+    """
+    LTSA of the whole seconds of the given signal.
+
+    :return:  (seconds × num_bands) band levels in dB, as LTSA_DTYPE
+    """
+    _, starts, ends = log_bands(sample_rate, num_bands, min_frequency)
+    seconds = len(signal) // sample_rate
+    ltsa = np.empty((seconds, num_bands), dtype=LTSA_DTYPE)
+    for offset in range(0, seconds, FRAMES_PER_FFT):
+        count = min(FRAMES_PER_FFT, seconds - offset)
+        frames = signal[offset * sample_rate : (offset + count) * sample_rate].reshape(count, sample_rate)
+        bands = band_means(frame_psd(frames.astype(np.float32, copy=False), sample_rate), starts, ends)
+        with np.errstate(divide="ignore"):
+            ltsa[offset : offset + count] = 10 * np.log10(bands)
+    return ltsa
+
+
+def reduce_ltsa(ltsa: np.ndarray, time_bins: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Averages (in linear power) the LTSA seconds into `time_bins` columns,
+    ignoring missing (NaN) seconds.
+
+    :return:  (time edges in seconds, band levels in dB (bands × time bins),
+              NaN for columns with no seconds)
+    """
+    seconds = len(ltsa)
+    time_bins = max(1, min(time_bins, seconds))
+    # first second of each column (all non-empty, as time_bins <= seconds):
+    column_starts = np.searchsorted(np.arange(seconds) * time_bins // seconds, np.arange(time_bins))
+    power = 10 ** (ltsa.astype(np.float32) / 10)
+    valid = ~np.isnan(power[:, 0])
+    power[~valid] = 0
+    sums = np.add.reduceat(power, column_starts, axis=0, dtype=np.float64)
+    counts = np.add.reduceat(valid.astype(np.int64), column_starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        levels = 10 * np.log10(sums / counts[:, None]).T.astype(np.float32)
+    return np.arange(time_bins + 1) * seconds / time_bins, levels
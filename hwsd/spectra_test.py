@@ -0,0 +1,83 @@
+import unittest
+
+import numpy as np
+import scipy.signal as sp_signal
+
+from hwsd.spectra import (
+    StreamingSpectrogram,
+    band_means,
+    compute_ltsa,
+    frame_psd,
+    log_bands,
+    ltsa_filename,
+    reduce_ltsa,
+)
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.sample_rate = 10_000
+        t = np.arange(12 * self.sample_rate) / self.sample_rate
+        self.signal = (0.1 * rng.standard_normal(len(t)) + np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+    def test_frame_psd(self):
+        window = sp_signal.get_window("hann", self.sample_rate)
+        _, _, expected = sp_signal.spectrogram(
+            self.signal,
+            self.sample_rate,
+            nperseg=self.sample_rate,
+            noverlap=0,
+            window=window,
+            nfft=self.sample_rate,
+        )
+        psd = frame_psd(self.signal.reshape(-1, self.sample_rate), self.sample_rate)
+        self.assertEqual(psd.dtype, np.float32)
+        np.testing.assert_allclose(psd.T, expected, rtol=1e-3, atol=1e-6 * expected.max())
+
+    def test_log_bands(self):
+        edges, starts, ends = log_bands(self.sample_rate, 400)
+        self.assertEqual(len(edges), 401)
+        self.assertAlmostEqual(edges[0], 10)
+        self.assertAlmostEqual(edges[-1], 5000)
+        self.assertTrue((ends > starts).all())
+        self.assertLessEqual(ends.max(), self.sample_rate // 2 + 1)
+
+    def test_streaming_spectrogram(self):
+        # 12 seconds into 4 columns, given in blocks not aligned with the frames:
+        spectrogram = StreamingSpectrogram(self.sample_rate, 12, 4, 50)
+        for block in np.array_split(self.signal, 7):
+            spectrogram.add(block)
+        time_edges, freq_edges, psd = spectrogram.result()
+        np.testing.assert_allclose(time_edges, [0, 3, 6, 9, 12])
+        self.assertEqual(psd.shape, (50, 4))
+
+        _, starts, ends = log_bands(self.sample_rate, 50)
+        frames = frame_psd(self.signal.reshape(-1, self.sample_rate), self.sample_rate)
+        expected = band_means(frames, starts, ends).reshape(4, 3, 50).mean(axis=1).T
+        np.testing.assert_allclose(psd, expected, rtol=1e-5)
+        # the 440 Hz tone:
+        self.assertTrue(freq_edges[psd[:, 0].argmax()] <= 440 < freq_edges[psd[:, 0].argmax() + 1])
+
+    def test_ltsa(self):
+        ltsa = compute_ltsa(self.signal, self.sample_rate, num_bands=50)
+        self.assertEqual(ltsa.shape, (12, 50))
+        self.assertEqual(ltsa.dtype, np.float16)
+
+        # as the streaming spectrogram, with missing seconds ignored:
+        ltsa[3] = np.nan
+        time_edges, levels = reduce_ltsa(ltsa, 4)
+        np.testing.assert_allclose(time_edges, [0, 3, 6, 9, 12])
+        spectrogram = StreamingSpectrogram(self.sample_rate, 2, 1, 50)
+        spectrogram.add(self.signal[4 * self.sample_rate : 6 * self.sample_rate])
+        np.testing.assert_allclose(levels[:, 1], 10 * np.log10(spectrogram.result()[2][:, 0]), atol=0.05)
+
+        ltsa[3:6] = np.nan
+        self.assertTrue(np.isnan(reduce_ltsa(ltsa, 4)[1][:, 1]).all())
+
+    def test_ltsa_filename(self):
+        self.assertEqual(ltsa_filename("a/b_10kHz_scores.npy"), "a/b_10kHz_ltsa.npy")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Measures model throughput for several batch sizes, comparing
+ModelHelper.apply_model (batch size 1) with ModelHelper.apply_model_batch.
+
+Random noise is used as input, so no audio files are needed.
+Throughput is reported as seconds of audio scored per wall-clock second,
+along with the latency per chunk, and the first-call overhead for each batch
+shape (see ModelHelper.warm_up), e.g., to compare with and without --xla.
+
+Example:
+  uv run scripts/benchmark_batch.py --chunk-minutes 10 --batch-sizes 1 2 4 8
+
+  To compare on CPU even when a GPU is available:
+  CUDA_VISIBLE_DEVICES= uv run scripts/benchmark_batch.py
+"""
+
+import time
+from argparse import ArgumentParser, RawTextHelpFormatter
+
+import numpy as np
+
+from hwsd.misc import elapsed_end
+from hwsd.model_helper import ModelHelper
+
+SAMPLE_RATE = 10_000
+
+
+def benchmark_batch(
+    chunk_minutes: float,
+    batch_sizes: list[int],
+    total_chunks: int,
+    repeats: int,
+    xla: bool = False,
+) -> None:
+    model_helper = ModelHelper()
+    model_load_started = time.time()
+    model_helper.load_model(xla=xla)
+    print(f"    >> model loaded in {elapsed_end(model_load_started)}")
+
+    chunk_seconds = int(chunk_minutes * 60)
+    chunk_samples = chunk_seconds * SAMPLE_RATE
+    rng = np.random.default_rng(0)
+    chunks = [rng.normal(scale=0.01, size=chunk_samples).astype(np.float32) for _ in range(total_chunks)]
+    audio_seconds = total_chunks * chunk_samples / SAMPLE_RATE
+
+    print(f"\n==> {total_chunks} chunks of {chunk_minutes} min ({audio_seconds:,.0f}s of audio), best of {repeats}")
+    baseline = None
+    for batch_size in batch_sizes:
+        # so the first-call overhead is not attributed to the measured calls:
+        warm_up_started = time.time()
+        model_helper.warm_up(chunk_seconds, batch_size)
+        warm_up_seconds = time.time() - warm_up_started
+
+        best = float("inf")
+        for _ in range(repeats):
+            started = time.time()
+            for i in range(0, total_chunks, batch_size):
+                batch = chunks[i : i + batch_size]
+                if batch_size == 1:
+                    model_helper.apply_model(batch[0])
+                else:
+                    model_helper.apply_model_batch(batch)
+            best = min(best, time.time() - started)
+        throughput = audio_seconds / best
+        baseline = baseline or throughput
+        call_seconds = best / -(-total_chunks // batch_size)
+        print(
+            f"    batch_size={batch_size:<3}  {best:8.2f}s  {throughput:10,.0f} audio-s/s"
+            f"  (x{throughput / baseline:.2f} vs batch_size={batch_sizes[0]})"
+            f"  {best / total_chunks:6.2f}s/chunk  first call +{warm_up_seconds - call_seconds:.2f}s"
+        )
+
+
+def parse_arguments():
+    description = "Measures model throughput for several batch sizes."
+    parser = ArgumentParser(description=description, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "--chunk-minutes",
+        type=float,
+        default=10,
+        metavar="m",
+        help="Length in minutes of each chunk. Default: 10.",
+    )
+    parser.add_argument(
+        "--batch-sizes",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8],
+        metavar="n",
+        help="Batch sizes to measure. Default: 1 2 4 8.",
+    )
+    parser.add_argument(
+        "--chunks",
+        type=int,
+        default=8,
+        metavar="n",
+        help="Total number of chunks scored for each batch size. Default: 8.",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        metavar="n",
+        help="Number of repetitions for each batch size; the best is reported. Default: 3.",
+    )
+    parser.add_argument(
+        "--xla",
+        action="store_true",
+        default=False,
+        help="Compile the model with XLA (once per input shape).",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opts = parse_arguments()
+    benchmark_batch(opts.chunk_minutes, opts.batch_sizes, opts.chunks, opts.repeats, opts.xla)
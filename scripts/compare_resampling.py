@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Compares the in-process streaming resampling (hwsd/resample.py) of a 16 kHz
+file with the 10 kHz version generated by `sox`, both numerically and in
+terms of wall time:
+
+- intermediate-file path (as in resample_sox.sh): sox writes the 10 kHz file,
+  which is then read back;
+- direct path (as in FileHelper with a 16kHz audio base dir): the 16 kHz file
+  is read and resampled in-process, in bounded memory.
+
+Example:
+  uv run scripts/compare_resampling.py /mnt/PAM_Analysis/decimated_16kHz/2016/11/MARS-20161101T000000Z-16kHz.wav
+
+  To compare against an already generated 10 kHz file (then only the read back is timed for that path):
+  uv run scripts/compare_resampling.py path/to/MARS-...-16kHz.wav --sox-file path/to/MARS-...-10kHz.wav
+
+  To only consider the first hour:
+  uv run scripts/compare_resampling.py path/to/MARS-...-16kHz.wav --seconds 3600
+"""
+
+import shutil
+import subprocess
+import tempfile
+import time
+from argparse import ArgumentParser, RawTextHelpFormatter
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from hwsd.misc import elapsed_end
+from hwsd.resample import load_resampled
+
+TARGET_SAMPLE_RATE = 10_000
+
+
+def compare_resampling(wav_path: Path, sox_path: Path | None, seconds: int | None) -> None:
+    info = sf.info(str(wav_path))
+    print(f"==> {wav_path}: {info.samplerate} Hz, {info.duration:,.1f}s")
+    frames = seconds * TARGET_SAMPLE_RATE if seconds is not None else -1
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sox_seconds = 0.0
+        if sox_path is None:
+            if shutil.which("sox") is None:
+                raise SystemExit("`sox` not found on PATH; use --sox-file to indicate an existing 10 kHz file.")
+            sox_path = Path(tmp_dir) / (wav_path.stem + "_10kHz.wav")
+            command = ["sox", str(wav_path), "-r", str(TARGET_SAMPLE_RATE), str(sox_path)]
+            if seconds is not None:
+                command += ["trim", "0", str(seconds)]
+            print(f"==> Running {' '.join(command)}")
+            started = time.time()
+            subprocess.run(command, check=True)
+            sox_seconds = time.time() - started
+            print(f"    >> sox resampling in {elapsed_end(started)}")
+
+        print(f"==> Reading back {sox_path}")
+        started = time.time()
+        sox_signal, sox_rate = sf.read(str(sox_path), frames=frames, dtype="float32")
+        read_seconds = time.time() - started
+        print(f"    >> read in {elapsed_end(started)}")
+        assert sox_rate == TARGET_SAMPLE_RATE, sox_rate
+
+    print("==> In-process streaming resampling")
+    started = time.time()
+    signal = load_resampled(str(wav_path), TARGET_SAMPLE_RATE, 0, frames)
+    direct_seconds = time.time() - started
+    print(f"    >> resampled in {elapsed_end(started)}")
+
+    length = min(len(signal), len(sox_signal))
+    print(f"\n==> Comparison over {length:,} samples ({len(signal):,} in-process, {len(sox_signal):,} sox)")
+    reference = sox_signal[:length].astype(np.float64)
+    diff = signal[:length].astype(np.float64) - reference
+    # Margins to exclude edge effects of the two filters:
+    core = slice(TARGET_SAMPLE_RATE, max(TARGET_SAMPLE_RATE, length - TARGET_SAMPLE_RATE))
+    snr_db = 10 * np.log10(np.sum(reference[core] ** 2) / max(np.sum(diff[core] ** 2), 1e-30))
+    print(f"    max |diff|     = {np.max(np.abs(diff[core])):.3e}")
+    print(f"    rms diff       = {np.sqrt(np.mean(diff[core] ** 2)):.3e}")
+    print(f"    rms sox signal = {np.sqrt(np.mean(reference[core] ** 2)):.3e}")
+    print(f"    SNR            = {snr_db:.1f} dB")
+
+    intermediate_seconds = sox_seconds + read_seconds
+    print("\n==> Wall time")
+    if sox_seconds > 0:
+        print(f"    intermediate file (sox + read back): {intermediate_seconds:8.1f}s")
+    else:
+        print(f"    intermediate file (read back only):  {intermediate_seconds:8.1f}s")
+    print(f"    direct (read 16 kHz + resample):     {direct_seconds:8.1f}s")
+
+
+def parse_arguments():
+    description = "Compares in-process resampling of a 16 kHz file with sox."
+    parser = ArgumentParser(description=description, formatter_class=RawTextHelpFormatter)
+    parser.add_argument("wav_file", type=str, help="Path to the input 16 kHz WAV file.")
+    parser.add_argument(
+        "--sox-file",
+        type=str,
+        default=None,
+        help="Existing 10 kHz file generated by sox. By default, sox is run to generate it in a temp dir.",
+    )
+    parser.add_argument(
+        "--seconds",
+        type=int,
+        default=None,
+        help="Only consider this many seconds from the start of the file. Default: all.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opts = parse_arguments()
+    compare_resampling(
+        Path(opts.wav_file),
+        Path(opts.sox_file) if opts.sox_file else None,
+        opts.seconds,
+    )
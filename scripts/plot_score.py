@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 Creates a spectrogram + score plot for a given WAV file and its corresponding score file.
-The WAV file is assumed to be sampled at 10 kHz.
+A WAV file not sampled at 10 kHz is resampled, through the resample cache
+if enabled (see hwsd/resample_cache.py).
 
 Example:
   uv run scripts/plot_score.py path/to/MARS_20161221_000046_SongSession_10kHz_HPF5Hz.wav
@@ -16,6 +17,10 @@ Example:
 
   To save the plot to a file:
   uv run scripts/plot_score.py path/to/file.wav --output path/to/plot.png
+
+  If the LTSA generated by scripts/score_file.py is found next to the score file
+  ('_ltsa.npy' suffix), the spectrogram is drawn from it, with no need to read
+  (or even have) the WAV file. Use --from-audio to use the WAV file anyway.
 """
 
 from argparse import ArgumentParser, RawTextHelpFormatter
@@ -27,7 +32,10 @@ import scipy.signal as sp_signal
 import soundfile as sf
 from matplotlib import gridspec
 
-from hwsd.plotting import plot_scores
+from hwsd.plotting import DEFAULT_TIME_BINS, plot_ltsa, plot_scores
+from hwsd.resample import load_resampled
+from hwsd.resample_cache import get_resample_cache
+from hwsd.spectra import ltsa_filename
 
 
 def _plot_spectrogram(
@@ -57,6 +65,19 @@ def _plot_spectrogram(
     plt.title(title or f"Spectrum levels, {sample_rate / 1000.0} kHz data")
 
 
+def load_10khz(wav_path: Path) -> np.ndarray:
+    """The audio of the given file, resampled to 10 kHz if needed (see hwsd/resample_cache.py)."""
+    if sf.info(str(wav_path)).samplerate != 10_000:
+        cache = get_resample_cache()
+        if cache is None:
+            print("    resampling to 10 kHz")
+            return load_resampled(str(wav_path), 10_000)
+        wav_path = Path(cache.resample(str(wav_path), 10_000))
+        print(f"    resampled to 10 kHz: {wav_path}")
+    audio, _ = sf.read(wav_path, dtype="float32")
+    return audio[:, 0] if audio.ndim > 1 else audio
+
+
 def plot_score(
     wav_path: Path,
     score_path: Path,
@@ -64,15 +85,19 @@ def plot_score(
     duration_min: float | None,
     output: str | None,
     show: bool,
+    ltsa_path: Path | None = None,
 ) -> None:
-    print(f"==> Loading {wav_path}")
-    audio, sample_rate = sf.read(wav_path, dtype="float32")
-    if sample_rate != 10_000:
-        print(f"ERROR: Expected 10 kHz sample rate, got {sample_rate} Hz")
-        return
-    if audio.ndim > 1:
-        audio = audio[:, 0]
-    print(f"    {len(audio):,} samples ({len(audio) / sample_rate:.1f} s)")
+    """Plots the scores, with the spectrogram from the LTSA at `ltsa_path` if given, or from the WAV file."""
+    sample_rate = 10_000
+    audio = ltsa = None
+    if ltsa_path is not None:
+        print(f"==> Loading LTSA from {ltsa_path}")
+        ltsa = np.load(ltsa_path, mmap_mode="r")
+        print(f"    {len(ltsa):,} seconds")
+    else:
+        print(f"==> Loading {wav_path}")
+        audio = load_10khz(wav_path)
+        print(f"    {len(audio):,} samples ({len(audio) / sample_rate:.1f} s)")
 
     print(f"==> Loading scores from {score_path}")
     scores = np.load(score_path).flatten()
@@ -85,7 +110,10 @@ def plot_score(
     if start_sec > 0 or end_sec < len(scores):
         print(f"    slicing to [{start_sec}s, {end_sec}s)")
         scores = scores[start_sec:end_sec]
-        audio = audio[start_sec * sample_rate : end_sec * sample_rate]
+        if audio is not None:
+            audio = audio[start_sec * sample_rate : end_sec * sample_rate]
+    if ltsa is not None:
+        ltsa = np.asarray(ltsa[start_sec:end_sec])
 
     title = f"Scores for {wav_path.name}"
     if start_sec > 0 or duration_min is not None:
@@ -97,11 +125,16 @@ def plot_score(
 
     print("    plotting spectrogram")
     plt.subplot(grid[0])
-    _plot_spectrogram(audio, sample_rate, title)
+    if ltsa is not None:
+        # uncalibrated, with the color range from the percentiles, as _plot_spectrogram:
+        plot_ltsa(ltsa, sample_rate, 0.0, title, with_colorbar=False, vmin=None, vmax=None)
+    else:
+        assert audio is not None
+        _plot_spectrogram(audio, sample_rate, title)
 
     print("    plotting scores")
     fig.add_subplot(grid[1])
-    plot_scores(scores, with_dots=True, med_filt_size=25)
+    plot_scores(scores, with_dots=True, med_filt_size=25, max_points=DEFAULT_TIME_BINS)
 
     plt.tight_layout()
 
@@ -149,6 +182,12 @@ def parse_arguments():
         default=False,
         help="Display the plot interactively.",
     )
+    parser.add_argument(
+        "--from-audio",
+        action="store_true",
+        default=False,
+        help="Compute the spectrogram from the WAV file even if the LTSA is available.",
+    )
     return parser.parse_args()
 
 
@@ -160,9 +199,12 @@ if __name__ == "__main__":
     score_path = Path(opts.score_file) if opts.score_file \
         else wav_path.with_name(wav_path.stem + "_scores.npy")
 
-    if not wav_path.exists():
-        print(f"ERROR: WAV file not found: {wav_path}")
-        raise SystemExit(1)
+    ltsa_path = Path(ltsa_filename(str(score_path)))
+    if opts.from_audio or not ltsa_path.exists():
+        ltsa_path = None
+        if not wav_path.exists():
+            print(f"ERROR: WAV file not found: {wav_path}")
+            raise SystemExit(1)
     if not score_path.exists():
         print(f"ERROR: Score file not found: {score_path}")
         raise SystemExit(1)
@@ -178,4 +220,5 @@ if __name__ == "__main__":
         duration_min=opts.duration,
         output=output,
         show=opts.show,
+        ltsa_path=ltsa_path,
     )
@@ -1,34 +1,69 @@
 #!/usr/bin/env python3
 """
-Applies the Google Humpback Whale model on a given WAV file and saves the scores.
+Applies the Google Humpback Whale model on the given WAV files and saves the scores.
 
 If the input file is not at 10 kHz, it is first resampled to 10 kHz using `sox`
 (invoked as a subprocess). The resampled file is written alongside the input as
-`<stem>_10kHz.wav` and reused on subsequent runs.
+`<stem>_10kHz.wav` and reused on subsequent runs. With the resample cache
+enabled (see hwsd/resample_cache.py), it's instead resampled in-process into
+the cache, with no need for `sox`.
 
 Scores are saved with 1-second resolution as `<stem>_scores.npy` next to the
-10 kHz WAV file actually used for scoring.
+10 kHz WAV file actually used for scoring, along with a `<stem>_scores.json`
+manifest (see hwsd/provenance.py), and the audio's LTSA as `<stem>_ltsa.npy`
+(see hwsd/spectra.py), used by scripts/plot_score.py. If the manifest
+indicates the scores were already computed from the same input file version,
+model, and parameters, the file is skipped (unless `--force` is given).
+The file is read chunk by chunk (see AudioStream in hwsd/file_helper.py),
+so memory use does not grow with the length of the file.
+
+Any number of files can be given, as well as directories and glob patterns
+(e.g., for a field campaign of many SongSession clips), with the model loaded
+only once, and the upcoming files read (and resampled) while the current one
+is scored. A summary of the run is written as JSON (see --summary).
 
 Example:
   uv run scripts/score_file.py path/to/MARS_20161221_000046_SongSession.wav
 generates (resampling first if needed):
   path/to/MARS_20161221_000046_SongSession_10kHz.wav      (only if input != 10 kHz)
   path/to/MARS_20161221_000046_SongSession[_10kHz]_scores.npy
+  path/to/MARS_20161221_000046_SongSession[_10kHz]_ltsa.npy
+
+  uv run scripts/score_file.py --output-dir scores/ campaign/ "more/*_SongSession.wav" @other-files.txt
 """
 
+import glob
+import json
+import os
 import shutil
 import subprocess
 import time
+import traceback
 from argparse import ArgumentParser, RawTextHelpFormatter
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from math import ceil
 from pathlib import Path
+from typing import NamedTuple
 
 import numpy as np
 import soundfile as sf
 
-from hwsd.misc import elapsed_end
-from hwsd.model_helper import ModelHelper
+from hwsd.autotune import load_profile
+from hwsd.file_helper import AudioStream
+from hwsd.misc import batched, elapsed_end
+from hwsd.model_helper import ModelChunk
+from hwsd.model_server import get_model_helper
+from hwsd.prefetch import Prefetcher
+from hwsd.provenance import audio_key, make_key, manifest_filename, manifest_status, write_manifest
+from hwsd.resample_cache import get_resample_cache
+from hwsd.spectra import compute_ltsa, ltsa_filename
 
 TARGET_SAMPLE_RATE = 10_000
+DEFAULT_MODEL_MINUTES = 10
+DEFAULT_WORKERS = 2
+DEFAULT_SUMMARY_FILENAME = "score_file-summary.json"
 
 
 def ensure_10khz(wav_path: Path, output_dir: Path | None = None) -> Path:
@@ -36,12 +71,17 @@ def ensure_10khz(wav_path: Path, output_dir: Path | None = None) -> Path:
     Returns a path to a 10 kHz version of `wav_path`, resampling via `sox`
     if needed. The resampled file is written as `<stem>_10kHz.wav` in
     `output_dir` (if given) or alongside the input, and reused if already
-    present.
+    present; or, with the resample cache enabled, taken from the cache
+    (resampled in-process if not there, see hwsd/resample_cache.py).
     """
     info = sf.info(str(wav_path))
     if info.samplerate == TARGET_SAMPLE_RATE:
         return wav_path
 
+    cache = get_resample_cache()
+    if cache is not None:
+        return Path(cache.resample(str(wav_path), TARGET_SAMPLE_RATE))
+
     if shutil.which("sox") is None:
         raise RuntimeError("`sox` not found on PATH; required to resample to 10 kHz.")
 
@@ -65,91 +105,425 @@ def ensure_10khz(wav_path: Path, output_dir: Path | None = None) -> Path:
     return out_path
 
 
-def score_file(
-    wav_path: str,
+def get_score_path(wav_path: Path, output_dir: Path | None = None) -> Path:
+    """
+    Path of the score file for the given input WAV file, which is
+    next to the 10 kHz file actually used for scoring (see ensure_10khz).
+    """
+    stem = wav_path.stem
+    if sf.info(str(wav_path)).samplerate != TARGET_SAMPLE_RATE:
+        stem += "_10kHz"
+    return (output_dir if output_dir is not None else wav_path.parent) / (stem + "_scores.npy")
+
+
+def stream_chunks(stream: AudioStream, chunk_seconds: int, context_seconds: int = 0) -> Iterator[ModelChunk]:
+    """
+    As split_into_chunks (see hwsd/model_helper.py) on the whole file, but
+    reading each chunk (and its context) from the stream as needed.
+    """
+    rate = stream.sample_rate
+    total_seconds = ceil(stream.frames / rate)
+    for offset in range(0, total_seconds, chunk_seconds):
+        seconds = min(chunk_seconds, total_seconds - offset)
+        left = min(context_seconds, offset)
+        psound = stream.read((offset - left) * rate, (left + seconds + context_seconds) * rate)
+        yield ModelChunk(offset, seconds, psound, left)
+
+
+class FileResult(NamedTuple):
+    """Outcome of scoring a file."""
+
+    path: str
+    status: str  # "ok", "current" (already scored, see hwsd/provenance.py), or "failed"
+    audio_seconds: float = 0.0
+    seconds: float = 0.0  # from starting to read the file to having saved its scores
+    error: str | None = None
+
+
+class FileJob:
+    """A file to score, collecting its chunks' scores and LTSA as these are computed."""
+
+    def __init__(self, original_path: Path, out_path: Path, key: dict):
+        self.original_path: Path = original_path
+        self.out_path: Path = out_path
+        self.key: dict = key
+        self.wav_path: Path | None = None  # the 10 kHz file actually read
+        self.frames: int = 0
+        self.total_chunks: int = 0
+        self.scores: list[np.ndarray] = []
+        self.ltsa: list[np.ndarray] = []
+        self.error: str | None = None
+        self.started: float = 0.0
+        self.done: bool = False
+
+    def add_chunk(self, model_chunk: ModelChunk, chunk_scores: np.ndarray) -> None:
+        # only whole seconds:
+        chunk_seconds_actual = min(model_chunk.seconds, self.frames // TARGET_SAMPLE_RATE - model_chunk.start_second)
+        self.scores.append(chunk_scores[: max(0, chunk_seconds_actual)])
+        first_sample = model_chunk.context_seconds * TARGET_SAMPLE_RATE
+        psound = model_chunk.psound[first_sample : first_sample + model_chunk.seconds * TARGET_SAMPLE_RATE]
+        self.ltsa.append(compute_ltsa(psound, TARGET_SAMPLE_RATE))
+
+    @property
+    def complete(self) -> bool:
+        return len(self.scores) == self.total_chunks
+
+
+def expand_inputs(inputs: list[str]) -> list[Path]:
+    """
+    The WAV files given directly, as directories (searched recursively), or as
+    glob patterns, in order and without duplicates. The `<stem>_10kHz.wav` files
+    generated by ensure_10khz next to their inputs are only included if given directly.
+    """
+    paths: dict[Path, None] = {}
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = sorted(path for path in Path(item).rglob("*") if path.suffix.lower() == ".wav")
+        elif any(char in item for char in "*?["):
+            matches = sorted(Path(match) for match in glob.glob(item, recursive=True))
+        else:
+            paths.setdefault(Path(item))
+            continue
+        for path in matches:
+            original = path.with_name(path.stem.removesuffix("_10kHz") + path.suffix)
+            if original == path or not original.exists():
+                paths.setdefault(path)
+    return list(paths)
+
+
+def _prepare_ahead(
+    executor: ThreadPoolExecutor, jobs: list[FileJob], output_dir: Path | None, lookahead: int
+) -> Iterator[tuple[FileJob, Future]]:
+    """The jobs along with their (pending) ensure_10khz calls, keeping up to `lookahead` files ahead."""
+    pending: deque[tuple[FileJob, Future]] = deque()
+    for job in jobs:
+        pending.append((job, executor.submit(ensure_10khz, job.original_path, output_dir)))
+        if len(pending) > lookahead:
+            yield pending.popleft()
+    yield from pending
+
+
+def _iter_job_chunks(
+    prepared: Iterable[tuple[FileJob, Future]],
+    chunk_seconds: int,
+    context_seconds: int,
+    slots: int,
+) -> Iterator[tuple[FileJob, ModelChunk | None]]:
+    """
+    The chunks of the given files, one file after the other, each one streamed
+    with a ring of `slots` buffers (see AudioStream). A file with no chunks
+    (empty, or failed to be read, with its `error` set) is given with None.
+    """
+    for job, wav_path in prepared:
+        job.started = time.time()
+        try:
+            job.wav_path = wav_path.result()
+            print(f"==> Streaming {job.wav_path}")
+            block_samples = (chunk_seconds + 2 * context_seconds) * TARGET_SAMPLE_RATE
+            # (as read, with no conversion to volts:)
+            with AudioStream(str(job.wav_path), block_samples, slots, scale=1) as stream:
+                assert stream.sample_rate == TARGET_SAMPLE_RATE, stream.sample_rate
+                print(f"    {stream.frames:,} samples ({stream.frames / stream.sample_rate:.1f} s)")
+                job.frames = stream.frames
+                job.total_chunks = ceil(ceil(stream.frames / stream.sample_rate) / chunk_seconds)
+                if job.total_chunks == 0:
+                    yield job, None
+                for model_chunk in stream_chunks(stream, chunk_seconds, context_seconds):
+                    yield job, model_chunk
+        except Exception:
+            job.error = traceback.format_exc()
+            yield job, None
+
+
+def _save_job(job: FileJob, fingerprint: str | None, remove_resampled: bool) -> None:
+    assert job.wav_path is not None
+    scores = np.concatenate(job.scores) if job.scores else np.array([], dtype=np.float32)
+    job.out_path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(job.out_path, scores)
+    write_manifest(manifest_filename(str(job.out_path)), {**job.key, "model": fingerprint})
+    print(f"==> {len(scores):,} scores saved to {job.out_path}")
+
+    out_ltsa = ltsa_filename(str(job.out_path))
+    np.save(out_ltsa, np.concatenate(job.ltsa) if job.ltsa else compute_ltsa(np.zeros(0), TARGET_SAMPLE_RATE))
+    print(f"==> LTSA saved to {out_ltsa}")
+
+    cache = get_resample_cache()
+    in_cache = cache is not None and cache.owns(job.wav_path)
+    if job.wav_path != job.original_path and remove_resampled and not in_cache:
+        print(f"==> Removing resampled file {job.wav_path}")
+        job.wav_path.unlink()
+
+
+def score_files(
+    inputs: list[str],
     output_dir: str | None = None,
     remove_resampled: bool = False,
-    model_minutes: int = 10,
-) -> None:
-    original_path = Path(wav_path)
-    out_dir = Path(output_dir) if output_dir is not None else None
-    wav_path = ensure_10khz(original_path, out_dir)
-    resampled = wav_path != original_path
+    model_minutes: int | None = None,
+    batch_size: int | None = None,
+    overlap: bool = False,
+    force: bool = False,
+    xla: bool = False,
+    workers: int = DEFAULT_WORKERS,
+    summary: str | None = None,
+) -> list[FileResult]:
+    """
+    Scores the given files (see expand_inputs), loading the model only once.
 
-    print(f"==> Loading {wav_path}")
-    audio, sample_rate = sf.read(wav_path, dtype="float32")
-    assert sample_rate == TARGET_SAMPLE_RATE, sample_rate
-    if audio.ndim > 1:
-        audio = audio[:, 0]
+    The files already up to date are skipped. The others are streamed one
+    after the other, with the next chunks read in a background thread while
+    the model is applied on the current ones (so a batch can take chunks from
+    consecutive files), and with up to `workers` upcoming files resampled
+    concurrently, if needed. A file that fails is reported, and the others
+    still scored.
 
-    print(f"    {len(audio):,} samples ({len(audio) / sample_rate:.1f} s)")
+    Unless given, the batch size, and, with `overlap` (so it doesn't affect
+    the scores), the chunk minutes are taken from the tuning profile, if any
+    (see hwsd/autotune.py), as its thread counts.
 
-    model_helper = ModelHelper()
-    model_load_started = time.time()
-    model_helper.load_model()
-    print(f"    >> model loaded in {elapsed_end(model_load_started)}")
+    A summary of the run is written to `summary`, if given.
+    """
+    started = time.time()
+    settings = load_profile()
+    if batch_size is None:
+        batch_size = settings.batch_size if settings is not None else 1
+    if model_minutes is None:
+        model_minutes = settings.model_minutes if settings is not None and overlap else DEFAULT_MODEL_MINUTES
+
+    out_dir = Path(output_dir) if output_dir is not None else None
+    model_helper = get_model_helper()
+    fingerprint = model_helper.fingerprint()
+    # With overlap, the scores don't depend on the (possibly tuned) chunk minutes,
+    # so the key keeps DEFAULT_MODEL_MINUTES, as in hwsd/apply_model.py:
+    key_minutes = DEFAULT_MODEL_MINUTES if overlap else model_minutes
+    cache = get_resample_cache()
+    resampling = "sox" if cache is None else cache.resampling
+
+    results: list[FileResult] = []
+    jobs: list[FileJob] = []
+    out_paths: set[Path] = set()
+    for original_path in expand_inputs(inputs):
+        try:
+            out_path = get_score_path(original_path, out_dir)
+            if out_path in out_paths:
+                raise ValueError(f"same score file as a previous input: {out_path}")
+            out_paths.add(out_path)
+            key = make_key(
+                [audio_key(str(original_path))],
+                fingerprint,
+                {"model_minutes": key_minutes, "overlap": overlap},
+                "none" if sf.info(str(original_path)).samplerate == TARGET_SAMPLE_RATE else resampling,
+            )
+            out_manifest = manifest_filename(str(out_path))
+            if not force and manifest_status(out_manifest, key, str(out_path)) == "current":
+                print(f"==> {out_path} is up to date (see {out_manifest}); use --force to recompute")
+                results.append(FileResult(str(original_path), "current"))
+                continue
+        except Exception:
+            results.append(FileResult(str(original_path), "failed", error=traceback.format_exc()))
+            continue
+        jobs.append(FileJob(original_path, out_path, key))
+
+    model_load_seconds = 0.0
+    if jobs:
+        model_load_started = time.time()
+        if settings is not None:
+            model_helper.load_model(settings.intra_op_threads, settings.inter_op_threads, xla)
+        else:
+            model_helper.load_model(xla=xla)
+        model_load_seconds = time.time() - model_load_started
+        print(f"    >> model loaded in {elapsed_end(model_load_started)}")
+        # Fingerprint again, as the model may have just been downloaded by load_model:
+        fingerprint = model_helper.fingerprint()
 
     chunk_seconds = 60 * model_minutes
-    chunk_samples = sample_rate * chunk_seconds
-    print(f"==> Applying model in {model_minutes}-min chunks ...")
-    apply_started = time.time()
-    chunks: list[np.ndarray] = []
-    for start in range(0, len(audio), chunk_samples):
-        chunk = audio[start : start + chunk_samples]
-        chunk_seconds_actual = len(chunk) // sample_rate
-        chunk_label = f"{start // sample_rate}s..{start // sample_rate + chunk_seconds_actual}s"
-        print(f"    chunk {chunk_label} ({len(chunk):,} samples)")
-        chunk_started = time.time()
-        chunk_scores = model_helper.apply_model(chunk)
-        print(f"      >> {len(chunk_scores):,} scores in {elapsed_end(chunk_started)}")
-        if len(chunk_scores) > chunk_seconds_actual:
-            chunk_scores = chunk_scores[:chunk_seconds_actual]
-        chunks.append(chunk_scores)
-    scores = np.concatenate(chunks) if chunks else np.array([], dtype=np.float32)
-    print(f"    >> model applied in {elapsed_end(apply_started)}")
-    print(f"    scores: {len(scores):,}")
-
-    score_name = wav_path.stem + "_scores.npy"
-    if out_dir is not None:
-        out_dir.mkdir(parents=True, exist_ok=True)
-        out_path = out_dir / score_name
-    else:
-        out_path = wav_path.with_name(score_name)
-    np.save(out_path, scores)
-    print(f"==> Scores saved to {out_path}")
+    context_seconds = model_helper.context_seconds if overlap else 0
+    # the last chunk is padded to the shape of the others, or to a shorter bucket (see hwsd/model_helper.py):
+    model_helper.add_bucket(chunk_seconds + 2 * context_seconds)
+
+    def finish(job: FileJob) -> None:
+        job.done = True
+        if job.error is None:
+            try:
+                _save_job(job, fingerprint, remove_resampled)
+            except Exception:
+                job.error = traceback.format_exc()
+        audio_seconds = job.frames / TARGET_SAMPLE_RATE
+        status = "ok" if job.error is None else "failed"
+        results.append(FileResult(str(job.original_path), status, audio_seconds, time.time() - job.started, job.error))
 
-    if resampled and remove_resampled:
-        print(f"==> Removing resampled file {wav_path}")
-        wav_path.unlink()
+    print(f"==> Applying model in {model_minutes}-min chunks (batch size {batch_size}, context {context_seconds}s) ...")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        prepared = _prepare_ahead(executor, jobs, out_dir, workers)
+        # chunks held at once, per file: the batch plus those prefetched
+        slots = 2 * batch_size + 1
+        job_chunks = Prefetcher(_iter_job_chunks(prepared, chunk_seconds, context_seconds, slots), depth=batch_size)
+        for batch in batched(job_chunks, batch_size):
+            for job, model_chunk in batch:
+                if model_chunk is None and not job.done:
+                    finish(job)
+            batch = [(job, model_chunk) for job, model_chunk in batch if model_chunk is not None and not job.done]
+            if not batch:
+                continue
+            for job, model_chunk in batch:
+                chunk_label = f"{model_chunk.start_second}s..{model_chunk.start_second + model_chunk.seconds}s"
+                print(f"    {job.original_path.name}: chunk {chunk_label} ({len(model_chunk.psound):,} samples)")
+            chunk_started = time.time()
+            try:
+                batch_scores = model_helper.apply_model_chunks([model_chunk for _, model_chunk in batch])
+            except Exception:
+                error = traceback.format_exc()
+                for job, _ in batch:
+                    if not job.done:
+                        job.error = error
+                        finish(job)
+                continue
+            print(f"      >> {sum(len(s) for s in batch_scores):,} scores in {elapsed_end(chunk_started)}")
+            for (job, model_chunk), chunk_scores in zip(batch, batch_scores, strict=True):
+                job.add_chunk(model_chunk, chunk_scores)
+                if job.complete:
+                    finish(job)
+
+    report_results(results, model_load_seconds, time.time() - started)
+    if summary is not None:
+        run_settings = {"model_minutes": model_minutes, "batch_size": batch_size, "overlap": overlap, "xla": xla}
+        write_summary(summary, results, run_settings, model_load_seconds, time.time() - started)
+    return results
+
+
+def report_results(results: list[FileResult], model_load_seconds: float, wall_seconds: float) -> None:
+    """Prints a per-file summary of the run."""
+    print("\n==> Per-file results:")
+    for result in results:
+        print(f"    {result.status:<7}  {result.audio_seconds:9.1f}s audio  {result.seconds:7.1f}s  {result.path}")
+    for result in results:
+        if result.error is not None:
+            print(f"\n--- {result.path} failed:\n{result.error}")
+    counts = {status: sum(1 for r in results if r.status == status) for status in ("ok", "current", "failed")}
+    print("    " + ", ".join(f"{status}: {count}" for status, count in counts.items()))
+    audio_seconds = sum(result.audio_seconds for result in results)
+    print(f"    {audio_seconds:,.0f}s of audio scored in {wall_seconds:.1f}s (model load {model_load_seconds:.1f}s)")
+
+
+def write_summary(
+    filename: str,
+    results: list[FileResult],
+    run_settings: dict,
+    model_load_seconds: float,
+    wall_seconds: float,
+) -> None:
+    """Writes the summary of the run (atomically), as JSON."""
+    audio_seconds = sum(result.audio_seconds for result in results)
+    summary = {
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "settings": run_settings,
+        "counts": {status: sum(1 for r in results if r.status == status) for status in ("ok", "current", "failed")},
+        "audio_seconds": round(audio_seconds, 3),
+        "wall_seconds": round(wall_seconds, 3),
+        "model_load_seconds": round(model_load_seconds, 3),
+        "audio_seconds_per_second": round(audio_seconds / wall_seconds, 3) if wall_seconds > 0 else None,
+        "files": [result._asdict() for result in results],
+    }
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, "w") as f:
+        json.dump(summary, f, indent=2)
+        f.write("\n")
+    os.replace(tmp_filename, filename)
+    print(f"==> Run summary written to {filename}")
 
 
 def parse_arguments():
-    description = "Applies Google Humpback Whale Model on a WAV file (resampling to 10 kHz via sox if needed)."
-    parser = ArgumentParser(description=description, formatter_class=RawTextHelpFormatter)
-    parser.add_argument("wav_file", type=str, help="Path to the input WAV file.")
+    description = "Applies Google Humpback Whale Model on WAV files (resampling to 10 kHz via sox if needed)."
+    parser = ArgumentParser(description=description, formatter_class=RawTextHelpFormatter, fromfile_prefix_chars="@")
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        metavar="input",
+        help="WAV file, directory (searched recursively for WAV files), or glob pattern (quoted).\n"
+        "Use @list.txt to take the inputs from a file, one per line.",
+    )
     parser.add_argument(
         "--output-dir",
         type=str,
         default=None,
         metavar="dir",
-        help="Directory in which to save the score file. Defaults to alongside the WAV.",
+        help="Directory in which to save the score files. Defaults to alongside each WAV.",
     )
     parser.add_argument(
         "--remove-resampled",
         action="store_true",
         default=False,
-        help="If the input was resampled to 10 kHz, delete the resampled WAV after scoring.",
+        help="If an input was resampled to 10 kHz, delete the resampled WAV after scoring\n"
+        "(unless in the resample cache, see hwsd/resample_cache.py).",
     )
     parser.add_argument(
         "--model-minutes",
         type=int,
-        default=10,
+        default=None,
         metavar="m",
-        help="Length in minutes of audio to give the model at a time. Lower this on small GPUs to avoid OOM. Default: 10.",
+        help="Length in minutes of audio to give the model at a time. Lower this on small GPUs to avoid OOM.\n"
+        f"Default: {DEFAULT_MODEL_MINUTES}, or, with --overlap, that of the tuning profile (see hwsd/autotune.py).",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=None,
+        metavar="n",
+        help="Number of chunks to score together in a single model call.\n"
+        "Default: 1, or that of the tuning profile (see hwsd/autotune.py).",
+    )
+    parser.add_argument(
+        "--overlap",
+        action="store_true",
+        default=False,
+        help="Give each chunk to the model along with the model's context on each side (overlap-save),\n"
+        "so the scores do not depend on --model-minutes.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        default=False,
+        help="Recompute the scores even if the manifest indicates they are up to date.",
+    )
+    parser.add_argument(
+        "--xla",
+        action="store_true",
+        default=False,
+        help="Compile the model with XLA (once per input shape, see hwsd/model_helper.py).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        metavar="n",
+        help=f"Number of upcoming files to resample concurrently (if needed). Default: {DEFAULT_WORKERS}.",
+    )
+    parser.add_argument(
+        "--summary",
+        type=str,
+        default=None,
+        metavar="file",
+        help="JSON file in which to write a summary of the run.\n"
+        f"Default: {DEFAULT_SUMMARY_FILENAME} in the output directory (or the current one),\n"
+        "unless the input is a single file.",
     )
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     opts = parse_arguments()
-    score_file(opts.wav_file, opts.output_dir, opts.remove_resampled, opts.model_minutes)
+    summary_filename = opts.summary
+    if summary_filename is None and (len(opts.inputs) > 1 or not os.path.isfile(opts.inputs[0])):
+        summary_filename = os.path.join(opts.output_dir or ".", DEFAULT_SUMMARY_FILENAME)
+    score_files(
+        opts.inputs,
+        opts.output_dir,
+        opts.remove_resampled,
+        opts.model_minutes,
+        opts.batch_size,
+        opts.overlap,
+        opts.force,
+        opts.xla,
+        opts.workers,
+        summary_filename,
+    )
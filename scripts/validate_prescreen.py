@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Validates the pre-screen settings (see hwsd/prescreen.py) on historical days,
+that is, days already scored without the pre-screen.
+
+For each day, the pre-screen is computed over the day's audio (no model
+needed), and the existing (ungated) scores of the seconds it would skip are
+checked: any of them at or above the given thresholds is a detection that
+the gated scoring would have missed. The skipped fraction is the inference
+that would be saved. Note that this is for the whole day at once; scoring
+chunk by chunk, the runs of skipped seconds are split at the chunk
+boundaries, so slightly less can be skipped.
+
+With `--rescore`, the days are also actually scored with the pre-screen
+(into a temporary directory), and the gated scores compared with the
+ungated ones on the retained seconds (they should be the same with
+overlap-save processing).
+
+Example:
+  uv run scripts/validate_prescreen.py "2018/1-12/1"
+  uv run scripts/validate_prescreen.py --thresholds 0.5 0.9 --rescore "2019/11/1-3"
+"""
+
+import os
+import tempfile
+import time
+from argparse import ArgumentParser, RawTextHelpFormatter
+from math import ceil
+
+import numpy as np
+
+from hwsd.file_helper import DAY_SECONDS, DEFAULT_AUDIO_BASE_DIR, DEFAULT_SCORE_BASE_DIR, FileHelper
+from hwsd.misc import elapsed_end, parse_days
+from hwsd.model_helper import DEFAULT_CONTEXT_WIDTH_SAMPLES, SAMPLE_RATE
+from hwsd.prescreen import active_seconds, retained_seconds
+
+DEFAULT_THRESHOLDS = [0.5, 0.7, 0.9]
+
+
+def day_retained_seconds(file_helper: FileHelper, context_seconds: int) -> np.ndarray:
+    """The pre-screen over the selected day, read in blocks (missing audio as not retained)."""
+    active = np.zeros(DAY_SECONDS, dtype=bool)
+    offset = 0
+    for block in file_helper.iter_audio_segment(0, DAY_SECONDS):
+        block_active = active_seconds(block, file_helper.sample_rate)
+        active[offset : offset + len(block_active)] = block_active
+        offset += len(block_active)
+    retained = retained_seconds(active, context_seconds)
+    retained[offset:] = False
+    return retained
+
+
+def rescore_day(file_helper: FileHelper, model_helper, year: int, month: int, day: int) -> np.ndarray:
+    """The day's scores with the pre-screen, computed into a temporary directory."""
+    from hwsd.apply_model_day import apply_model_day
+
+    with tempfile.TemporaryDirectory() as score_base_dir:
+        gated_helper = FileHelper(file_helper.audio_base_dir, score_base_dir)
+        apply_model_day(gated_helper, model_helper, year, month, day, overlap=True, checkpoint=True, prescreen=True)
+        return np.load(gated_helper.score_filename)
+
+
+def validate_prescreen(
+    intervals: list[str],
+    thresholds: list[float],
+    audio_base_dir: str,
+    score_base_dir: str,
+    use_archive: bool,
+    rescore: bool,
+) -> None:
+    started = time.time()
+    model_helper = None
+    context_seconds = ceil(DEFAULT_CONTEXT_WIDTH_SAMPLES / SAMPLE_RATE)
+    if rescore:
+        from hwsd.model_server import get_model_helper
+
+        model_helper = get_model_helper()
+        model_helper.load_model()
+        context_seconds = model_helper.context_seconds
+
+    header = f"    {'day':<10} {'scored':>7} {'skipped':>8}  " + "  ".join(f"miss>={t:<4}" for t in thresholds)
+    header += "  max skipped" + ("  max |diff|" if rescore else "")
+    rows = []
+    totals = {"scored": 0, "skipped": 0, "missed": np.zeros(len(thresholds), dtype=np.int64)}
+    for year, month, day in parse_days(*intervals):
+        file_helper = FileHelper(audio_base_dir, score_base_dir, use_archive)
+        if not file_helper.select_day(year, month, day):
+            continue
+        if not file_helper.use_archive and not os.path.isfile(file_helper.score_filename):
+            print(f"    {year:04}-{month:02}-{day:02}: no scores, skipped")
+            continue
+        scores = file_helper.load_day_scores()
+        scored = ~np.isnan(scores)
+        if not scored.any():
+            print(f"    {year:04}-{month:02}-{day:02}: no scores, skipped")
+            continue
+
+        skipped = scored & ~day_retained_seconds(file_helper, context_seconds)
+        skipped_scores = scores[skipped]
+        missed = np.array([(skipped_scores >= t).sum() for t in thresholds])
+        row = f"    {year:04}-{month:02}-{day:02} {scored.sum():7,} {skipped.sum() / scored.sum():8.1%}  "
+        row += "  ".join(f"{m:9,}" for m in missed)
+        row += f"  {skipped_scores.max():11.3f}" if len(skipped_scores) else f"  {'-':>11}"
+        if model_helper is not None:
+            gated_scores = rescore_day(file_helper, model_helper, year, month, day)
+            both = scored & ~np.isnan(gated_scores)
+            row += f"  {np.abs(gated_scores[both] - scores[both]).max(initial=0):11.2e}"
+        rows.append(row)
+        totals["scored"] += int(scored.sum())
+        totals["skipped"] += int(skipped.sum())
+        totals["missed"] += missed
+
+    print("\n==> Pre-screen validation (skipped: of the scored seconds; miss: skipped seconds with such scores)")
+    print(header)
+    for row in rows:
+        print(row)
+    if totals["scored"]:
+        print(
+            f"\n==> {len(rows)} days: {totals['skipped'] / totals['scored']:.1%} of the inference skipped, missing "
+            + ", ".join(f"{m:,} seconds >= {t}" for t, m in zip(thresholds, totals["missed"], strict=True))
+        )
+    print(f"\n>> complete validate_prescreen in {elapsed_end(started)}\n")
+
+
+def parse_arguments():
+    description = "Validates the pre-screen settings (hwsd/prescreen.py) against the scores of historical days."
+    parser = ArgumentParser(description=description, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "intervals",
+        nargs="+",
+        metavar="time-interval",
+        help="Of the form yearRange/monthRange/dayRange or yearRange/monthRange.",
+    )
+    parser.add_argument(
+        "--thresholds",
+        type=float,
+        nargs="+",
+        default=DEFAULT_THRESHOLDS,
+        metavar="t",
+        help=f"Score thresholds for the missed detections. Default: {' '.join(map(str, DEFAULT_THRESHOLDS))}.",
+    )
+    parser.add_argument(
+        "--rescore",
+        action="store_true",
+        default=False,
+        help="Also score the days with the pre-screen, comparing with the existing scores.",
+    )
+    parser.add_argument(
+        "--audio-base-dir",
+        type=str,
+        default=DEFAULT_AUDIO_BASE_DIR,
+        metavar="dir",
+        help=f"Audio base directory. Default: {DEFAULT_AUDIO_BASE_DIR}.",
+    )
+    parser.add_argument(
+        "--score-base-dir",
+        type=str,
+        default=DEFAULT_SCORE_BASE_DIR,
+        metavar="dir",
+        help=f"Base directory of the (ungated) scores. Default: {DEFAULT_SCORE_BASE_DIR}.",
+    )
+    parser.add_argument(
+        "--use-archive",
+        action="store_true",
+        default=False,
+        help="Read the scores from the per-year score archives instead of the per-day files.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opts = parse_arguments()
+    validate_prescreen(
+        opts.intervals,
+        opts.thresholds,
+        opts.audio_base_dir,
+        opts.score_base_dir,
+        opts.use_archive,
+        opts.rescore,
+    )